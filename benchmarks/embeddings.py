@@ -0,0 +1,70 @@
+"""
+Embedding backend benchmark: reports embeddings/sec for each preset in
+EMBEDDING_PRESETS on synthetic schema descriptions (and the query cache hit path).
+
+Usage: python benchmarks/embeddings.py [--n 2000] [--batch-size 32] [--threads 4] [--backends minilm,minilm-onnx]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Ensure project root is in python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.semantic_catalog.embeddings import EMBEDDING_PRESETS, QueryEmbeddingCache, get_embedding_backend
+
+def synthetic_texts(n):
+    types = ["INTEGER", "TEXT", "REAL", "DATE"]
+    return [
+        f"Table: table_{i // 20}, Column: column_{i % 20}. Type: {types[i % 4]} (Inferred: text). "
+        f"Cardinality: high. Sample values: value_{i}, value_{i + 1}."
+        for i in range(n)
+    ]
+
+def bench_backend(name, texts, batch_size, threads):
+    overrides = {"batch_size": batch_size}
+    if threads:
+        overrides["num_threads"] = threads
+    try:
+        backend = get_embedding_backend(name, **overrides)
+    except Exception as e: # Optional runtimes (onnx/openvino) may not be installed
+        return {"backend": name, "error": str(e)}
+
+    backend(texts[:batch_size]) # Warm-up (model load, graph compilation)
+    start = time.perf_counter()
+    backend(texts)
+    elapsed = time.perf_counter() - start
+
+    cache = QueryEmbeddingCache(backend)
+    queries = texts[:256]
+    cache(queries)
+    start = time.perf_counter()
+    cache(queries)
+    cached_elapsed = time.perf_counter() - start
+
+    return {
+        "backend": name,
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "threads": threads,
+        "seconds": round(elapsed, 4),
+        "embeddings_per_sec": round(len(texts) / elapsed, 1),
+        "cached_queries_per_sec": round(len(queries) / cached_elapsed, 1) if cached_elapsed else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--backends", default=",".join(EMBEDDING_PRESETS))
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.n)
+    for name in args.backends.split(","):
+        print(json.dumps(bench_backend(name.strip(), texts, args.batch_size, args.threads)))
+
+if __name__ == "__main__":
+    main()
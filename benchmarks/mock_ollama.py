@@ -0,0 +1,103 @@
+"""
+Mock Ollama server for load tests and benchmarks: implements POST /api/generate
+(streaming NDJSON and non-streaming) with configurable latency and decode speed,
+answering every prompt with a fenced SQL statement followed by some prose. The
+statement depends on the prompt (a CRC of it picks the filter), so different
+questions don't all share one cached result.
+
+Usage: python benchmarks/mock_ollama.py [--port 11435] [--latency 0.2] [--tokens-per-sec 50]
+Then point the app at it: OLLAMA_BASE_URL=http://127.0.0.1:11435
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE = "```sql\nSELECT id, name FROM users WHERE id >= {min_id} LIMIT 10;\n```\nThis query lists ten users with their names."
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real server
+    latency = 0.2 # Seconds before the first token (prompt evaluation)
+    tokens_per_sec = 50.0
+    requests = 0
+    prompts = [] # Prompts in arrival order
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with MockOllamaHandler.lock:
+            MockOllamaHandler.requests += 1
+            MockOllamaHandler.prompts.append(body.get("prompt", ""))
+        model = body.get("model", "mock")
+        limit = (body.get("options") or {}).get("num_predict") or 256
+        response = RESPONSE.format(min_id=zlib.crc32(body.get("prompt", "").encode()) % 90)
+        tokens = re.findall(r"\S+\s*|\s+", response)[:limit]
+        time.sleep(self.latency)
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(1.0 / self.tokens_per_sec)
+                    self._chunk({"model": model, "response": token, "done": False})
+                self._chunk({"model": model, "response": "", "done": True, "done_reason": "stop", "eval_count": len(tokens)})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass # Client stopped early
+            return
+
+        time.sleep(len(tokens) / self.tokens_per_sec)
+        payload = json.dumps({
+            "model": model, "response": "".join(tokens), "done": True,
+            "done_reason": "stop", "eval_count": len(tokens)
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _chunk(self, message):
+        data = json.dumps(message).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+def start_mock_server(port=0, latency=0.2, tokens_per_sec=50.0):
+    """Starts the server on a daemon thread; returns (server, base_url)."""
+    MockOllamaHandler.latency = latency
+    MockOllamaHandler.tokens_per_sec = tokens_per_sec
+    MockOllamaHandler.requests = 0
+    MockOllamaHandler.prompts = []
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    args = parser.parse_args()
+    server, base_url = start_mock_server(args.port, args.latency, args.tokens_per_sec)
+    print(f"Mock Ollama listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
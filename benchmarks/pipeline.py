@@ -0,0 +1,213 @@
+"""
+End-to-end pipeline benchmark on synthetic SQLite schemas: times SchemaDiscovery.run,
+SemanticStore.search and SQLAgent.handle_query as the catalog grows, and reports
+per-stage throughput and p50/p95/p99 latency as JSON (one report per run, so
+reports from two releases can be diffed).
+
+The LLM is either LLMEngine's mock mode (--llm mock, no network, one fixed SQL)
+or the mock Ollama server from benchmarks/mock_ollama.py (--llm stub, with
+--latency/--tokens-per-sec; its SQL varies per question). Every synthetic database
+also has the `mock_table` and `users` tables those answer with, so the query path
+runs through the sandbox and execution too.
+
+The answer and result caches are off by default, so the query stage times
+generation and execution on every call; --caches on measures them warm. Their
+hit rates are part of the report either way.
+
+Usage: python benchmarks/pipeline.py [--tables 10,100,500] [--columns 12] [--fk-density 0.3]
+       [--rows 1000] [--queries 100] [--concurrency 4] [--llm mock|stub] [--caches off|on]
+       [--output report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Ensure project root is in python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+COLUMN_TYPES = ["INTEGER", "REAL", "TEXT", "DATE"]
+WORDS = ["revenue", "customer", "order", "status", "region", "product", "amount", "created", "price", "category"]
+
+def generate_database(path, tables, columns, fk_density, rows, seed=0):
+    """
+    Synthetic schema: `tables` tables of `columns` columns (id + typed columns);
+    each later table references an earlier one with probability `fk_density`
+    per FK slot (up to 3). Returns the number of columns created.
+    """
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE mock_table (id INTEGER PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO mock_table VALUES (?, ?)", [(i, f"value_{i}") for i in range(100)])
+    conn.executemany("INSERT INTO users VALUES (?, ?)", [(i, f"user_{i}") for i in range(100)])
+    total_columns = 4
+    for t in range(tables):
+        definitions = ["id INTEGER PRIMARY KEY"]
+        generators = [lambda n: np.arange(n)]
+        for slot in range(3):
+            if t and rng.random() < fk_density:
+                target = int(rng.integers(0, t))
+                definitions.append(f"t{target}_id_{slot} INTEGER REFERENCES t{target}(id)")
+                generators.append(lambda n: rng.integers(0, rows, n))
+        for c in range(columns - len(definitions)):
+            column_type = COLUMN_TYPES[c % len(COLUMN_TYPES)]
+            definitions.append(f"{WORDS[c % len(WORDS)]}_{c} {column_type}")
+            if column_type == "INTEGER":
+                generators.append(lambda n: rng.integers(0, 1000, n))
+            elif column_type == "REAL":
+                generators.append(lambda n: np.round(rng.random(n) * 1000, 2))
+            elif column_type == "TEXT":
+                generators.append(lambda n: np.array(WORDS)[rng.integers(0, len(WORDS), n)])
+            else:
+                generators.append(lambda n: (np.datetime64("2023-01-01") + rng.integers(0, 365, n)).astype(str))
+        conn.execute(f"CREATE TABLE t{t} ({', '.join(definitions)})")
+        values = [generate(rows).tolist() for generate in generators]
+        placeholders = ", ".join("?" * len(definitions))
+        conn.executemany(f"INSERT INTO t{t} VALUES ({placeholders})", zip(*values))
+        total_columns += len(definitions)
+    conn.commit()
+    conn.close()
+    return total_columns
+
+QUESTION_TEMPLATES = [
+    "What is the total {a} by {b} in table t{t}?",
+    "Show the average {a} per {b} for t{t}",
+    "How many rows of t{t} have {a} above {n}?",
+    "List the top {n} {b} values ranked by {a} in t{t}",
+    "Which {b} has the highest {a} in table t{t} since {n}?",
+]
+
+def synthetic_questions(n, tables, seed=1):
+    """Distinct questions (templates x words x tables x numbers), not just numbered copies."""
+    rng = np.random.default_rng(seed)
+    questions = []
+    for i in range(n):
+        template = QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)]
+        questions.append(template.format(
+            a=WORDS[int(rng.integers(0, len(WORDS)))], b=WORDS[int(rng.integers(0, len(WORDS)))],
+            t=int(rng.integers(0, tables)), n=int(rng.integers(2, 2000)),
+        ))
+    return questions
+
+def latency_summary(latencies, elapsed):
+    """Throughput plus p50/p95/p99 in milliseconds."""
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {
+        "calls": len(latencies),
+        "throughput_per_sec": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
+
+def timed_calls(fn, inputs, concurrency):
+    """Runs fn over inputs with `concurrency` threads; returns (per-call latencies, wall time, results)."""
+    def call(value):
+        start = time.perf_counter()
+        result = fn(value)
+        return time.perf_counter() - start, result
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, inputs))
+    return [latency for latency, _ in outcomes], time.perf_counter() - start, [result for _, result in outcomes]
+
+def bench_scale(tables, args):
+    # Each scale gets a fresh working directory for its database, catalog and feedback log
+    workdir = tempfile.mkdtemp(prefix=f"evosql_bench_{tables}_")
+    db_path = os.path.join(workdir, "bench.db")
+    start = time.perf_counter()
+    total_columns = generate_database(db_path, tables, args.columns, args.fk_density, args.rows)
+    report = {"tables": tables, "columns": total_columns, "rows_per_table": args.rows, "generate_seconds": round(time.perf_counter() - start, 3)}
+    db_url = f"sqlite:///{db_path}"
+
+    from src.components.executor import SQLAgent
+    from src.components.explorer import SchemaDiscovery
+    from src.llm.answer_cache import AnswerCache
+    from src.semantic_catalog.store import SemanticStore
+    from src.utils.feedback_log import get_feedback_log
+    from src.utils.result_cache import ResultCache
+
+    # 1. Discovery (cold), then an incremental re-run with nothing changed
+    store = SemanticStore(persist_path=os.path.join(workdir, "chroma_db"))
+    discovery = SchemaDiscovery(store=store)
+    start = time.perf_counter()
+    discovery.run(db_url, force=True)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    discovery.run(db_url)
+    report["discovery"] = {
+        "seconds": round(cold, 3),
+        "tables_per_sec": round(tables / cold, 2),
+        "columns_per_sec": round(total_columns / cold, 2),
+        "noop_rerun_seconds": round(time.perf_counter() - start, 3),
+    }
+
+    # 2. Retrieval
+    questions = synthetic_questions(args.queries, tables)
+    store.search(questions[0]) # Warm-up (model load)
+    latencies, elapsed, _ = timed_calls(lambda q: store.search(q, top_k=5), questions, args.concurrency)
+    report["retrieval"] = latency_summary(latencies, elapsed)
+
+    # 3. Full query path (retrieval -> generation -> sandbox -> execution -> explanation)
+    caches = {}
+    if args.caches == "off":
+        # No answer cache entries; no data version means no result is cached
+        caches = {"answer_cache": AnswerCache(max_entries=0), "result_cache": ResultCache(version_fn=lambda url: None)}
+    agent = SQLAgent(db_url=db_url, store=store, feedback_log=get_feedback_log(os.path.join(workdir, "feedback_log")), **caches)
+    if args.llm == "mock":
+        agent.llm.is_mock = True
+    latencies, elapsed, results = timed_calls(agent.handle_query, questions, args.concurrency)
+    report["query"] = latency_summary(latencies, elapsed)
+    report["query"]["caches"] = args.caches
+    report["query"]["errors"] = sum(1 for result in results if not isinstance(result, dict))
+    report["query"]["answer_cache"] = agent.answer_cache.stats()
+    report["query"]["result_cache"] = agent.result_cache.stats()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", default="10,100,500", help="Comma-separated catalog sizes")
+    parser.add_argument("--columns", type=int, default=12)
+    parser.add_argument("--fk-density", type=float, default=0.3)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm", choices=["mock", "stub"], default="mock")
+    parser.add_argument("--caches", choices=["off", "on"], default="off", help="Answer and result caches during the query stage")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub server: seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Stub server: decode speed")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    if args.llm == "stub":
+        from benchmarks.mock_ollama import start_mock_server
+        server, base_url = start_mock_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec)
+        os.environ["OLLAMA_BASE_URL"] = base_url
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": time.time(),
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "embedding_backend": os.getenv("EMBEDDING_BACKEND", "minilm"),
+        },
+        "scales": [bench_scale(int(tables), args) for tables in args.tables.split(",")],
+    }
+    text_report = json.dumps(report, indent=2)
+    print(text_report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text_report)
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,257 @@
+import itertools
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import sqlglot
+from sqlglot import exp
+from src.llm.answer_cache import normalize_question
+from src.llm.client import PRIORITY_AUDIT
 from src.llm.engine import LLMEngine
-import agentlightning as agl
+from src.llm.prompt_builder import PromptBuilder
+from src.utils.metrics import inc, span
+from src.utils.safety import canonical_fingerprint
+
+# "JOIN HINT: Table 'a' joins with 'b' on a.col = b.col ..." (see SchemaDiscovery._extract_graph_hints)
+JOIN_HINT_RE = re.compile(r"Table '([^']+)' joins with '([^']+)' on ([^\s=]+)\.([^\s.=]+) = ([^\s=]+)\.([^\s.=]+)")
+
+# Columns every SQLite table has without declaring them
+PSEUDO_COLUMNS = {"rowid", "oid", "_rowid_"}
+
+class StaticAuditor:
+    """
+    Deterministic pre-judge checks grounded in the SemanticStore catalog:
+    - every referenced table and column exists
+    - join conditions follow the foreign keys recorded as graph hints
+    - aggregate sanity (no bare columns next to COUNT/SUM/AVG without GROUP BY)
+      and result shape (column count, one row for an ungrouped aggregate)
+    The checks only fail fast: check() returns (0, reason) for a query that
+    can't be right, or None to leave it to the LLM judge. Valid schema says
+    nothing about whether the SQL answers the question, so only the judge passes.
+    """
+    def __init__(self, store=None, dialect=None):
+        self.store = store
+        self.dialect = dialect
+        self._fk_edges = None
+        self._fk_version = None
+
+    def _catalog(self):
+        columns = self.store.table_columns
+        return {table.lower(): {column.lower() for column in table_columns} for table, table_columns in columns.items()}
+
+    def _foreign_keys(self):
+        """({frozenset of (table, column) pairs}, {frozenset of table pairs}) from the graph hints, per catalog version."""
+        version = self.store.catalog_version
+        if self._fk_edges is None or self._fk_version != version:
+            edges, linked = set(), set()
+            for hints in self.store.graph_hints.values():
+                for hint in hints:
+                    match = JOIN_HINT_RE.search(hint)
+                    if match:
+                        _, _, left_table, left_column, right_table, right_column = (part.lower() for part in match.groups())
+                        edges.add(frozenset([(left_table, left_column), (right_table, right_column)]))
+                        linked.add(frozenset([left_table, right_table]))
+            self._fk_edges, self._fk_version = (edges, linked), version
+        return self._fk_edges
+
+    def check(self, query, sql, results=None):
+        if self.store is None:
+            return None
+        catalog = self._catalog()
+        if not catalog:
+            return None # Nothing discovered yet: nothing to ground on
+        try:
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+        except sqlglot.errors.SqlglotError:
+            return None # The database accepted it; our parser didn't
+        if not isinstance(tree, exp.Query):
+            return None
+
+        # Sources: real tables by alias, and derived ones (CTEs, subqueries) we can't resolve
+        derived = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        derived |= {subquery.alias_or_name.lower() for subquery in tree.find_all(exp.Subquery) if subquery.alias_or_name}
+        aliases = {}
+        for table in tree.find_all(exp.Table):
+            name = table.name.lower()
+            if name in derived:
+                continue
+            if name not in catalog:
+                return 0, f"Static: unknown table '{table.name}'"
+            aliases[table.alias_or_name.lower()] = name
+            aliases[name] = name
+
+        # Columns
+        output_aliases = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+        referenced = set(aliases.values())
+        for column in tree.find_all(exp.Column):
+            if isinstance(column.this, exp.Star):
+                continue
+            name, qualifier = column.name.lower(), column.table.lower()
+            if name in PSEUDO_COLUMNS:
+                continue
+            if qualifier:
+                if qualifier in derived:
+                    continue
+                if qualifier not in aliases:
+                    return 0, f"Static: unknown table or alias '{column.table}' in {column.sql()}"
+                if name not in catalog[aliases[qualifier]]:
+                    return 0, f"Static: unknown column '{column.name}' in table '{aliases[qualifier]}'"
+            elif not derived and name not in output_aliases and not any(name in catalog[table] for table in referenced):
+                return 0, f"Static: unknown column '{column.name}' (tables: {', '.join(sorted(referenced))})"
+
+        # Joins against the FK graph
+        if len(referenced) > 1:
+            edges, linked = self._foreign_keys()
+            for join in tree.find_all(exp.Join):
+                condition = join.args.get("on")
+                if condition is None:
+                    continue
+                for equality in condition.find_all(exp.EQ):
+                    left, right = equality.this, equality.expression
+                    if not (isinstance(left, exp.Column) and isinstance(right, exp.Column) and left.table and right.table):
+                        continue
+                    left_table, right_table = aliases.get(left.table.lower()), aliases.get(right.table.lower())
+                    if not left_table or not right_table or left_table == right_table:
+                        continue
+                    pair = frozenset([(left_table, left.name.lower()), (right_table, right.name.lower())])
+                    if pair not in edges and frozenset([left_table, right_table]) in linked:
+                        return 0, f"Static: join {equality.sql()} does not follow the foreign key between '{left_table}' and '{right_table}'"
+
+        # Aggregate sanity and result shape (top-level SELECT only)
+        select = tree if isinstance(tree, exp.Select) else None
+        if select is not None:
+            projections = select.expressions
+            grouped = select.args.get("group") is not None
+            is_aggregate = [projection.find(exp.AggFunc) is not None for projection in projections]
+            if any(is_aggregate) and not grouped:
+                bare = [projection for projection, aggregate in zip(projections, is_aggregate) if not aggregate and projection.find(exp.Column)]
+                if bare and select.find(exp.Count, exp.Sum, exp.Avg):
+                    return 0, f"Static: {bare[0].sql()} is neither aggregated nor grouped"
+                if results is not None and len(results) != 1:
+                    return 0, f"Static: ungrouped aggregate returned {len(results)} rows"
+                if results and all(value is None for value in results[0].values()):
+                    return 0, "Static: aggregate over no rows (NULL result)"
+            if results and not any(isinstance(projection, exp.Star) or isinstance(projection.this, exp.Star) for projection in projections):
+                if len(results[0]) > len(projections):
+                    return 0, f"Static: {len(results[0])} result columns for {len(projections)} selected expressions"
+
+        return None
 
 class AutoAuditor:
-    def __init__(self, model_version="llama3:8b"):
-        self.llm = LLMEngine(model_version=model_version)
+    """
+    Scores interactions for the training data: cheap heuristics and the
+    StaticAuditor catalog checks reject what can't be right without an LLM
+    call; everything else goes to the LLM judge, the only source of a PASS.
+    Verdicts are cached per (question, canonical SQL, catalog version).
+    """
+    def __init__(self, model_version="llama3:8b", llm=None, store=None, dialect=None, cache_size=4096):
+        # Pass the agent's engine to share it (judging with the same model)
+        self.llm = llm or LLMEngine(model_version=model_version)
+        self.prompts = PromptBuilder()
+        self.store = store
+        self.dialect = dialect
+        self.static = StaticAuditor(store, dialect)
+        self.cache_size = cache_size
+        self._verdicts = OrderedDict() # (question, canonical SQL, catalog version) -> (score, reason)
+        self._lock = threading.Lock()
 
-    def audit(self, query, sql, results):
-        """
-        Critiques the interaction. Returns (score, reason).
-        score: 1 (Pass) or 0 (Fail)
-        """
-        
+    def _verdict_key(self, query, sql):
+        version = self.store.catalog_version if self.store is not None else None
+        return (normalize_question(query), canonical_fingerprint(sql, self.dialect) or sql.strip(), version)
+
+    def _cached(self, key):
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+            return verdict
+
+    def _remember(self, key, verdict):
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+
+    def _pre_judge(self, query, sql, results):
+        """(key, verdict) from the heuristics, the verdict cache or the static checks; verdict None when the judge must decide."""
         # Fast heuristic checks
         if "error" in sql.lower() or "blocked" in sql.lower():
-            return 0, "SQL Generation Failed or Blocked"
+            inc("evosql_audits_total", source="heuristic")
+            return None, (0, "SQL Generation Failed or Blocked")
             
-        if not results and "count" not in sql.lower():
+        if results is not None and not results and "count" not in sql.lower():
             # Empty results might be valid, but suspicious for training data unless verified
             # We'll be conservative
-            return 0, "Empty result set (Conservative Reject)"
+            inc("evosql_audits_total", source="heuristic")
+            return None, (0, "Empty result set (Conservative Reject)")
 
-        # LLM Judge with Chain-of-Thought (CoT) for SLM Robustness
-        prompt = f"""
-        You are a SQL Expert Auditor. Verify if the generated SQL correctly answers the User Question.
-        
-        User Question: {query}
-        Generated SQL: {sql}
-        Result Sample: {str(results)[:200]}
-        
-        Steps:
-        1. Check if the SQL columns match the intent of the question.
-        2. Check for common traps (e.g., matching "orders" but selecting "users").
-        3. Verify the result is not an Error.
-        
-        Output format:
-        Reasoning: <one sentence analysis>
-        Verdict: PASS or FAIL
+        key = self._verdict_key(query, sql)
+        verdict = self._cached(key)
+        if verdict is not None:
+            inc("evosql_audits_total", source="cache")
+            return key, verdict
+
+        with span("audit.static"):
+            verdict = self.static.check(query, sql, results)
+        if verdict is not None:
+            inc("evosql_audits_total", source="static")
+            self._remember(key, verdict)
+        return key, verdict
+
+    def audit(self, query, sql, results):
+        """
+        Critiques the interaction. Returns (score, reason).
+        score: 1 (Pass) or 0 (Fail)
+        """
+        key, verdict = self._pre_judge(query, sql, results)
+        if verdict is not None:
+            return verdict
+        verdict = self._judge(query, sql, results)
+        self._remember(key, verdict)
+        return verdict
+
+    def audit_batch(self, items, concurrency=4):
+        """
+        Offline audit of a backlog, e.g. records polled from the feedback log:
+        items are dicts with "query", "sql" and optionally "results" (None skips
+        the result checks). Duplicates are judged once and only the cases the
+        static checks leave open reach the LLM, `concurrency` at a time.
+        Returns (score, reason) per item, in order.
         """
+        verdicts = [None] * len(items)
+        pending = {} # verdict key -> [item indexes]
+        for index, item in enumerate(items):
+            key, verdict = self._pre_judge(item["query"], item["sql"], item.get("results"))
+            if verdict is not None:
+                verdicts[index] = verdict
+            elif key in pending:
+                inc("evosql_audits_total", source="cache")
+                pending[key].append(index)
+            else:
+                pending[key] = [index]
+
+        def judge(key):
+            item = items[pending[key][0]]
+            verdict = self._judge(item["query"], item["sql"], item.get("results"))
+            self._remember(key, verdict)
+            return key, verdict
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for key, verdict in pool.map(judge, list(pending)):
+                for index in pending[key]:
+                    verdicts[index] = verdict
+        print(f"[Auditor] Batch: {len(items)} audited, {len(pending)} sent to the LLM judge")
+        return verdicts
+
+    def _judge(self, query, sql, results):
+        # LLM Judge with Chain-of-Thought (CoT) for SLM Robustness
+        # Fixed instructions first, the audited interaction last (stable prompt prefix)
+        prompt = self.prompts.audit_prompt(query, sql, results if results is not None else "(not recorded)").text
         
-        evaluation = self.llm.generate(prompt, max_tokens=128)
+        with span("audit.llm_judge"):
+            evaluation = self.llm.generate(prompt, max_tokens=128, priority=PRIORITY_AUDIT)
+        inc("evosql_audits_total", source="llm_judge")
         
         print(f"[Auditor] Full Evaluation: {evaluation}")
         
@@ -47,3 +260,66 @@ class AutoAuditor:
             return 1, evaluation
         else:
             return 0, evaluation
+
+class AuditQueue:
+    """
+    Runs AutoAuditor.audit off the request path: a bounded queue drained by
+    `concurrency` daemon worker threads. submit() never blocks; when the queue
+    is full the audit is skipped and counted in `dropped`.
+    on_result(query, sql, score, reason) is called from a worker thread.
+    """
+    def __init__(self, auditor, on_result=None, concurrency=2, max_pending=100, max_results=1000):
+        self.auditor = auditor
+        self.on_result = on_result
+        self.max_results = max_results
+        self.results = OrderedDict() # audit_id -> (score, reason), most recent max_results
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        for i in range(concurrency):
+            threading.Thread(target=self._worker, name=f"audit-{i}", daemon=True).start()
+
+    def submit(self, query, sql, results):
+        """Queues an audit; returns its id, or None if the queue was full."""
+        audit_id = next(self._ids)
+        try:
+            self._queue.put_nowait((audit_id, query, sql, results))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return None
+        with self._lock:
+            self.submitted += 1
+        return audit_id
+
+    def result(self, audit_id):
+        """(score, reason) of a finished audit, or None while pending/unknown."""
+        with self._lock:
+            return self.results.get(audit_id)
+
+    def join(self):
+        """Blocks until every queued audit finished (e.g. before shutdown)."""
+        self._queue.join()
+
+    def _worker(self):
+        while True:
+            audit_id, query, sql, results = self._queue.get()
+            try:
+                score, reason = self.auditor.audit(query, sql, results)
+                with self._lock:
+                    self.results[audit_id] = (score, reason)
+                    while len(self.results) > self.max_results:
+                        self.results.popitem(last=False)
+                    self.completed += 1
+                if self.on_result:
+                    self.on_result(query, sql, score, reason)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                print(f"[Auditor] Background audit failed: {e}")
+            finally:
+                self._queue.task_done()
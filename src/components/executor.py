@@ -1,24 +1,84 @@
+import asyncio
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.llm.client import PRIORITY_EXPLANATION
 from src.llm.engine import LLMEngine
+from src.llm.prompt_builder import PromptBuilder
+from src.llm.answer_cache import AnswerCache
 from src.semantic_catalog.store import SemanticStore
-from src.utils.safety import is_safe
-from src.utils.db_connect import create_engine, text
-from src.components.auditor import AutoAuditor
-import agentlightning as agl
+from src.utils.safety import SQLGLOT_DIALECTS, is_safe
+from src.utils.db_connect import get_engine
+from src.utils.feedback_log import get_feedback_log
+from src.utils.governor import QueryLimitExceeded
+from src.utils.metrics import METRICS_PORT, inc, serve_metrics, span
+from src.utils.tracing import get_tracer
+from src.utils.result_cache import ResultCache
+from src.utils.results import ColumnChunk, StreamingResult
+from src.components.auditor import AuditQueue, AutoAuditor
+from sqlalchemy.engine import make_url
+
+def _run_sync(coro):
+    """Runs a coroutine to completion from sync code (even inside a running event loop)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
 
 class SQLAgent:
-    def __init__(self, db_url=None, model_path="llama3:8b", auto_audit=False):
+    def __init__(self, db_url=None, model_path="llama3:8b", auto_audit=False, page_size=None, max_rows=None, max_bytes=None, query_timeout=None, max_vm_steps=None, result_cache=None, audit_concurrency=2,
+                 store=None, answer_cache=None, feedback_log=None):
         # We repurpose model_path as model_name for Ollama
         self.db_url = db_url
         self.llm = LLMEngine(model_version=model_path)
-        self.store = SemanticStore()
+        self.store = store or SemanticStore()
         self.auto_audit = auto_audit
         if self.auto_audit:
-            self.auditor = AutoAuditor(model_version=model_path) # Use same model or "judge" model
+            # Use same model or "judge" model; catalog checks settle most cases without it
+            dialect = SQLGLOT_DIALECTS.get(make_url(db_url).get_backend_name()) if db_url else "sqlite"
+            self.auditor = AutoAuditor(model_version=model_path, llm=self.llm, store=self.store, dialect=dialect)
+            # Audits run in the background, after the result was returned
+            self.audit_queue = AuditQueue(self.auditor, on_result=self._on_audit, concurrency=audit_concurrency)
         super().__init__()
-        self.db_url = db_url
-        self.llm = LLMEngine(model_version=model_path)
-        self.store = SemanticStore()
+        
+        # Stable-prefix prompt assembly (templates in src.llm.prompts)
+        self.prompts = PromptBuilder(dialect=make_url(db_url).get_backend_name() if db_url else "sqlite")
+        # Shared prompt prefix warmed on the first query of each catalog version (see _warm_prompt_prefix);
+        # not here, so construction neither loads the catalog nor calls the LLM
+        self._warmed_catalog_version = None
+        
+        # NL->SQL cache in front of retrieval + generation; both embed the raw question through the
+        # store's query-embedding cache, so a cache miss embeds it once
+        self.answer_cache = answer_cache or AnswerCache(embed_fn=self.store.embed_queries)
+        # SQL -> result cache per data version (pass a ResultCache with a version_fn for non-SQLite databases)
+        self.result_cache = result_cache or ResultCache()
+        
+        # Streaming execution budget (defaults in src.utils.results, env-overridable)
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        # Runtime governor limits per query (defaults in src.utils.governor)
+        self.query_timeout = query_timeout
+        self.max_vm_steps = max_vm_steps
+        # Results with further pages keep their cursor (and pooled connection) open
+        # until paged through, closed, evicted or idle for `result_idle_seconds`.
+        self.open_results = OrderedDict() # result_id -> StreamingResult
+        self.max_open_results = 4
+        self.result_idle_seconds = 300
+        self._results_lock = threading.Lock()
+        
+        # Feedback events go through one batched, durable log per process (see src.utils.feedback_log)
+        self.feedback_log = feedback_log or get_feedback_log()
+        
+        # Sampled, non-blocking trace emission (src.utils.tracing)
+        self.tracer = get_tracer()
+        
+        # Per-stage timings and counters (src.utils.metrics); METRICS_PORT serves them as /metrics
+        if METRICS_PORT:
+            serve_metrics()
         
         # Refinement 2: Model Lifecycle Tracking
         self.current_model_version = "v1.0.0"
@@ -39,123 +99,275 @@ class SQLAgent:
         # Placeholder for continuous agent loop
         pass
 
-    def handle_query(self, user_query: str):
+    def _warm_prompt_prefix(self, catalog_version):
+        """Fire-and-forget warm-up of the catalog prompt prefix, once per catalog version (skipped for the mock LLM)."""
+        if self.llm.is_mock or self._warmed_catalog_version == catalog_version:
+            return
+        self._warmed_catalog_version = catalog_version
+        self.llm.warm_prefix(self.prompts.sql_prompt("", [], table_names=self.store.table_names).prefix)
+
+    def handle_query(self, user_query: str, on_sql_token=None):
+        """Sync entry point (UI, scripts): runs handle_query_async to completion."""
+        return _run_sync(self.handle_query_async(user_query, on_sql_token=on_sql_token))
+
+    async def handle_query_async(self, user_query: str, wait_for_explanation=True, on_sql_token=None):
+        """
+        Async pipeline. Blocking steps (retrieval, LLM calls, DB) run in worker
+        threads; the explanation LLM call overlaps with execution and auditing
+        is queued in the background (see AuditQueue, `audit_id` in the response).
+        wait_for_explanation=False returns as soon as the rows are there, with
+        "explanation": None and "explanation_task" (an asyncio.Task for the text).
+        on_sql_token(token) receives the SQL generation as it streams, called
+        on the event loop's thread (the caller's thread for handle_query).
+        """
+        with span("query.total"):
+            response = await self._handle_query_async(user_query, wait_for_explanation, on_sql_token)
+        if isinstance(response, dict):
+            outcome = "ok"
+        elif response.startswith("[Blocked]"):
+            outcome = "blocked"
+        elif response.startswith("[Execution Error]"):
+            outcome = "error"
+        elif response.startswith("[Clarification Needed]"):
+            outcome = "clarification"
+        else:
+            outcome = "sql_only" # No database connected
+        inc("evosql_queries_total", outcome=outcome)
+        return response
+
+    async def _handle_query_async(self, user_query, wait_for_explanation, on_sql_token):
         # 0. Lifecycle Check
         self.check_for_new_model()
         
         print(f"Processing query: {user_query}")
         
-        # 0. Agent-Lightning Trace Start (Manual)
-        # agl.trace context doesn't exist in installed version
-        try:
-            agl.emit_message(f"[User Query] {user_query}")
-        except Exception:
-            pass # Tracing optional
-
-        # 1. Retrieval (Hybrid Search + Graph Hints)
-        context_items = self.store.search(user_query, top_k=5)
-        schema_context = "\n".join([item['text'] for item in context_items])
-        
-        # 2. Ambiguity Resolution (Improvement 1)
-        if "date" in user_query.lower():
-            date_cols = [m['metadata']['column'] for m in context_items if m['metadata'].get('inferred_type') == 'date']
-            if len(set(date_cols)) > 1:
-                question = f"Ambiguity detected. Did you mean: {', '.join(date_cols)}?"
-                try:
-                    agl.emit_message(f"[Ambiguity Resolution] {question}")
-                except Exception:
-                    pass
-                return f"[Clarification Needed] {question}"
-
-        # 3. Generation (SLM)
-        prompt = f"""
-        You are a SQL expert.
-        Schema Context:
-        {schema_context}
-        
-        User Query: {user_query}
+        # 0. Agent-Lightning Trace Start (sampled per request, emitted in the background)
+        trace = self.tracer.start()
+        trace.message(f"[User Query] {user_query}")
+
+        # 1. Answer Cache: repeated/paraphrased questions skip retrieval and the LLM
+        with span("query.answer_cache"):
+            catalog_version = self.store.catalog_version
+            sql = self.answer_cache.get(user_query, catalog_version)
+        cache_hit = sql is not None
+        inc("evosql_answer_cache_total", result="hit" if cache_hit else "miss")
+        generation_metrics = None
+        prompt_tokens = None
+        if cache_hit:
+            print(f"Answer cache hit: {sql}")
+        else:
+            # Catalog changed (or first query): load the new prompt prefix into the model while we retrieve
+            await asyncio.to_thread(self._warm_prompt_prefix, catalog_version)
+
+            # 1b. Retrieval (Hybrid Search + Graph Hints)
+            with span("query.retrieval"):
+                context_items = await asyncio.to_thread(self.store.search, user_query, top_k=5)
+            schema_context = "\n".join([item['text'] for item in context_items])
         
-        Generate a valid SQL query for SQLite. Return ONLY the SQL.
-        """
+            # 2. Ambiguity Resolution (Improvement 1)
+            if "date" in user_query.lower():
+                date_cols = [m['metadata']['column'] for m in context_items if m['metadata'].get('inferred_type') == 'date']
+                if len(set(date_cols)) > 1:
+                    question = f"Ambiguity detected. Did you mean: {', '.join(date_cols)}?"
+                    trace.message(f"[Ambiguity Resolution] {question}")
+                    return f"[Clarification Needed] {question}"
+
+            # 3. Generation (SLM)
+            # Most to least stable: system, instructions, catalog overview, schema, hints, question
+            prompt = self.prompts.sql_prompt(user_query, context_items, table_names=self.store.table_names)
+            prompt_tokens = prompt.token_counts
+            print(f"Prompt tokens (est.): {prompt_tokens}")
         
-        sql = self.llm.generate(prompt)
-        try:
-            agl.emit_object({"type": "generated_sql", "sql": sql})
-        except Exception:
-            pass
+            with span("query.generation"):
+                sql, generation_metrics = await self._generate_sql(prompt.text, on_sql_token)
+            trace.object({"type": "generated_sql", "sql": sql})
             
-        print(f"Generated SQL: {sql}")
+            print(f"Generated SQL: {sql}")
 
-        # 4. Safety Sandbox (Improvement 4)
-        if self.db_url:
-            if not is_safe(sql, self.db_url):
-                msg = "Query blocked by Safe Execution Sandbox (High Cost/Unsafe)."
-                try:
-                    agl.emit_exception(Exception(msg))
-                except Exception:
-                    pass
-                return f"[Blocked] {msg}"
-        
-        # 5. Execution & Auto-Explanation (Refinement 1)
+        # 4. Safety Sandbox (Improvement 4) & 5. Execution & Auto-Explanation (Refinement 1)
+        # One pooled connection serves both the EXPLAIN check and the execution.
         if self.db_url:
+            self._close_idle_results()
+            conn = None
+            stream = None
+            explanation_task = None
             try:
-                engine = create_engine(self.db_url)
-                with engine.connect() as conn:
-                    result = conn.execute(text(sql))
-                    rows = [dict(row._mapping) for row in result]
-                    
-                    try:
-                        agl.emit_object({"type": "execution_result", "rows": rows})
-                    except Exception:
-                        pass
-                    
+                # Result cache: the same SQL on unchanged data (already sandbox-checked) skips execution
+                result_key = self.result_cache.key(self.db_url, sql)
+                first_page = self.result_cache.get(result_key)
+                inc("evosql_result_cache_total", result="hit" if first_page is not None else "miss")
+                if first_page is not None:
+                    print("Result cache hit")
+                    explanation_task = asyncio.create_task(asyncio.to_thread(self._explain, sql))
+                    result_status = {"row_count": first_page.num_rows, "has_more": False, "result_id": None, "truncated": False, "truncation_reason": None}
+                else:
+                    with span("query.sandbox"):
+                        conn = await asyncio.to_thread(get_engine(self.db_url).connect)
+                        safe = await asyncio.to_thread(is_safe, sql, self.db_url, conn=conn, catalog_version=catalog_version)
+                    if not safe:
+                        inc("evosql_queries_blocked_total", reason="sandbox")
+                        msg = "Query blocked by Safe Execution Sandbox (High Cost/Unsafe)."
+                        trace.exception(Exception(msg))
+                        return f"[Blocked] {msg}"
+
                     # Refinement 1: Auto-Explanation (Self-Reflection)
-                    explanation_prompt = f"""
-                    Explain this SQL query to a non-technical user in 1 sentence:
-                    Query: {sql}
-                    """
-                    explanation = self.llm.generate(explanation_prompt, max_tokens=64)
-                    
-                    # Feature: Auto-Audit
-                    audit_info = ""
-                    if self.auto_audit:
-                        score, reason = self.auditor.audit(user_query, sql, rows)
-                        audit_info = f" | [Auditor] {reason}"
-                        if score == 1:
-                            self.submit_feedback(user_query, sql, 1) # Auto-save good example
-                            audit_info += " (Saved to Dataset)"
-                    
-                    return {
-                        "data": rows,
-                        "sql": sql,
-                        "explanation": f"Logic: {explanation} (Model: {self.current_model_version}){audit_info}"
+                    # Only needs the SQL, so the LLM round-trip overlaps with execution
+                    explanation_task = asyncio.create_task(asyncio.to_thread(self._explain, sql))
+
+                    # Stream through a server-side cursor; only the first page is materialized
+                    with span("query.execution"):
+                        stream = await asyncio.to_thread(
+                            StreamingResult, conn, sql, page_size=self.page_size, max_rows=self.max_rows, max_bytes=self.max_bytes,
+                            timeout=self.query_timeout, max_vm_steps=self.max_vm_steps
+                        )
+                        conn = None # Owned (and released) by the stream from here on
+                        first_page = await asyncio.to_thread(stream.next_page) or ColumnChunk.empty(stream.columns)
+                    if stream.closed and not stream.truncated:
+                        self.result_cache.put(result_key, first_page) # Complete result in one page
+                    result_status = {
+                        "row_count": stream.rows_fetched,
+                        "has_more": stream.has_more,
+                        "result_id": self._keep_open(stream),
+                        "truncated": stream.truncated,
+                        "truncation_reason": stream.truncation_reason
                     }
+                inc("evosql_rows_returned_total", first_page.num_rows)
+                rows = first_page.to_records(limit=20) # Preview for tracing and the auditor
+                
+                # Summarized by the tracer: row count, columns and head rows
+                trace.object({"type": "execution_result", "row_count": result_status["row_count"], "rows": rows})
+                
+                # Feature: Auto-Audit (background worker, never delays the response)
+                audit_id = None
+                audit_info = ""
+                if self.auto_audit:
+                    audit_id = self.audit_queue.submit(user_query, sql, rows)
+                    audit_info = " | [Auditor] queued" if audit_id else " | [Auditor] skipped (queue full)"
+                
+                if not cache_hit and "-- Error:" not in sql:
+                    self.answer_cache.put(user_query, catalog_version, sql)
+                response = {
+                    "data": first_page.to_dict(),
+                    "sql": sql,
+                    "explanation": None,
+                    **result_status,
+                    "audit_id": audit_id,
+                    "generation_metrics": generation_metrics,
+                    "prompt_tokens": prompt_tokens
+                }
+                if wait_for_explanation:
+                    response["explanation"] = self._format_explanation(await explanation_task, audit_info)
+                else:
+                    response["explanation_task"] = asyncio.create_task(self._await_explanation(explanation_task, audit_info))
+                return response
             except Exception as e:
-                try:
-                    agl.emit_exception(e)
-                except Exception:
-                    pass
+                if stream is not None:
+                    stream.close()
+                if explanation_task is not None:
+                    explanation_task.cancel()
+                trace.exception(e)
+                if isinstance(e, QueryLimitExceeded):
+                    inc("evosql_queries_blocked_total", reason=e.limit)
+                    return f"[Blocked] {e}" # Runtime limit fired before any row arrived
                 return f"[Execution Error] {e}"
+            finally:
+                if conn is not None:
+                    conn.close()
         
+        if not cache_hit and "-- Error:" not in sql:
+            self.answer_cache.put(user_query, catalog_version, sql)
         return sql # Return SQL if no DB connected
 
+    async def _generate_sql(self, prompt, on_token=None):
+        # Streamed generation stops at the first complete statement
+        if on_token is None:
+            return await asyncio.to_thread(self.llm.generate_sql, prompt)
+        loop = asyncio.get_running_loop()
+        forward = lambda token: loop.call_soon_threadsafe(on_token, token)
+        return await asyncio.to_thread(self.llm.generate_sql, prompt, on_token=forward)
+
+    def _explain(self, sql):
+        explanation_prompt = self.prompts.explanation_prompt(sql).text
+        with span("query.explanation"):
+            return self.llm.generate(explanation_prompt, max_tokens=64, priority=PRIORITY_EXPLANATION)
+
+    def _format_explanation(self, explanation, audit_info):
+        return f"Logic: {explanation} (Model: {self.current_model_version}){audit_info}"
+
+    async def _await_explanation(self, explanation_task, audit_info):
+        return self._format_explanation(await explanation_task, audit_info)
+
+    def _on_audit(self, query, sql, score, reason):
+        # Called from an AuditQueue worker thread
+        print(f"[Auditor] {reason}")
+        if score == 1: # Only the LLM judge passes (static checks can only reject)
+            self.submit_feedback(query, sql, 1) # Auto-save good example
+
+    def _keep_open(self, stream):
+        """Registers a result with further pages; returns its id (None if fully fetched)."""
+        if stream.closed:
+            return None
+        result_id = f"r{time.time_ns()}"
+        with self._results_lock:
+            self.open_results[result_id] = stream
+            while len(self.open_results) > self.max_open_results:
+                _, oldest = self.open_results.popitem(last=False)
+                oldest.close() # Frees its pooled connection
+        return result_id
+
+    def _close_idle_results(self):
+        now = time.monotonic()
+        with self._results_lock:
+            for result_id, stream in list(self.open_results.items()):
+                if stream.closed or now - stream.last_used > self.result_idle_seconds:
+                    del self.open_results[result_id]
+                    stream.close()
+
+    def fetch_page(self, result_id):
+        """
+        Next page of an open result as {"data", "row_count", "has_more", "truncated",
+        "truncation_reason"}, or None if the result is exhausted, closed or unknown.
+        """
+        self._close_idle_results()
+        with self._results_lock:
+            stream = self.open_results.get(result_id)
+        if stream is None:
+            return None
+        page = stream.next_page()
+        if stream.closed:
+            with self._results_lock:
+                self.open_results.pop(result_id, None)
+        if page is None:
+            return None
+        inc("evosql_rows_returned_total", page.num_rows)
+        return {
+            "data": page.to_dict(),
+            "row_count": stream.rows_fetched,
+            "has_more": stream.has_more,
+            "truncated": stream.truncated,
+            "truncation_reason": stream.truncation_reason
+        }
+
+    def close_result(self, result_id):
+        """Releases the cursor/connection of a result the caller no longer pages through."""
+        with self._results_lock:
+            stream = self.open_results.pop(result_id, None)
+        if stream is not None:
+            stream.close()
 
     def submit_feedback(self, query, sql, rating):
         """
         Called by UI to log feedback for the Trainer.
         rating: 1 (Good) or 0 (Bad)
         """
-        import json
         entry = {
             "query": query,
             "sql": sql,
             "rating": rating,
             "timestamp": time.time()
         }
-        # In a real app, this goes to a queue or DB. 
-        # Here we append to a file that Trainer monitors.
-        with open("feedback_queue.jsonl", "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        # Non-blocking: the log's background writer batches appends; the Trainer consumes the log
+        self.feedback_log.append(entry)
         print(f"Feedback logged: {rating}")
 
 
@@ -1,27 +1,138 @@
-from src.utils.db_connect import get_schema_details, get_table_sample
-from src.semantic_catalog.profiling import profile_column
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.utils.db_connect import get_schema_details, get_table_sample_columns, get_table_change_signal
+from src.semantic_catalog.profiling import cardinality_label, profile_table
+from src.semantic_catalog.column_stats import compute_table_stats
 from src.semantic_catalog.store import SemanticStore
+from src.utils.metrics import span
 
 class SchemaDiscovery:
-    def __init__(self):
+    def __init__(self, max_workers=8, table_timeout=30.0, batch_size=500, sample_size=10000, stats_scan_limit=1_000_000, store=None):
         self.has_run = False
         # Initialize store here (lazy init might be better in real apps depending on pickling)
-        self.store = SemanticStore()
+        self.store = store or SemanticStore()
 
-    def run(self, db_url=None):
+        # Parallel discovery settings
+        self.max_workers = max_workers # Bounded pool (keep <= DB pool size + overflow)
+        self.table_timeout = table_timeout # Seconds a single table may spend sampling/profiling
+        self.batch_size = batch_size # Schema elements per streamed store batch
+        self.sample_size = sample_size # Rows per table fed to the batch profiler
+        self.stats_scan_limit = stats_scan_limit # Max rows streamed per table for sketch statistics
+
+        # Per-table fingerprints of the last run, persisted next to the catalog
+        self.fingerprints_path = os.path.join(self.store.persist_path, "table_fingerprints.json")
+
+    def run(self, db_url=None, force=False):
+        """
+        Incremental discovery: only tables whose fingerprint (columns, types, FKs,
+        data-change signal) changed since the last run are re-sampled, re-profiled
+        and upserted; dropped tables are removed. force=True re-discovers everything.
+        """
         if not db_url:
             print("No DB URL provided. Skipping discovery.")
             return
 
         print(f"Starting Schema Discovery for {db_url}...")
-        
-        # 1. Introspection
-        schema = get_schema_details(db_url)
+        with span("discovery.total"):
+            self._run(db_url, force)
+
+    def _run(self, db_url, force):
+        # 1. Introspection (single bulk reflection pass where the dialect allows it)
+        with span("discovery.introspect"):
+            schema = get_schema_details(db_url)
         print(f"Found {len(schema)} tables.")
-        
-        metadata_batch = []
+
+        # 1b. Fingerprints: skip tables that did not change since the last run
+        # (always loaded: a forced run must still remove tables dropped since the last run)
+        previous = self._load_fingerprints(db_url)
+        with span("discovery.fingerprint"):
+            fingerprints = self._fingerprint_tables(db_url, schema)
+        changed = {
+            table_name: details for table_name, details in schema.items()
+            if force or fingerprints[table_name] is None or previous.get(table_name) != fingerprints[table_name]
+        }
+        dropped = [table_name for table_name in previous if table_name not in schema]
+
+        if not changed and not dropped:
+            print("Catalog is up to date (no table fingerprint changed).")
+            self.has_run = True
+            return
+        print(f"{len(changed)} new/changed tables, {len(dropped)} dropped, {len(schema) - len(changed)} unchanged.")
+
+        # Old entries of changed tables (e.g. removed columns) and dropped tables go away
+        self.store.delete_tables(dropped + list(changed), publish=False)
+
+        graph_hints = self._extract_graph_hints(changed)
+
+        # 2. Profiling & Enrichment (concurrent) + 3. Indexing (streamed in batches)
+        with span("discovery.profile_index"):
+            indexed, incomplete = self._profile_and_index(db_url, changed)
+        if incomplete:
+            print(f"Could not profile {len(incomplete)} tables (indexed without samples, retried next run): {', '.join(incomplete)}")
+        if indexed:
+            print(f"Indexed {indexed} schema elements to Semantic Store.")
+        else:
+            print("No schema elements to index.")
+
+        # 4. Store Graph Hints
+        if graph_hints:
+            print(f"Storing {len(graph_hints)} graph/join hints...")
+            self.store.add_graph_hints(graph_hints, publish=False)
+
+        # One catalog version bump for the whole run
+        with span("discovery.publish"):
+            self.store.publish_catalog_change()
+
+        for table_name in incomplete:
+            fingerprints[table_name] = None
+        self._save_fingerprints(db_url, fingerprints)
+
+        self.has_run = True
+        print("Schema Discovery complete.")
+
+    def _fingerprint_tables(self, db_url, schema):
+        """Returns {table_name: fingerprint or None}; change signals are read concurrently."""
+        table_names = list(schema)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fingerprint") as pool:
+            signals = list(pool.map(lambda table_name: get_table_change_signal(db_url, table_name), table_names))
+
+        fingerprints = {}
+        for table_name, signal in zip(table_names, signals):
+            if signal is None:
+                fingerprints[table_name] = None # Unknown data state: always re-profile
+                continue
+            details = schema[table_name]
+            payload = json.dumps(
+                {"columns": details['columns'], "foreign_keys": details['foreign_keys'], "signal": signal},
+                sort_keys=True, default=str
+            )
+            fingerprints[table_name] = hashlib.sha256(payload.encode()).hexdigest()
+        return fingerprints
+
+    def _load_fingerprints(self, db_url):
+        try:
+            with open(self.fingerprints_path) as f:
+                return json.load(f).get(db_url, {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_fingerprints(self, db_url, fingerprints):
+        try:
+            with open(self.fingerprints_path) as f:
+                all_fingerprints = json.load(f)
+        except (FileNotFoundError, ValueError):
+            all_fingerprints = {}
+        all_fingerprints[db_url] = {table_name: fp for table_name, fp in fingerprints.items() if fp is not None}
+        tmp_path = f"{self.fingerprints_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(all_fingerprints, f)
+        os.replace(tmp_path, self.fingerprints_path)
+
+    def _extract_graph_hints(self, schema):
         graph_hints = {}
-        
         for table_name, details in schema.items():
             # Refinement 4: Extract Graph Hints (FKs)
             # details['foreign_keys'] is list of dicts from SQLAlchemy introspection
@@ -32,64 +143,155 @@ class SchemaDiscovery:
                     referred_table = fk.get('referred_table')
                     constrained_cols = fk.get('constrained_columns', [])
                     referred_cols = fk.get('referred_columns', []) # Note: referred_columns might not be always available depending on driver
-                    
+
                     if referred_table and constrained_cols:
                         cols_str = ", ".join(constrained_cols)
                         # We assume simplistic single-col FK for the text description for now
-                        hint_text = f"JOIN HINT: Table '{table_name}' joins with '{referred_table}' on {table_name}.{constrained_cols[0]} = {referred_table}.id (Verify exact PK)"
+                        referred_col = referred_cols[0] if referred_cols else "id"
+                        hint_text = f"JOIN HINT: Table '{table_name}' joins with '{referred_table}' on {table_name}.{constrained_cols[0]} = {referred_table}.{referred_col} (Verify exact PK)"
                         hints.append(hint_text)
-                
+
                 if hints:
                     graph_hints[table_name] = hints
+        return graph_hints
 
-            # Get a sample for profiling this table
-            sample_rows = get_table_sample(db_url, table_name, limit=20)
-            
-            # 2. Profiling & Enrichment
-            for col in details['columns']:
-                col_name = col['name']
-                # Extract column values from sample rows
-                col_values = [row.get(col_name) for row in sample_rows if row.get(col_name) is not None]
-                profile = profile_column(col_values)
-                
-                # Create a rich description for the vector store
-                # Improvement: Include FK info if available
-                description = (
-                    f"Table: {table_name}, Column: {col_name}. "
-                    f"Type: {col['type']} (Inferred: {profile['inferred_type']}). "
-                    f"Cardinality: {profile['cardinality']}. "
-                    f"Sample values: {', '.join(map(str, profile['sample_values']))}."
-                )
-                
-                doc_id = f"{table_name}.{col_name}"
-                metadata = {
-                    "table": table_name,
-                    "column": col_name,
-                    "sql_type": col['type'],
-                    "inferred_type": profile['inferred_type'],
-                    "is_pk": str(col['primary_key'])
-                }
-                
-                metadata_batch.append({
-                    "id": doc_id,
-                    "text": description,
-                    "metadata": metadata
-                })
-                
-        # 3. Indexing
-        if metadata_batch:
-            print(f"Indexing {len(metadata_batch)} schema elements to Semantic Store...")
-            self.store.add_schema_metadata(metadata_batch)
-            print("Indexing complete.")
-        else:
-            print("No schema elements to index.")
-            
-        # 4. Store Graph Hints
-        if graph_hints:
-            print(f"Storing {len(graph_hints)} graph/join hints...")
-            self.store.add_graph_hints(graph_hints)
+    def _profile_and_index(self, db_url, schema):
+        """
+        Samples/profiles tables on a bounded thread pool and streams finished
+        tables into the store every `batch_size` elements, so the full catalog
+        is never held in memory. Returns (indexed_count, incomplete_tables), where
+        incomplete tables timed out or failed and were indexed without samples.
+        """
+        tables = list(schema.items())
+        started = {} # table_name -> monotonic start time (set by the worker)
+        batch = []
+        indexed = 0
+        incomplete = []
 
-        
-        self.has_run = True
-        print("Schema Discovery complete.")
+        def flush():
+            nonlocal batch, indexed
+            if batch:
+                self.store.add_schema_metadata(batch, publish=False)
+                indexed += len(batch)
+                batch = []
+
+        def work(table_name, details):
+            started[table_name] = time.monotonic()
+            sample_columns = get_table_sample_columns(db_url, table_name, limit=self.sample_size)
+            # Aggregates are pushed down; they and the sketch stream stop at the table's timeout
+            column_stats = compute_table_stats(
+                db_url, table_name, details['columns'], scan_limit=self.stats_scan_limit,
+                sample_columns=sample_columns, deadline=started[table_name] + self.table_timeout
+            )
+            return self._describe_table(table_name, details, sample_columns, column_stats)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="discovery")
+        pending = {}
+        next_table = 0
+        try:
+            while next_table < len(tables) or pending:
+                # Keep a bounded window of in-flight tables
+                while next_table < len(tables) and len(pending) < 2 * self.max_workers:
+                    table_name, details = tables[next_table]
+                    pending[pool.submit(work, table_name, details)] = (table_name, details)
+                    next_table += 1
+
+                done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in done:
+                    table_name, details = pending.pop(future)
+                    try:
+                        batch.extend(future.result())
+                    except Exception as e:
+                        print(f"Error profiling table {table_name}: {e}")
+                        incomplete.append(table_name)
+                        batch.extend(self._describe_table(table_name, details, {}))
+
+                # Abandon tables stuck past their timeout (the worker thread finishes in the background)
+                now = time.monotonic()
+                for future, (table_name, details) in list(pending.items()):
+                    start = started.get(table_name)
+                    if start is not None and now - start > self.table_timeout:
+                        del pending[future]
+                        print(f"Timed out profiling table {table_name} after {self.table_timeout}s")
+                        incomplete.append(table_name)
+                        batch.extend(self._describe_table(table_name, details, {}))
+
+                if len(batch) >= self.batch_size:
+                    flush()
+            flush()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return indexed, incomplete
+
+    def _describe_table(self, table_name, details, sample_columns, column_stats=None):
+        """
+        Profiles every column of a table from its columnar sample and builds the
+        store documents, enriched with table-wide statistics when available.
+        """
+        profiles = profile_table({col['name']: sample_columns.get(col['name'], []) for col in details['columns']})
+        elements = []
+        for col in details['columns']:
+            col_name = col['name']
+            profile = profiles[col_name]
+            stats = (column_stats or {}).get(col_name)
+            if stats and stats['distinct'] is not None:
+                # Table-wide distinct count beats the sample-based guess
+                # (a partial scan's estimate is compared with the rows it scanned)
+                profile['cardinality'] = cardinality_label(stats['distinct'], stats['distinct_non_null'])
+
+            # Create a rich description for the vector store
+            # Improvement: Include FK info if available
+            description = (
+                f"Table: {table_name}, Column: {col_name}. "
+                f"Type: {col['type']} (Inferred: {profile['inferred_type']}). "
+                f"Cardinality: {profile['cardinality']}. "
+                f"Sample values: {', '.join(map(str, profile['sample_values']))}."
+            )
+            if stats:
+                description += " " + self._describe_stats(stats)
+
+            doc_id = f"{table_name}.{col_name}"
+            metadata = {
+                "table": table_name,
+                "column": col_name,
+                "sql_type": col['type'],
+                "inferred_type": profile['inferred_type'],
+                "is_pk": str(col['primary_key'])
+            }
+            if stats:
+                metadata.update(self._stats_metadata(stats))
+
+            elements.append({
+                "id": doc_id,
+                "text": description,
+                "metadata": metadata
+            })
+        return elements
+
+    @staticmethod
+    def _describe_stats(stats):
+        parts = [f"Nulls: {stats['null_fraction']:.1%}."]
+        if stats['distinct'] is not None:
+            scope = f" in the first {stats['scanned_rows']:,} rows" if stats['distinct_partial'] else ""
+            parts.append(f"Distinct: ~{stats['distinct']:,}{scope}.")
+        if stats['min'] is not None and stats['max'] is not None:
+            parts.append(f"Range: {str(stats['min'])[:50]} to {str(stats['max'])[:50]}.")
+        if stats['top_values'] and stats['scanned_rows']:
+            top = ", ".join(f"{str(value)[:50]} ({count / stats['scanned_rows']:.0%})" for value, count in stats['top_values'])
+            parts.append(f"Top values: {top}.")
+        return " ".join(parts)
 
+    @staticmethod
+    def _stats_metadata(stats):
+        # Chroma metadata values must be str/int/float/bool (no None)
+        metadata = {"row_count": int(stats['row_count']), "null_fraction": float(stats['null_fraction'])}
+        if stats['distinct'] is not None:
+            metadata["distinct_count"] = int(stats['distinct'])
+            metadata["distinct_partial"] = bool(stats['distinct_partial'])
+        if stats['min'] is not None:
+            metadata["min_value"] = str(stats['min'])[:100]
+        if stats['max'] is not None:
+            metadata["max_value"] = str(stats['max'])[:100]
+        if stats['top_values']:
+            metadata["top_values"] = json.dumps([[str(value)[:100], count] for value, count in stats['top_values']])
+        return metadata
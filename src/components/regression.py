@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from sqlalchemy.engine import make_url
+from src.utils.result_cache import sqlite_data_version
+from src.utils.safety import canonical_fingerprint
+
+DEFAULT_GOLDEN_PATH = os.getenv("GOLDEN_DATASET", "golden_dataset.jsonl")
+DEFAULT_CACHE_DIR = os.getenv("REGRESSION_CACHE_DIR", ".regression_cache")
+
+# Limits for one golden/candidate query in a worker process
+CASE_TIMEOUT_SECONDS = 10.0
+MAX_COMPARED_ROWS = 10000 # Rows kept for row-level comparison/diffs; larger results compare by digest
+MAX_DIFF_ROWS = 5
+FETCH_BATCH_ROWS = 1000
+RESULT_FORMAT = 2 # Part of the reference cache key; bump when _execute_case output changes
+
+def load_golden_dataset(path=None):
+    """Golden cases from JSONL: {"question", "sql"[, "id"]} per line."""
+    cases = []
+    with open(path or DEFAULT_GOLDEN_PATH) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                case = json.loads(line)
+                case.setdefault("id", f"case-{number}")
+                cases.append(case)
+    return cases
+
+def _normalize_value(value):
+    # 1 == 1.0 and float noise from SUM/AVG must not fail a case
+    if isinstance(value, float):
+        return round(value, 6) if not value.is_integer() else int(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+# --- Worker process side (plain sqlite3, no heavy imports) ---
+
+_worker_conn = None
+
+def _init_worker(db_path):
+    global _worker_conn
+    _worker_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+def _row_hash(row):
+    # Stable across worker processes and runs (cached references), unlike hash()
+    return int.from_bytes(hashlib.blake2b(repr(row).encode(), digest_size=8).digest(), "little")
+
+def _execute_case(sql):
+    """
+    Runs one query on the read-only copy: {rows, row_count, digest, truncated, elapsed, error}.
+    Every row is read: row_count and digest (sum of row hashes mod 2^64, an
+    order-independent multiset hash) cover the full result, while `rows` keeps
+    only the first MAX_COMPARED_ROWS (normalized, sorted) and `truncated` says so.
+    """
+    deadline = time.monotonic() + CASE_TIMEOUT_SECONDS
+    _worker_conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+    started = time.perf_counter()
+    try:
+        cursor = _worker_conn.execute(sql)
+        rows, row_count, digest = [], 0, 0
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH_ROWS)
+            if not batch:
+                break
+            for row in batch:
+                normalized = tuple(map(_normalize_value, row))
+                digest = (digest + _row_hash(normalized)) & 0xFFFFFFFFFFFFFFFF
+                if row_count < MAX_COMPARED_ROWS:
+                    rows.append(normalized)
+                row_count += 1
+        cursor.close()
+        return {
+            "rows": sorted(rows, key=repr), "row_count": row_count, "digest": digest,
+            "truncated": row_count > MAX_COMPARED_ROWS, "elapsed": time.perf_counter() - started, "error": None,
+        }
+    except Exception as e:
+        error = f"timeout after {CASE_TIMEOUT_SECONDS:g}s" if time.monotonic() > deadline else str(e)
+        return {"rows": [], "row_count": 0, "digest": None, "truncated": False, "elapsed": time.perf_counter() - started, "error": error}
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+def compare_results(candidate, reference):
+    """
+    Order-insensitive (multiset) comparison; returns (passed, reason, diff).
+    When either side has more than MAX_COMPARED_ROWS rows, the kept rows may be
+    different subsets, so the full-result row count and digest decide instead.
+    """
+    if candidate["error"]:
+        return False, f"candidate error: {candidate['error']}", None
+    if candidate["truncated"] or reference["truncated"]:
+        if candidate["row_count"] == reference["row_count"] and candidate["digest"] == reference["digest"]:
+            return True, "match (full-result digest)", None
+        diff = {"expected_rows": reference["row_count"], "actual_rows": candidate["row_count"]}
+        return False, "result mismatch (full-result digest)", diff
+    missing = Counter(map(tuple, reference["rows"])) - Counter(map(tuple, candidate["rows"]))
+    extra = Counter(map(tuple, candidate["rows"])) - Counter(map(tuple, reference["rows"]))
+    if not missing and not extra:
+        return True, "match", None
+    diff = {
+        "expected_rows": reference["row_count"],
+        "actual_rows": candidate["row_count"],
+        "missing": [list(row) for row in list(missing.elements())[:MAX_DIFF_ROWS]],
+        "extra": [list(row) for row in list(extra.elements())[:MAX_DIFF_ROWS]],
+    }
+    return False, "result mismatch", diff
+
+class RegressionHarness:
+    """
+    Execution-accuracy regression for a candidate model on a golden dataset:
+    1. generates candidate SQL for every question (`generation_concurrency` at a time)
+    2. executes candidate and reference SQL on a process pool against a
+       read-only snapshot of the SQLite database
+    3. compares result sets order-insensitively
+    Reference results are cached per (database data version, reference SQL).
+    """
+    def __init__(self, db_url, golden_path=None, cache_dir=None, generation_concurrency=4, execution_workers=None):
+        if make_url(db_url).get_backend_name() != "sqlite":
+            raise ValueError("The regression harness runs on a read-only SQLite snapshot; export other databases to SQLite first")
+        self.db_url = db_url
+        self.db_path = make_url(db_url).database
+        self.golden_path = golden_path or DEFAULT_GOLDEN_PATH
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.generation_concurrency = generation_concurrency
+        self.execution_workers = execution_workers or min(8, os.cpu_count() or 1)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _default_generator(self, model_candidate):
+        # Full retrieval + prompt path of the app (heavy: embeddings, ChromaDB), without a database
+        from src.components.executor import SQLAgent
+        agent = SQLAgent(db_url=None, model_path=model_candidate)
+        return agent.handle_query
+
+    def _cache_path(self, sql, data_version):
+        key = f"{RESULT_FORMAT}|{data_version}|{canonical_fingerprint(sql, 'sqlite') or sql}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _generate(self, cases, generate_fn):
+        def generate(case):
+            started = time.perf_counter()
+            try:
+                sql = generate_fn(case["question"])
+                if not isinstance(sql, str) or sql.startswith("["): # e.g. [Clarification Needed]
+                    sql, error = None, f"no SQL: {str(sql)[:200]}"
+                else:
+                    error = None
+            except Exception as e:
+                sql, error = None, str(e)
+            return sql, error, time.perf_counter() - started
+        with ThreadPoolExecutor(max_workers=self.generation_concurrency) as pool:
+            return list(pool.map(generate, cases))
+
+    def run(self, model_candidate, generate_fn=None, cases=None):
+        """Returns a report: accuracy, counts, latency percentiles and per-case results/diffs."""
+        cases = cases if cases is not None else load_golden_dataset(self.golden_path)
+        generate_fn = generate_fn or self._default_generator(model_candidate)
+        started = time.perf_counter()
+        generated = self._generate(cases, generate_fn)
+
+        data_version = sqlite_data_version(self.db_url)
+        references = {}
+        pending_references = []
+        for case in cases:
+            path = self._cache_path(case["sql"], data_version)
+            if os.path.exists(path):
+                with open(path) as f:
+                    references[case["id"]] = json.load(f)
+            else:
+                pending_references.append((case, path))
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            # Consistent snapshot via the backup API; workers open it read-only
+            snapshot_path = os.path.join(snapshot_dir, "snapshot.db")
+            source, target = sqlite3.connect(self.db_path), sqlite3.connect(snapshot_path)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            with ProcessPoolExecutor(max_workers=self.execution_workers, initializer=_init_worker, initargs=(snapshot_path,)) as pool:
+                reference_futures = [(case, path, pool.submit(_execute_case, case["sql"])) for case, path in pending_references]
+                candidate_futures = [pool.submit(_execute_case, sql) if sql else None for sql, _, _ in generated]
+                for case, path, future in reference_futures:
+                    result = references[case["id"]] = future.result()
+                    if not result["error"]:
+                        with open(path, "w") as f:
+                            json.dump(result, f)
+                candidates = [future.result() if future is not None else None for future in candidate_futures]
+
+        report_cases = []
+        for case, (sql, generation_error, generation_time), candidate in zip(cases, generated, candidates):
+            reference = references[case["id"]]
+            if reference["error"]:
+                passed, reason, diff = False, f"reference error: {reference['error']}", None
+            elif candidate is None:
+                passed, reason, diff = False, f"generation failed: {generation_error}", None
+            else:
+                passed, reason, diff = compare_results(candidate, reference)
+            report_cases.append({
+                "id": case["id"],
+                "question": case["question"],
+                "passed": passed,
+                "reason": reason,
+                "candidate_sql": sql,
+                "reference_sql": case["sql"],
+                "generation_seconds": generation_time,
+                "execution_seconds": candidate["elapsed"] if candidate else None,
+                "diff": diff,
+            })
+
+        passed = sum(case["passed"] for case in report_cases)
+        report = {
+            "model": model_candidate,
+            "cases": len(report_cases),
+            "passed": passed,
+            "accuracy": passed / len(report_cases) if report_cases else 0.0,
+            "reference_cache_hits": len(cases) - len(pending_references),
+            "latency": {
+                "generation": _percentiles([case["generation_seconds"] for case in report_cases]),
+                "execution": _percentiles([case["execution_seconds"] for case in report_cases if case["execution_seconds"] is not None]),
+            },
+            "total_seconds": time.perf_counter() - started,
+            "results": report_cases,
+        }
+        print(f"[Regression] {model_candidate}: {passed}/{len(report_cases)} passed ({report['accuracy']*100:.1f}%), "
+              f"generation p95 {report['latency']['generation']['p95']}s")
+        return report
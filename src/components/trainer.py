@@ -1,81 +1,256 @@
+import json
+import os
 import time
+import numpy as np
+from src.components.regression import RegressionHarness
+from src.llm.answer_cache import normalize_question
+from src.utils.dedup import NearDuplicateIndex
+from src.utils.feedback_log import get_feedback_log, locked_append
+from src.utils.safety import canonical_fingerprint
+
+SFT_INSTRUCTION = "Generate SQL for: {query}"
+MAX_CANDIDATES_PER_QUESTION = 4 # Chosen/rejected SQL kept per question for DPO pairing
 
 class SelfImprover:
-    def __init__(self):
+    """
+    Tails the feedback log (consumer "trainer", checkpointed offset) and exports:
+    - SFT examples (positive feedback) to `dataset_path`, deduplicated by
+      normalized question + SQL fingerprint and by MinHash near-duplicates
+    - DPO pairs (same question, one liked and one disliked SQL) to `dpo_path`
+    Both exports are appended batch by batch, so they stream to any size.
+    The dedup/pairing state (keys and MinHash signatures) is saved next to the
+    consumer checkpoint and committed with it every `checkpoint_batches`
+    batches, and when the log is drained at most every `checkpoint_seconds`
+    (the state is rewritten whole, so a trickle of feedback must not rewrite
+    it on every record), so a restart loads it instead of replaying the log. Delivery is at-least-once: a crash before a checkpoint
+    can repeat the lines exported since the last one.
+    """
+    def __init__(self, feedback_log=None, dataset_path="training_data.jsonl", dpo_path="dpo_pairs.jsonl",
+                 near_duplicate_threshold=0.85, batch_size=500, retrain_every=100,
+                 db_url=None, golden_path=None, min_accuracy=None, checkpoint_batches=20, checkpoint_seconds=None):
         # In a real scenario, this would interface with a training library like MLX or Unsloth
         # For this architecture, we focus on Data Collection -> Export
-        self.dataset_path = "training_data.jsonl"
+        self.dataset_path = dataset_path
+        self.dpo_path = dpo_path
+        self.feedback_log = feedback_log or get_feedback_log()
+        self.consumer = self.feedback_log.consumer("trainer")
+        self.state_path = os.path.join(self.feedback_log.directory, "consumers", "trainer.state.npz")
+        self.batch_size = batch_size
+        self.checkpoint_batches = checkpoint_batches
+        self.checkpoint_seconds = checkpoint_seconds if checkpoint_seconds is not None else float(os.getenv("TRAINER_CHECKPOINT_SECONDS", "60"))
+        self._uncommitted_batches = 0
+        self._last_checkpoint = time.monotonic()
+        self.retrain_every = retrain_every # New SFT examples before a fine-tune round
+        # Deployment gate: execution accuracy on the golden dataset (SQLite db_url)
+        self.db_url = db_url
+        self.golden_path = golden_path
+        self.min_accuracy = min_accuracy if min_accuracy is not None else float(os.getenv("REGRESSION_MIN_ACCURACY", "0.9"))
+        self.last_regression_report = None
+        self.counters = {"records": 0, "examples": 0, "exact_duplicates": 0, "near_duplicates": 0, "pairs": 0, "skipped": 0}
+
+        # Dedup/pairing state, loaded from `state_path` on start (see warm_start)
+        self._seen = set() # (question key, SQL fingerprint)
+        self._near_duplicates = NearDuplicateIndex(threshold=near_duplicate_threshold)
+        self._chosen = {} # question key -> [(SQL fingerprint, sql)]
+        self._rejected = {}
+        self._pairs = set() # (question key, chosen fingerprint, rejected fingerprint)
+        self._warm = False
+
+    def _sql_key(self, sql):
+        return canonical_fingerprint(sql) or " ".join(sql.lower().split())
+
+    def ingest(self, records, export=True):
+        """Dedups/pairs feedback records; appends new examples and pairs to the exports. Returns new SFT examples."""
+        sft_lines, dpo_lines = [], []
+        for record in records:
+            self.counters["records"] += 1
+            query, sql, rating = record.get("query"), record.get("sql"), record.get("rating") or 0
+            if not query or not sql or "-- Error:" in sql:
+                self.counters["skipped"] += 1
+                continue
+            question_key = normalize_question(query)
+            sql_key = self._sql_key(sql)
+            instruction = SFT_INSTRUCTION.format(query=query)
+
+            if rating > 0.5:
+                if self._add_example(question_key, sql_key, sql):
+                    # Alpaca-style format or similar
+                    sft_lines.append(json.dumps({"instruction": instruction, "input": "", "output": sql, "score": rating}))
+                pairs = [((sql_key, sql), rejected) for rejected in self._rejected.get(question_key, [])]
+                self._remember(self._chosen, question_key, sql_key, sql)
+            else:
+                pairs = [(chosen, (sql_key, sql)) for chosen in self._chosen.get(question_key, [])]
+                self._remember(self._rejected, question_key, sql_key, sql)
+
+            for (chosen_key, chosen_sql), (rejected_key, rejected_sql) in pairs:
+                pair_key = (question_key, chosen_key, rejected_key)
+                if chosen_key == rejected_key or pair_key in self._pairs:
+                    continue # Same SQL rated both ways, or already exported
+                self._pairs.add(pair_key)
+                self.counters["pairs"] += 1
+                dpo_lines.append(json.dumps({"prompt": instruction, "chosen": chosen_sql, "rejected": rejected_sql}))
+
+        if export:
+            if sft_lines:
+                locked_append(self.dataset_path, sft_lines)
+                print(f"[SelfImprover] Saved {len(sft_lines)} new training examples to {self.dataset_path}")
+            if dpo_lines:
+                locked_append(self.dpo_path, dpo_lines)
+        return len(sft_lines)
+
+    def _add_example(self, question_key, sql_key, sql):
+        if (question_key, sql_key) in self._seen:
+            self.counters["exact_duplicates"] += 1
+            return False
+        self._seen.add((question_key, sql_key))
+        if self._near_duplicates.add((question_key, sql_key), f"{question_key} {sql}") is not None:
+            self.counters["near_duplicates"] += 1
+            return False
+        self.counters["examples"] += 1
+        return True
+
+    def _remember(self, candidates, question_key, sql_key, sql):
+        entries = candidates.setdefault(question_key, [])
+        if all(key != sql_key for key, _ in entries) and len(entries) < MAX_CANDIDATES_PER_QUESTION:
+            entries.append((sql_key, sql))
 
     def save_training_data(self, query, sql, feedback_score):
         """
         Refinement: Save verified interaction to JSONL for fine-tuning.
+        Goes through the same dedup/pairing as logged feedback.
         """
-        import json
-        
-        # Alpaca-style format or similar
-        entry = {
-            "instruction": f"Generate SQL for: {query}",
-            "input": "", # Context could go here
-            "output": sql,
-            "score": feedback_score # 1.0 (Good) or 0.0 (Bad)
+        return self.ingest([{"query": query, "sql": sql, "rating": feedback_score}])
+
+    def _save_state(self, offset):
+        """Writes the dedup/pairing state as of `offset` (atomically, before the offset is committed)."""
+        ids, signatures = self._near_duplicates.items()
+        state = {
+            "offset": offset,
+            "seen": sorted(self._seen),
+            "chosen": self._chosen,
+            "rejected": self._rejected,
+            "pairs": sorted(self._pairs),
+            "signature_ids": ids,
         }
-        
-        # Only save positive examples for SFT (Supervised Fine-Tuning)
-        # For DPO, we would save (prompt, chosen, rejected)
-        if feedback_score > 0.5:
-            with open(self.dataset_path, "a") as f:
-                f.write(json.dumps(entry) + "\n")
-            print(f"[SelfImprover] Saved new training example to {self.dataset_path}")
-
-    def run_regression_tests(self, model_candidate):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, state=np.array(json.dumps(state)), signatures=signatures)
+            f.flush()
+            if self.feedback_log.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _load_state(self):
+        """Loads the saved state; returns the offset it covers (0 when there is none)."""
+        try:
+            with np.load(self.state_path) as data:
+                state = json.loads(str(data["state"]))
+                signatures = data["signatures"]
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"[SelfImprover] Ignoring unreadable state {self.state_path}: {e}")
+            return 0
+        self._seen = {tuple(key) for key in state["seen"]}
+        self._chosen = {key: [tuple(entry) for entry in entries] for key, entries in state["chosen"].items()}
+        self._rejected = {key: [tuple(entry) for entry in entries] for key, entries in state["rejected"].items()}
+        self._pairs = {tuple(key) for key in state["pairs"]}
+        self._near_duplicates.restore([tuple(item_id) for item_id in state["signature_ids"]], signatures)
+        return state["offset"]
+
+    def warm_start(self):
+        """Loads the dedup/pairing state saved with the checkpoint; replays the log only for records it lacks."""
+        if self._warm:
+            return
+        self._warm = True
+        state_offset = self._load_state()
+        committed = self.consumer.committed
+        if state_offset > committed:
+            # Stopped between saving the state and committing: the state already covers these records
+            self.consumer.position = state_offset
+            self.consumer.commit()
+        elif state_offset < committed:
+            # No (or an older) state file: replay the gap once (no export) and save it
+            replay = self.feedback_log.consumer("trainer")
+            replay.position = state_offset
+            first = True
+            while replay.position < committed:
+                records = replay.poll(self.batch_size)
+                if not records:
+                    break
+                if first and records[0]["offset"] > state_offset:
+                    print(f"[SelfImprover] Offsets {state_offset}-{records[0]['offset']} were compacted away; their dedup state is lost")
+                first = False
+                self.ingest([record for record in records if record["offset"] < committed], export=False)
+            self._save_state(committed)
+        print(f"[SelfImprover] Loaded state up to offset {self.consumer.committed}: {len(self._seen)} examples known")
+
+    def checkpoint(self):
+        """Saves the dedup/pairing state, then commits the consumer position it covers."""
+        self._save_state(self.consumer.position)
+        self.consumer.commit()
+        self._uncommitted_batches = 0
+        self._last_checkpoint = time.monotonic()
+
+    def poll_once(self):
+        """Ingests one batch from the checkpoint (checkpointing periodically and when drained). Returns (records, new SFT examples)."""
+        self.warm_start()
+        records = self.consumer.poll(self.batch_size)
+        if not records:
+            if self._uncommitted_batches and time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+                self.checkpoint()
+            return 0, 0
+        new_examples = self.ingest(records)
+        self._uncommitted_batches += 1
+        if self._uncommitted_batches >= self.checkpoint_batches:
+            self.checkpoint()
+        return len(records), new_examples
+
+    def run_regression_tests(self, model_candidate, generate_fn=None):
         """
         Refinement 3: Regression Testing (Golden Dataset).
-        Prevents Catastrophic Forgetting by verifying standard queries.
+        Prevents Catastrophic Forgetting: the candidate's SQL must return the same
+        results as the reference SQL on at least `min_accuracy` of the cases.
+        The full report is kept in `last_regression_report`.
         """
-        golden_dataset = [
-            {"query": "Select all users", "expected_sql_fragment": "SELECT * FROM users"},
-            {"query": "Count orders", "expected_sql_fragment": "COUNT"}
-        ]
-        
+        if self.db_url is None:
+            print("[SelfImprover] No database configured for regression tests. Blocking deployment.")
+            return False
+        harness = RegressionHarness(self.db_url, golden_path=self.golden_path)
+        if not os.path.exists(harness.golden_path):
+            print(f"[SelfImprover] Golden dataset {harness.golden_path} not found. Blocking deployment.")
+            return False
+
         print("[SelfImprover] Running regression tests on candidate model...")
-        passed = 0
-        for case in golden_dataset:
-            # Mock generation using candidate
-            generated_sql = "SELECT * FROM users" # Mock
-            if case['expected_sql_fragment'] in generated_sql:
-                passed += 1
-                
-        accuracy = passed / len(golden_dataset)
-        print(f"[SelfImprover] Regression Test Accuracy: {accuracy*100}%")
-        return accuracy == 1.0
-
-    def run(self):
+        self.last_regression_report = harness.run(model_candidate, generate_fn=generate_fn)
+        accuracy = self.last_regression_report["accuracy"]
+        print(f"[SelfImprover] Regression Test Accuracy: {accuracy*100:.1f}% (required {self.min_accuracy*100:.1f}%)")
+        return accuracy >= self.min_accuracy
+
+    def run(self, stop_event=None, wait_seconds=30):
+        """Event-driven loop: drains new feedback, then sleeps until the log grows."""
         print("Starting Self-Improvement Loop...")
-        while True:
-            # 1. Fetch Traces
-            # In a real app, agl.store.get_traces(feedback="thumbs_up")
-            print("[SelfImprover] Checking for new high-quality traces...")
-            
-            # Simulate finding some traces
-            found_traces = False 
-            
-            if found_traces:
-                 print("[SelfImprover] Found 5 verified traces. Converting to Training Data...")
-                 
-                 # Simulating data save
-                 for t in ["SELECT * FROM users", "SELECT count(*) FROM orders"]:
-                     self.save_training_data("Sample query", t, 1.0)
-                 
-                 # 3. Regression Test (Refinement 3)
-                 if self.run_regression_tests("new_weights_v2"):
-                     # 4. Update Model Weights
-                     # self.agent.update_weights(new_weights)
-                     print("[SelfImprover] Model optimized & verified! Deployed version v1.0.X")
-                 else:
-                     print("[SelfImprover] Regression test failed. Discarding update.")
-
-            
-            # Sleep to simulate periodic/nightly job
-            time.sleep(60)
- 
+        pending = 0
+        while stop_event is None or not stop_event.is_set():
+            # 1. Fetch feedback since the checkpoint
+            records, new_examples = self.poll_once()
+            pending += new_examples
+            if records:
+                continue # Keep draining before training
+
+            if pending >= self.retrain_every:
+                print(f"[SelfImprover] Found {pending} new verified examples. Fine-tuning candidate...")
+                pending = 0
+
+                # 3. Regression Test (Refinement 3)
+                if self.run_regression_tests("new_weights_v2"):
+                    # 4. Update Model Weights
+                    # self.agent.update_weights(new_weights)
+                    print("[SelfImprover] Model optimized & verified! Deployed version v1.0.X")
+                else:
+                    print("[SelfImprover] Regression test failed. Discarding update.")
+
+            # Wake on new data instead of a fixed sleep
+            self.feedback_log.wait_for_data(self.consumer.position, timeout=wait_seconds)
 
+        if self._uncommitted_batches:
+            self.checkpoint() # Don't leave a throttled checkpoint behind on shutdown
@@ -2,18 +2,39 @@ import streamlit as st
 import time
 import sys
 import os
+import numpy as np
 
 # Ensure project root is in python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 # Mock imports to run standalone or within Lightning
 from src.components.executor import SQLAgent
+from src.llm.engine import extract_sql
 
 # Initialize Agent (Cache resource to emulate shared state/hot-swap)
 @st.cache_resource
 def get_agent(auto_audit=False):
     return SQLAgent(db_url="sqlite:///test_data.db", model_path="llama3:8b", auto_audit=auto_audit)
 
+def load_more_rows(agent, msg):
+    """Appends the next page of a streamed result to a chat message."""
+    page = agent.fetch_page(msg["result_id"])
+    if page is None:
+        msg["result_id"] = None
+        return
+    msg["data"] = {name: np.concatenate([values, page["data"][name]]) for name, values in msg["data"].items()}
+    msg["truncated"] = page["truncated"]
+    msg["truncation_reason"] = page["truncation_reason"]
+    if not page["has_more"]:
+        msg["result_id"] = None
+
+def show_result_status(msg):
+    rows = len(next(iter(msg["data"].values()), []))
+    if msg.get("truncated"):
+        st.caption(f"Showing {rows} rows. Result truncated by the {msg['truncation_reason']} budget.")
+    elif msg.get("result_id"):
+        st.caption(f"Showing the first {rows} rows.")
+
 def main():
     st.set_page_config(page_title="EvoSQL-Lightning", layout="wide")
     st.title("⚡ EvoSQL-Lightning")
@@ -32,7 +53,7 @@ def main():
     agent = get_agent(auto_audit=auto_audit)
 
     # Chat Interface
-    for msg in st.session_state.messages:
+    for i, msg in enumerate(st.session_state.messages):
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
             if "sql" in msg:
@@ -40,7 +61,10 @@ def main():
             if "explanation" in msg:
                 st.info(msg["explanation"])
             if "data" in msg:
+                 if msg.get("result_id") and st.button("Load more rows", key=f"more_{i}"):
+                     load_more_rows(agent, msg)
                  st.dataframe(msg["data"])
+                 show_result_status(msg)
 
     if prompt := st.chat_input("Ask about your data..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
@@ -49,7 +73,14 @@ def main():
 
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response = agent.handle_query(prompt)
+                # Partial SQL is shown while the model is still generating
+                sql_preview = st.empty()
+                partial = []
+                def show_partial_sql(token):
+                    partial.append(token)
+                    sql_preview.code(extract_sql("".join(partial)), language="sql")
+                response = agent.handle_query(prompt, on_sql_token=show_partial_sql)
+                sql_preview.empty()
                 
                 # Check outcome types
                 if isinstance(response, dict):
@@ -60,14 +91,18 @@ def main():
                     st.info(response['explanation'])
                     st.dataframe(response['data'])
                     
-                    # Store in history
+                    # Store in history (further pages are loaded from there)
                     st.session_state.messages.append({
                         "role": "assistant",
                         "content": content,
                         "sql": response['sql'],
                         "explanation": response['explanation'],
-                        "data": response['data']
+                        "data": response['data'],
+                        "result_id": response['result_id'],
+                        "truncated": response['truncated'],
+                        "truncation_reason": response['truncation_reason']
                     })
+                    show_result_status(st.session_state.messages[-1])
                     
                     # Refinement 5: Feedback UI
                     col1, col2 = st.columns(2)
@@ -0,0 +1,134 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+def normalize_question(question):
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    text_value = re.sub(r"\s+", " ", question.strip().lower())
+    return text_value.rstrip(" ?!.;")
+
+# Numbers and quoted strings of a question ("top 5", "'Spain'"): they change the SQL
+LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?")
+
+def question_literals(question):
+    """Numeric and quoted literals of a question, in order."""
+    return tuple(LITERAL_RE.findall(normalize_question(question)))
+
+class AnswerCache:
+    """
+    NL -> SQL cache placed in front of retrieval + generation.
+
+    Tier 1: exact match on the normalized question.
+    Tier 2 (optional): cosine similarity of question embeddings, for paraphrases.
+    A paraphrase only matches when its numeric and quoted literals are the same
+    ("top 5 customers" never reuses the SQL of "top 10 customers").
+
+    Entries are only valid for the catalog version they were created with;
+    when the version changes (SchemaDiscovery re-indexed) the cache clears itself.
+    max_entries=0 disables the cache (every lookup is a miss, nothing is embedded).
+    """
+    def __init__(self, max_entries=512, ttl_seconds=3600, embed_fn=None, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed_fn = embed_fn # e.g. SemanticStore.embed_queries (embeds the raw question, like retrieval)
+        self.similarity_threshold = similarity_threshold
+
+        self._entries = OrderedDict() # normalized question -> (sql, created_at, embedding, literals)
+        self._catalog_version = None
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _embed(self, text_value):
+        if self.embed_fn is None or self.similarity_threshold is None:
+            return None
+        vector = np.asarray(self.embed_fn([text_value])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_version(self, catalog_version):
+        # Caller holds the lock
+        if catalog_version != self._catalog_version:
+            if self._entries:
+                self.counters["invalidations"] += 1
+            self._entries.clear()
+            self._catalog_version = catalog_version
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, question, catalog_version):
+        """Returns cached SQL for the question, or None."""
+        if self.max_entries <= 0:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._sync_version(catalog_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry[1], now):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.counters["exact_hits"] += 1
+                    return entry[0]
+
+        # Semantic tier (embedding computed outside the lock; the raw question is
+        # the text retrieval embeds, so a miss reuses this embedding)
+        query_vec = self._embed(question)
+        literals = question_literals(question)
+        if query_vec is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        with self._lock:
+            if catalog_version != self._catalog_version:
+                self.counters["misses"] += 1
+                return None
+            best_key, best_score = None, -1.0
+            for cached_key, (sql, created_at, vec, cached_literals) in list(self._entries.items()):
+                if self._expired(created_at, now):
+                    del self._entries[cached_key]
+                    continue
+                if vec is None or cached_literals != literals:
+                    continue
+                score = float(np.dot(query_vec, vec))
+                if score > best_score:
+                    best_key, best_score = cached_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.counters["semantic_hits"] += 1
+                return self._entries[best_key][0]
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, question, catalog_version, sql):
+        if self.max_entries <= 0:
+            return
+        key = normalize_question(question)
+        vec = self._embed(question)
+        with self._lock:
+            self._sync_version(catalog_version)
+            self._entries[key] = (sql, time.time(), vec, question_literals(question))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+import httpx
+import ollama
+
+# Lower value = served first when the backend is saturated
+PRIORITY_GENERATION = 0 # User-facing SQL generation
+PRIORITY_EXPLANATION = 1
+PRIORITY_AUDIT = 2
+PRIORITY_NAMES = {
+    PRIORITY_GENERATION: "generation",
+    PRIORITY_EXPLANATION: "explanation",
+    PRIORITY_AUDIT: "audit",
+}
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+class _PriorityLimiter:
+    """asyncio semaphore whose waiters are admitted by (priority, arrival order)."""
+    def __init__(self, slots):
+        self.slots = slots
+        self.active = 0
+        self._waiters = [] # Heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.max_depth = {} # priority -> deepest queue seen
+
+    async def acquire(self, priority, ticket=None):
+        """ticket: optional dict that receives the waiter entry, so promote() can reach it."""
+        if self.active < self.slots and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        if ticket is not None:
+            ticket["entry"] = entry
+        heapq.heappush(self._waiters, entry)
+        self.max_depth[priority] = max(self.max_depth.get(priority, 0), self.depth(priority))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # The slot was handed over just before the cancel
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def promote(self, entry, priority):
+        """Raises a queued waiter to `priority` (keeping its arrival order); no-op once admitted."""
+        if entry is None or entry[0] <= priority or entry[2].done():
+            return
+        entry[0] = priority
+        heapq.heapify(self._waiters)
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None) # Hand the slot over; `active` is unchanged
+                return
+        self.active -= 1
+
+    def depth(self, priority):
+        return sum(1 for entry in self._waiters if entry[0] == priority and not entry[2].done())
+
+class _PriorityStats:
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.queue_wait = deque(maxlen=window) # Seconds from submit to admission
+        self.latency = deque(maxlen=window) # Seconds from submit to completion
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+_DONE = object()
+
+class _StreamHandle:
+    """Sync iterator over the chunks of a streaming request; close() cancels it."""
+    def __init__(self, client, model, prompt, priority, kwargs):
+        self._chunks = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(
+            client._stream(model, prompt, priority, kwargs, self._chunks.put), client._loop
+        )
+        self._future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        error = None if future.cancelled() else future.exception()
+        self._chunks.put(error if error is not None else _DONE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self._chunks.get()
+        if item is _DONE:
+            raise StopIteration
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self):
+        self._future.cancel() # Cancels the request on the client loop (closes the HTTP stream)
+
+class LLMClient:
+    """
+    Shared Ollama client for every LLMEngine in the process:
+    - one background event loop with a pooled ollama.AsyncClient (httpx keep-alive)
+    - a global concurrency limit whose queue is served by priority
+      (generation ahead of explanation ahead of auditing)
+    - coalescing of identical in-flight non-streaming prompts; a caller with a
+      higher priority promotes the shared request, so it never waits behind
+      an audit's admission
+    - per-priority latency / queue-depth metrics (see stats())
+    Callable from any thread; sync callers block, async callers use agenerate().
+    """
+    def __init__(self, host=None, max_concurrency=None, timeout=120.0):
+        self.host = host
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self._limiter = _PriorityLimiter(self.max_concurrency)
+        self._inflight = {} # Coalescing key -> (asyncio.Task, admission ticket) (loop thread only)
+        self._stats = {priority: _PriorityStats() for priority in PRIORITY_NAMES}
+        self._stats_lock = threading.Lock()
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True).start()
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self._client = self._run(self._make_client(host, timeout, limits)).result()
+
+    @staticmethod
+    async def _make_client(host, timeout, limits):
+        return ollama.AsyncClient(host=host, timeout=timeout, limits=limits)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def submit(self, model, prompt, priority=PRIORITY_GENERATION, **kwargs):
+        """Schedules a non-streaming generate; returns a concurrent.futures.Future."""
+        return self._run(self._generate(model, prompt, priority, kwargs))
+
+    def generate(self, model, prompt, priority=PRIORITY_GENERATION, **kwargs):
+        """Blocking non-streaming generate; returns the Ollama response."""
+        return self.submit(model, prompt, priority, **kwargs).result()
+
+    async def agenerate(self, model, prompt, priority=PRIORITY_GENERATION, **kwargs):
+        """Non-streaming generate awaitable from any event loop."""
+        return await asyncio.wrap_future(self.submit(model, prompt, priority, **kwargs))
+
+    def generate_stream(self, model, prompt, priority=PRIORITY_GENERATION, **kwargs):
+        """Streaming generate for sync callers: an iterator of chunks with close()."""
+        return _StreamHandle(self, model, prompt, priority, kwargs)
+
+    async def _generate(self, model, prompt, priority, kwargs):
+        key = json.dumps([model, prompt, kwargs], sort_keys=True, default=str)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Identical prompt already in flight: share its response
+            task, ticket = inflight
+            with self._stats_lock:
+                self._stats[priority].coalesced += 1
+            if priority < ticket["priority"]:
+                # Admit the shared request at the most urgent of its callers' priorities
+                ticket["priority"] = priority
+                self._limiter.promote(ticket["entry"], priority)
+            return await asyncio.shield(task)
+        ticket = {"priority": priority, "entry": None}
+        task = asyncio.ensure_future(self._call(model, prompt, priority, kwargs, ticket))
+        self._inflight[key] = (task, ticket)
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _call(self, model, prompt, priority, kwargs, ticket=None):
+        queued = self._admit(priority)
+        # A caller that joined before this task started already raised ticket["priority"]
+        await self._limiter.acquire(ticket["priority"] if ticket else priority, ticket)
+        admitted = time.perf_counter()
+        failed = False
+        try:
+            return await self._client.generate(model=model, prompt=prompt, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._limiter.release()
+            self._record(priority, queued, admitted, failed)
+
+    async def _stream(self, model, prompt, priority, kwargs, emit):
+        queued = self._admit(priority)
+        await self._limiter.acquire(priority)
+        admitted = time.perf_counter()
+        failed = False
+        stream = None
+        try:
+            stream = await self._client.generate(model=model, prompt=prompt, stream=True, **kwargs)
+            async for chunk in stream:
+                emit(chunk)
+        except asyncio.CancelledError:
+            raise # Early stop by the consumer, not an error
+        except Exception:
+            failed = True
+            raise
+        finally:
+            try:
+                if stream is not None:
+                    await stream.aclose()
+            finally:
+                self._limiter.release()
+                self._record(priority, queued, admitted, failed)
+
+    def _admit(self, priority):
+        with self._stats_lock:
+            self._stats[priority].requests += 1
+        return time.perf_counter()
+
+    def _record(self, priority, queued, admitted, failed):
+        with self._stats_lock:
+            stats = self._stats[priority]
+            stats.queue_wait.append(admitted - queued)
+            stats.latency.append(time.perf_counter() - queued)
+            if failed:
+                stats.errors += 1
+
+    def stats(self):
+        """Per-priority counters, current/max queue depth and p50/p95 queue wait and latency (seconds)."""
+        report = {"max_concurrency": self.max_concurrency, "active": self._limiter.active, "priorities": {}}
+        with self._stats_lock:
+            for priority, stats in self._stats.items():
+                report["priorities"][PRIORITY_NAMES[priority]] = {
+                    "requests": stats.requests,
+                    "coalesced": stats.coalesced,
+                    "errors": stats.errors,
+                    "queue_depth": self._limiter.depth(priority),
+                    "max_queue_depth": self._limiter.max_depth.get(priority, 0),
+                    "queue_wait_p50": _percentile(stats.queue_wait, 0.50),
+                    "queue_wait_p95": _percentile(stats.queue_wait, 0.95),
+                    "latency_p50": _percentile(stats.latency, 0.50),
+                    "latency_p95": _percentile(stats.latency, 0.95),
+                }
+        return report
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm_client(host=None):
+    """Returns the process-wide LLMClient for an Ollama host (None = OLLAMA_HOST / localhost)."""
+    client = _clients.get(host)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = LLMClient(host=host)
+            _clients[host] = client
+        return client
@@ -1,5 +1,170 @@
 import os
-import ollama
+import re
+import time
+from src.llm.client import PRIORITY_AUDIT, PRIORITY_GENERATION, get_llm_client
+
+MOCK_SQL = "SELECT * FROM mock_table LIMIT 10;"
+
+# Where the SQL statement starts in model output that may open with prose/fences
+SQL_START_PATTERN = re.compile(r"\b(SELECT|WITH|INSERT|UPDATE|DELETE|PRAGMA|EXPLAIN|CREATE|VALUES)\b", re.IGNORECASE)
+FENCE_PATTERN = re.compile(r"```[A-Za-z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+class SQLStatementScanner:
+    """
+    Incremental scanner over streamed model output that detects the end of the
+    first SQL statement: a ';' or a code fence outside string literals, quoted
+    identifiers and comments, or any configured stop string.
+    """
+    def __init__(self, stop=None, detect_sql=True):
+        self.text = ""
+        self.stop = [s for s in (stop or []) if s]
+        self.detect_sql = detect_sql
+        self.start = None # Offset where the SQL statement begins
+        self.end = None # Offset just past the statement once complete
+        self.reason = None # "semicolon", "fence" or "stop"
+        self._pos = 0
+        self._quote = None # Open ', ", `, -- or /* context
+
+    def feed(self, token):
+        """Appends a token; returns True once the statement is complete."""
+        if self.end is not None:
+            return True
+        window_start = len(self.text)
+        self.text += token
+        for stop in self.stop:
+            index = self.text.find(stop, max(0, window_start - len(stop) + 1))
+            if index != -1:
+                self.end, self.reason = index, "stop"
+                return True
+        if not self.detect_sql:
+            return False
+        if self.start is None:
+            match = SQL_START_PATTERN.search(self.text)
+            if match is None:
+                return False
+            self.start = self._pos = match.start()
+        return self._scan()
+
+    def _scan(self):
+        text = self.text
+        n = len(text)
+        i = self._pos
+        while i < n:
+            ch = text[i]
+            quote = self._quote
+            if quote is None:
+                if ch == "`":
+                    if text.startswith("```", i):
+                        self.end, self.reason = i, "fence"
+                        return True
+                    if text[i:] == "`" * (n - i):
+                        break # Possibly a fence split across tokens
+                    self._quote = "`"
+                elif ch in "'\"":
+                    self._quote = ch
+                elif ch == ";":
+                    self.end, self.reason = i + 1, "semicolon"
+                    return True
+                elif text.startswith("--", i) or text.startswith("/*", i):
+                    self._quote = text[i:i + 2]
+                    i += 1
+                elif ch in "-/" and i == n - 1:
+                    break # Possibly a comment split across tokens
+            elif quote == "--":
+                if ch == "\n":
+                    self._quote = None
+            elif quote == "/*":
+                if text.startswith("*/", i):
+                    self._quote = None
+                    i += 1
+                elif ch == "*" and i == n - 1:
+                    break
+            elif ch == quote:
+                self._quote = None # A doubled quote ('') simply re-opens on the next char
+            i += 1
+        self._pos = i
+        return False
+
+def extract_sql(text):
+    """Strips code fences and surrounding prose; keeps the first statement (with its ';')."""
+    fenced = FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1)
+    scanner = SQLStatementScanner()
+    scanner.feed(text)
+    if scanner.start is None:
+        return text.strip()
+    return text[scanner.start:scanner.end].strip()
+
+class TokenStream:
+    """
+    Iterator over generated text chunks. In SQL mode, iteration stops as soon
+    as a complete statement was seen and the HTTP stream is closed, so Ollama
+    stops decoding. After iteration: `text`, `sql` and `metrics`
+    (ttft, tokens, tokens_per_sec, total_time, stop_reason).
+    """
+    def __init__(self, chunks, stop=None, sql_mode=True, started=None):
+        self._chunks = chunks
+        self.scanner = SQLStatementScanner(stop=stop, detect_sql=sql_mode)
+        self.started = started or time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.tokens = 0
+        self.stop_reason = None
+        self.error = None
+
+    def __iter__(self):
+        try:
+            for chunk in self._chunks:
+                if chunk.get('done'):
+                    self.stop_reason = chunk.get('done_reason') or "done"
+                token = chunk.get('response', '')
+                if not token:
+                    continue
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.tokens += 1
+                complete = self.scanner.feed(token)
+                yield token
+                if complete:
+                    self.stop_reason = self.scanner.reason
+                    break
+        except Exception as e:
+            print(f"Generation Error (Ollama): {e}")
+            self.error = e
+            self.stop_reason = "error"
+        finally:
+            close = getattr(self._chunks, "close", None)
+            if close:
+                close() # Drops the HTTP stream on early stop
+            self.finished_at = time.perf_counter()
+
+    @property
+    def text(self):
+        return self.scanner.text
+
+    @property
+    def sql(self):
+        if self.error is not None:
+            return f"SELECT * FROM error_log; -- Error: {str(self.error)}"
+        text = self.text if self.scanner.end is None else self.text[:self.scanner.end]
+        return extract_sql(text)
+
+    @property
+    def metrics(self):
+        finished = self.finished_at or time.perf_counter()
+        decode_time = finished - self.first_token_at if self.first_token_at else 0.0
+        return {
+            "ttft": self.first_token_at - self.started if self.first_token_at else None,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens / decode_time if decode_time > 0 else None,
+            "total_time": finished - self.started,
+            "stop_reason": self.stop_reason
+        }
+
+def _report_warmup(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Prompt prefix warm-up failed: {future.exception()}")
 
 class LLMEngine:
     def __init__(self, model_version="phi3"):
@@ -9,39 +174,106 @@ class LLMEngine:
         # Support for Remote Ollama (e.g. via Ngrok)
         self.base_url = os.getenv("OLLAMA_BASE_URL")
         self.client = None
+        # Keeps the model (and its prompt KV cache) loaded between requests
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self._warm_prefixes = set()
 
         try:
+            # Engines share one concurrency-limited client per host (see src.llm.client)
             if self.base_url:
                 print(f"Initializing LLM Engine with Remote Ollama at: {self.base_url}")
-                self.client = ollama.Client(host=self.base_url)
+                self.client = get_llm_client(self.base_url)
             else:
                 print(f"Initializing LLM Engine with Local Ollama model: {self.model_version}")
-                self.client = ollama.Client() # Defaults to localhost:11434
+                self.client = get_llm_client() # Defaults to localhost:11434
             
             # Lightweight check - we don't block heavily here to allow lazy connection
         except Exception as e:
             print(f"Ollama check failed: {e}. Defaulting to Mock Mode.")
             self.is_mock = True
 
-    def generate(self, prompt, stop=None, max_tokens=256):
+    def generate(self, prompt, stop=None, max_tokens=256, priority=PRIORITY_GENERATION):
         if self.is_mock:
              print(f"[MockLLM] Prompt length: {len(prompt)}")
-             return "SELECT * FROM mock_table LIMIT 10;"
+             return MOCK_SQL
 
         try:
-            # Ollama Python client usage via instance
+            # Shared client: queued by priority, identical in-flight prompts coalesced
             response = self.client.generate(
-                model=self.model_version,
-                prompt=prompt,
-                options={
-                    "num_predict": max_tokens,
-                    "temperature": 0.1,
-                    # "stop": stop or ["\n\n"] 
-                }
+                self.model_version,
+                prompt,
+                priority=priority,
+                options=self._options(stop, max_tokens),
+                keep_alive=self.keep_alive
             )
             return response['response'].strip()
         except Exception as e:
             print(f"Generation Error (Ollama): {e}")
             return f"SELECT * FROM error_log; -- Error: {str(e)}"
 
+    def _options(self, stop, max_tokens):
+        options = {
+            "num_predict": max_tokens,
+            "temperature": 0.1,
+        }
+        if stop:
+            options["stop"] = list(stop) # Server-side stop sequences
+        return options
+
+    def warm_prefix(self, prefix):
+        """
+        Fire-and-forget, lowest priority: evaluates a stable prompt prefix once
+        (e.g. per catalog version) so the server's prompt cache already holds it
+        when the first real request arrives. Returns the future, or None.
+        """
+        if self.is_mock or prefix in self._warm_prefixes:
+            return None
+        if len(self._warm_prefixes) >= 64:
+            self._warm_prefixes.clear() # Old catalog versions
+        self._warm_prefixes.add(prefix)
+        future = self.client.submit(
+            self.model_version,
+            prefix,
+            priority=PRIORITY_AUDIT,
+            options=self._options(None, 1),
+            keep_alive=self.keep_alive
+        )
+        future.add_done_callback(_report_warmup)
+        return future
+
+    def generate_stream(self, prompt, stop=None, max_tokens=256, sql_mode=True, priority=PRIORITY_GENERATION):
+        """
+        Streaming generation. Returns a TokenStream yielding text chunks as they
+        arrive; with sql_mode it ends at the first complete SQL statement
+        (terminating ';', closing code fence) or any string in `stop`.
+        """
+        started = time.perf_counter()
+        if self.is_mock:
+            print(f"[MockLLM] Prompt length: {len(prompt)}")
+            chunks = iter([{"response": token} for token in re.findall(r"\S+\s*", MOCK_SQL)])
+        else:
+            chunks = self.client.generate_stream(
+                self.model_version,
+                prompt,
+                priority=priority,
+                options=self._options(stop, max_tokens),
+                keep_alive=self.keep_alive
+            )
+        return TokenStream(chunks, stop=stop, sql_mode=sql_mode, started=started)
+
+    def generate_sql(self, prompt, stop=None, max_tokens=256, on_token=None):
+        """
+        Streams a SQL generation, calling on_token(token) for partial output.
+        Returns (sql, metrics): the first statement without fences/prose, plus
+        time-to-first-token and tokens/sec (see TokenStream.metrics).
+        """
+        stream = self.generate_stream(prompt, stop=stop, max_tokens=max_tokens)
+        for token in stream:
+            if on_token:
+                on_token(token)
+        metrics = stream.metrics
+        if metrics["ttft"] is not None:
+            print(f"[LLM] TTFT {metrics['ttft']:.2f}s, {metrics['tokens']} tokens, stop: {metrics['stop_reason']}")
+        return stream.sql, metrics
+
 
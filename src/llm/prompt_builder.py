@@ -0,0 +1,76 @@
+import re
+from src.llm.prompts import (
+    AUDIT_INSTRUCTIONS, AUDIT_PROMPT, CATALOG_OVERVIEW, EXPLAIN_SQL_PROMPT,
+    GENERATE_SQL_PROMPT, GRAPH_HINTS_BLOCK, SCHEMA_BLOCK, SQL_INSTRUCTIONS, SYSTEM_PROMPT
+)
+
+DIALECT_NAMES = {
+    "sqlite": "SQLite",
+    "postgresql": "PostgreSQL",
+    "mysql": "MySQL",
+    "mariadb": "MariaDB",
+    "mssql": "SQL Server",
+    "oracle": "Oracle",
+    "duckdb": "DuckDB",
+    "snowflake": "Snowflake",
+    "bigquery": "BigQuery",
+}
+
+_TOKEN_ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    """Rough BPE token count (words + punctuation); no tokenizer dependency."""
+    return len(_TOKEN_ESTIMATE_RE.findall(text))
+
+class BuiltPrompt:
+    """A prompt as ordered (stage, text) parts; `prefix` is its stable leading part."""
+    def __init__(self, stages, stable_stages=0):
+        self.stages = [(name, text) for name, text in stages if text]
+        stable_names = {name for name, _ in stages[:stable_stages]}
+        self.text = "".join(text for _, text in self.stages)
+        self.prefix = "".join(text for name, text in self.stages if name in stable_names)
+
+    @property
+    def token_counts(self):
+        """Estimated prompt tokens per stage, plus the total."""
+        counts = {name: estimate_tokens(text) for name, text in self.stages}
+        counts["total"] = sum(counts.values())
+        return counts
+
+class PromptBuilder:
+    """
+    Assembles prompts from the templates in src.llm.prompts, ordered from most
+    to least stable so consecutive requests share the longest token prefix
+    (Ollama reuses the KV cache of a loaded model for a matching prefix):
+    system prompt -> instructions -> catalog overview (changes only with the
+    catalog version) -> sorted schema block -> sorted graph hints -> question.
+    """
+    def __init__(self, dialect="sqlite", max_overview_tables=200):
+        self.dialect = DIALECT_NAMES.get(dialect, dialect)
+        self.max_overview_tables = max_overview_tables
+
+    def sql_prompt(self, question, context_items, table_names=()):
+        columns = sorted({item['id']: item['text'] for item in context_items if item['metadata'].get('type') != 'hint'}.items())
+        hints = sorted({item['text'] for item in context_items if item['metadata'].get('type') == 'hint'})
+        tables = list(table_names)[:self.max_overview_tables]
+        return BuiltPrompt([
+            ("system", SYSTEM_PROMPT + "\n"),
+            ("instructions", SQL_INSTRUCTIONS.format(dialect=self.dialect)),
+            ("catalog", CATALOG_OVERVIEW.format(tables=", ".join(tables)) if tables else ""),
+            ("schema", SCHEMA_BLOCK.format(schema_context="\n".join(text for _, text in columns)) if columns else ""),
+            ("hints", GRAPH_HINTS_BLOCK.format(hints="\n".join(hints)) if hints else ""),
+            ("question", GENERATE_SQL_PROMPT.format(query=question)),
+        ], stable_stages=3)
+
+    def explanation_prompt(self, sql):
+        return BuiltPrompt([
+            ("system", SYSTEM_PROMPT + "\n"),
+            ("question", EXPLAIN_SQL_PROMPT.format(sql=sql)),
+        ], stable_stages=1)
+
+    def audit_prompt(self, question, sql, results):
+        return BuiltPrompt([
+            ("system", SYSTEM_PROMPT + "\n"),
+            ("instructions", AUDIT_INSTRUCTIONS),
+            ("question", AUDIT_PROMPT.format(query=question, sql=sql, results=str(results)[:200])),
+        ], stable_stages=2)
@@ -6,10 +6,51 @@ And the following schema columns: {columns}
 Identify if there is any ambiguity. If yes, ask a clarifying question.
 """
 
-GENERATE_SQL_PROMPT = """
+# Prompts are assembled from most to least stable (see PromptBuilder), so
+# consecutive requests share a long prefix the model server can reuse.
+SQL_INSTRUCTIONS = """
+Generate a single valid {dialect} query that answers the question. Return ONLY the SQL.
+"""
+
+CATALOG_OVERVIEW = """
+Tables: {tables}
+"""
+
+SCHEMA_BLOCK = """
 Schema:
 {schema_context}
+"""
+
+GRAPH_HINTS_BLOCK = """
+Join hints:
+{hints}
+"""
 
+GENERATE_SQL_PROMPT = """
 Question: {query}
 SQL:
 """
+
+EXPLAIN_SQL_PROMPT = """
+Explain this SQL query to a non-technical user in 1 sentence:
+Query: {sql}
+"""
+
+AUDIT_INSTRUCTIONS = """
+You are a SQL Expert Auditor. Verify if the generated SQL correctly answers the User Question.
+
+Steps:
+1. Check if the SQL columns match the intent of the question.
+2. Check for common traps (e.g., matching "orders" but selecting "users").
+3. Verify the result is not an Error.
+
+Output format:
+Reasoning: <one sentence analysis>
+Verdict: PASS or FAIL
+"""
+
+AUDIT_PROMPT = """
+User Question: {query}
+Generated SQL: {sql}
+Result Sample: {results}
+"""
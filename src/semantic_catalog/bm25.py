@@ -0,0 +1,293 @@
+import json
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Marks rows whose terms still live in the memory-mapped snapshot arrays
+_BASE = object()
+
+def tokenize(text_value):
+    return _TOKEN_RE.findall(text_value.lower())
+
+class IncrementalBM25:
+    """
+    Inverted-index BM25 (Okapi weighting, Lucene-style non-negative IDF).
+
+    add/update/remove are O(document length): each document keeps its own
+    (term_ids, term_freqs) arrays and document frequencies are maintained
+    incrementally. Scoring uses a term-major CSR matrix of pre-saturated
+    term weights, so a query only touches the postings of its own terms.
+    The matrix is rebuilt lazily (vectorized, in scipy) after mutations.
+    """
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.vocab = {} # term -> term_id
+        self._df = np.zeros(0, dtype=np.int64) # term_id -> document frequency
+
+        self.doc_rows = {} # doc_id -> row
+        self.row_docs = [] # row -> doc_id (None when deleted)
+        self._row_terms = [] # row -> (term_ids, term_freqs), _BASE or None
+        self._row_len = [] # row -> document length in tokens
+        self._free_rows = []
+        self._total_len = 0
+
+        # Doc-major arrays of a loaded snapshot (rows 0..n-1), see load()
+        self._base_term_ids = np.zeros(0, dtype=np.int64)
+        self._base_term_freqs = np.zeros(0, dtype=np.float32)
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+
+        self._matrix = None # CSR (terms x rows) of saturated tf weights
+        self._idf = None
+        self._matrix_row_docs = [] # Snapshot of row_docs matching _matrix
+        self._dirty = True
+        self._lock = threading.RLock() # Shared by concurrent sessions
+
+    def __len__(self):
+        return len(self.doc_rows)
+
+    def doc_ids(self):
+        """Snapshot of the indexed document IDs."""
+        with self._lock:
+            return list(self.doc_rows)
+
+    def _term_ids(self, tokens, create):
+        ids = []
+        for token in tokens:
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                if not create:
+                    continue
+                term_id = len(self.vocab)
+                self.vocab[token] = term_id
+            ids.append(term_id)
+        if create and len(self.vocab) > len(self._df):
+            grown = np.zeros(max(len(self.vocab), 2 * len(self._df)), dtype=np.int64)
+            grown[:len(self._df)] = self._df
+            self._df = grown
+        return ids
+
+    def _row_arrays(self, row):
+        terms = self._row_terms[row]
+        if terms is _BASE:
+            start, end = self._base_offsets[row], self._base_offsets[row + 1]
+            return self._base_term_ids[start:end], self._base_term_freqs[start:end]
+        return terms
+
+    def add(self, doc_id, text_value):
+        """Adds a document, replacing any previous version with the same ID."""
+        with self._lock:
+            self._add(doc_id, text_value)
+
+    def add_many(self, doc_ids, texts):
+        with self._lock:
+            for doc_id, text_value in zip(doc_ids, texts):
+                self._add(doc_id, text_value)
+
+    def _add(self, doc_id, text_value):
+        if doc_id in self.doc_rows:
+            self._remove(doc_id)
+
+        counts = Counter(self._term_ids(tokenize(text_value), create=True))
+        term_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        term_freqs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        doc_len = int(term_freqs.sum())
+
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self.row_docs[row] = doc_id
+            self._row_terms[row] = (term_ids, term_freqs)
+            self._row_len[row] = doc_len
+        else:
+            row = len(self.row_docs)
+            self.row_docs.append(doc_id)
+            self._row_terms.append((term_ids, term_freqs))
+            self._row_len.append(doc_len)
+
+        self.doc_rows[doc_id] = row
+        self._df[term_ids] += 1
+        self._total_len += doc_len
+        self._dirty = True
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        row = self.doc_rows.pop(doc_id, None)
+        if row is None:
+            return
+        term_ids, _ = self._row_arrays(row)
+        self._df[term_ids] -= 1
+        self._total_len -= self._row_len[row]
+        self.row_docs[row] = None
+        self._row_terms[row] = None
+        self._row_len[row] = 0
+        self._free_rows.append(row)
+        self._dirty = True
+
+    def _gather(self):
+        """Returns COO arrays (rows, term_ids, term_freqs) of every live document."""
+        n_base = len(self._base_offsets) - 1
+        rows_parts, term_parts, freq_parts = [], [], []
+
+        if n_base:
+            # Untouched snapshot rows are taken from the mapped arrays in one vectorized pass
+            base_live = np.fromiter((terms is _BASE for terms in self._row_terms[:n_base]), dtype=bool, count=n_base)
+            base_rows = np.repeat(np.arange(n_base, dtype=np.int64), np.diff(self._base_offsets))
+            keep = base_live[base_rows]
+            rows_parts.append(base_rows[keep])
+            term_parts.append(np.asarray(self._base_term_ids)[keep])
+            freq_parts.append(np.asarray(self._base_term_freqs)[keep])
+
+        own_rows = [row for row, terms in enumerate(self._row_terms) if terms is not None and terms is not _BASE]
+        if own_rows:
+            lengths = np.fromiter((len(self._row_terms[row][0]) for row in own_rows), dtype=np.int64, count=len(own_rows))
+            rows_parts.append(np.repeat(np.asarray(own_rows, dtype=np.int64), lengths))
+            term_parts.append(np.concatenate([self._row_terms[row][0] for row in own_rows]))
+            freq_parts.append(np.concatenate([self._row_terms[row][1] for row in own_rows]))
+
+        if not rows_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(rows_parts), np.concatenate(term_parts), np.concatenate(freq_parts)
+
+    def _compact(self):
+        n_docs = len(self.doc_rows)
+        rows, term_ids, term_freqs = self._gather()
+
+        doc_len = np.asarray(self._row_len, dtype=np.float32)
+        avgdl = self._total_len / n_docs if n_docs else 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / avgdl)
+        weights = term_freqs * (self.k1 + 1) / (term_freqs + norm)
+
+        n_terms = len(self.vocab)
+        self._matrix = sparse.csr_matrix((weights, (term_ids, rows)), shape=(n_terms, len(self.row_docs)))
+        df = self._df[:n_terms].astype(np.float64)
+        self._idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        self._matrix_row_docs = list(self.row_docs)
+        self._dirty = False
+
+    def _query_matrix(self, queries, idf):
+        """Sparse (queries x terms) matrix of idf * term multiplicity."""
+        rows, cols, vals = [], [], []
+        for i, query in enumerate(queries):
+            counts = Counter(self._term_ids(tokenize(query), create=False))
+            for term_id, multiplicity in counts.items():
+                # Terms added after the last compaction have no postings in the matrix yet
+                if term_id < len(idf):
+                    rows.append(i)
+                    cols.append(term_id)
+                    vals.append(idf[term_id] * multiplicity)
+        return sparse.csr_matrix((vals, (rows, cols)), shape=(len(queries), len(idf)))
+
+    @staticmethod
+    def _select_top(rows, scores, k):
+        # argpartition for the k-th score, then a deterministic (score desc, row asc) order
+        if len(rows) > k:
+            kth = -np.partition(-scores, k - 1)[k - 1]
+            candidates = np.flatnonzero(scores >= kth)
+        else:
+            candidates = np.arange(len(rows))
+        order = np.lexsort((rows[candidates], -scores[candidates]))[:k]
+        return candidates[order]
+
+    def top_k(self, query, k):
+        """Returns [(doc_id, score), ...] for the k best matching documents."""
+        return self.top_k_many([query], k)[0]
+
+    def top_k_many(self, queries, k):
+        """Batched top_k: scores all queries as one sparse (queries x docs) product."""
+        if not self.doc_rows or k <= 0:
+            return [[] for _ in queries]
+        with self._lock:
+            if self._dirty:
+                self._compact()
+            matrix, idf, row_docs = self._matrix, self._idf, self._matrix_row_docs
+
+        # Sparse x sparse: only the postings of the query terms are touched
+        scores = (self._query_matrix(queries, idf) @ matrix).tocsr()
+        scores.sum_duplicates()
+
+        results = []
+        for i in range(len(queries)):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            rows, row_scores = scores.indices[start:end], scores.data[start:end]
+            best = self._select_top(rows, row_scores, k)
+            results.append([(row_docs[rows[j]], float(row_scores[j])) for j in best])
+        return results
+
+    def save(self, path, stamp):
+        """
+        Persists the index as a snapshot directory tagged with `stamp`:
+        doc-major CSR arrays as .npy (memory-mappable) + vocab/doc IDs as JSON.
+        The CURRENT pointer is swapped atomically, so readers never see a partial snapshot.
+        """
+        with self._lock:
+            rows, term_ids, term_freqs = self._gather()
+            order = np.argsort(rows, kind="stable")
+            live_rows = np.asarray(sorted(self.doc_rows.values()), dtype=np.int64)
+            counts = np.bincount(rows, minlength=len(self.row_docs))[live_rows]
+            offsets = np.zeros(len(live_rows) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            doc_ids = [self.row_docs[row] for row in live_rows]
+            row_len = np.asarray(self._row_len, dtype=np.int64)[live_rows]
+            terms = sorted(self.vocab, key=self.vocab.get)
+
+        snapshot_dir = os.path.join(path, stamp)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        np.save(os.path.join(snapshot_dir, "term_ids.npy"), term_ids[order])
+        np.save(os.path.join(snapshot_dir, "term_freqs.npy"), term_freqs[order])
+        np.save(os.path.join(snapshot_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(snapshot_dir, "row_len.npy"), row_len)
+        with open(os.path.join(snapshot_dir, "meta.json"), "w") as f:
+            json.dump({"stamp": stamp, "k1": self.k1, "b": self.b, "vocab": terms, "doc_ids": doc_ids}, f)
+
+        tmp_pointer = os.path.join(path, f"CURRENT.{os.getpid()}.tmp")
+        with open(tmp_pointer, "w") as f:
+            f.write(stamp)
+        os.replace(tmp_pointer, os.path.join(path, "CURRENT"))
+
+        # Drop older snapshots (readers that mmapped them keep their open files)
+        for entry in os.listdir(path):
+            entry_path = os.path.join(path, entry)
+            if entry != stamp and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, stamp=None):
+        """Loads the current snapshot (memory-mapped). Returns None if missing or not matching `stamp`."""
+        try:
+            with open(os.path.join(path, "CURRENT")) as f:
+                current = f.read().strip()
+            if stamp is not None and current != stamp:
+                return None
+            snapshot_dir = os.path.join(path, current)
+            with open(os.path.join(snapshot_dir, "meta.json")) as f:
+                meta = json.load(f)
+            term_ids = np.load(os.path.join(snapshot_dir, "term_ids.npy"), mmap_mode="r")
+            term_freqs = np.load(os.path.join(snapshot_dir, "term_freqs.npy"), mmap_mode="r")
+            offsets = np.load(os.path.join(snapshot_dir, "offsets.npy"))
+            row_len = np.load(os.path.join(snapshot_dir, "row_len.npy"))
+        except (OSError, ValueError):
+            return None
+
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.vocab = {term: term_id for term_id, term in enumerate(meta["vocab"])}
+        index._df = np.bincount(term_ids, minlength=len(index.vocab)).astype(np.int64)
+        index.row_docs = list(meta["doc_ids"])
+        index.doc_rows = {doc_id: row for row, doc_id in enumerate(index.row_docs)}
+        # Rows point into the mapped arrays; nothing is copied until compaction
+        index._base_term_ids = term_ids
+        index._base_term_freqs = term_freqs
+        index._base_offsets = offsets
+        index._row_terms = [_BASE] * len(index.row_docs)
+        index._row_len = row_len.tolist()
+        index._total_len = int(row_len.sum())
+        return index
@@ -0,0 +1,213 @@
+import math
+import time
+from collections import Counter
+import numpy as np
+from src.utils.db_connect import get_column_aggregates, iter_table_column_chunks
+from src.utils.governor import QueryLimitExceeded
+
+# SQL types MIN/MAX is not defined for on every dialect (e.g. PostgreSQL json, boolean)
+UNORDERED_TYPE_MARKERS = ("JSON", "BLOB", "BYTEA", "BINARY", "ARRAY", "BOOL", "XML", "GEOMETRY", "GEOGRAPHY", "UUID")
+
+def _hash64(values):
+    """Well-mixed 64-bit hashes: hash() + splitmix64 finalizer (small ints hash to themselves)."""
+    h = np.fromiter(map(hash, values), dtype=np.int64, count=len(values)).view(np.uint64)
+    with np.errstate(over="ignore"):
+        h = h + np.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+class HyperLogLog:
+    """
+    Approximate distinct counter in 2^precision one-byte registers
+    (4 KB and ~1.6% standard error at the default precision of 12).
+    Hashes are process-local, so sketches are not meant to be persisted.
+    """
+    def __init__(self, precision=12):
+        if not 11 <= precision <= 16:
+            raise ValueError("precision must be between 11 and 16")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        index = (hashes & np.uint64(len(self.registers) - 1)).astype(np.intp)
+        rest = hashes >> np.uint64(self.precision) # <= 53 bits, exact as float64
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        rank = (64 - self.precision + 1 - bit_length).astype(np.uint8) # Leading zeros + 1
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values):
+        self.add_hashes(_hash64(values))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.ldexp(1.0, -self.registers.astype(np.int64)).sum())
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros) # Linear counting for small cardinalities
+        return int(round(estimate))
+
+class TopKSketch:
+    """
+    Frequent-items summary (Misra-Gries) bounded to `capacity` counters.
+    Counts are exact while the column has at most `capacity` distinct values;
+    beyond that they are lower bounds off by at most `error`.
+    """
+    def __init__(self, k=5, capacity=None):
+        self.k = k
+        self.capacity = capacity or max(64, 32 * k)
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, values):
+        self.counts.update(values) # C-level counting of the whole chunk
+        if len(self.counts) > self.capacity:
+            ranked = self.counts.most_common()
+            cut = ranked[self.capacity][1]
+            self.counts = Counter({value: count - cut for value, count in ranked[:self.capacity] if count > cut})
+            self.error += cut
+
+    def top(self):
+        return self.counts.most_common(self.k)
+
+class ColumnStatsAccumulator:
+    """Streaming per-column statistics over columnar chunks, in bounded memory."""
+    def __init__(self, top_k=5, precision=12):
+        self.rows = 0
+        self.non_null = 0
+        self.min = None
+        self.max = None
+        self.track_min_max = True
+        self.distinct = HyperLogLog(precision)
+        self.frequent = TopKSketch(top_k)
+
+    def update(self, values):
+        self.rows += len(values)
+        present = [v for v in values if v is not None]
+        self.non_null += len(present)
+        if not present:
+            return
+        try:
+            hashes = _hash64(present)
+        except TypeError:
+            present = list(map(repr, present)) # Unhashable values (JSON objects, arrays)
+            hashes = _hash64(present)
+        self.distinct.add_hashes(hashes)
+        self.frequent.update(present)
+        if self.track_min_max:
+            try:
+                low, high = min(present), max(present)
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+            except TypeError: # Mixed, incomparable types
+                self.track_min_max = False
+                self.min = self.max = None
+
+def _is_orderable(sql_type):
+    sql_type = str(sql_type).upper()
+    return not any(marker in sql_type for marker in UNORDERED_TYPE_MARKERS)
+
+def compute_table_stats(db_url, table_name, columns, top_k=5, scan_limit=1_000_000, chunk_size=10000, sample_columns=None, deadline=None):
+    """
+    Per-column statistics of one table: null_fraction, min, max, distinct
+    and top_values (approximate, [(value, count), ...]).
+    1. One aggregate query pushed down to the database: row count, null counts,
+       MIN/MAX and, on dialects with a native approximate function, a distinct count.
+    2. For what the database did not compute (distinct counts elsewhere, failed
+       query, unorderable types): one streaming pass over at most `scan_limit`
+       rows with bounded-memory sketches (HyperLogLog, Misra-Gries). A partial
+       pass marks its estimates `distinct_partial`.
+    Both run under a query governor bounded by `deadline` (time.monotonic()),
+    so an abandoned table does not keep a scan (and a pooled connection) busy.
+    Top values of columns that were not streamed come from `sample_columns`
+    ({name: [values]}, e.g. the profiling sample) when given.
+    `distinct_non_null` is the non-null row count the distinct value refers to
+    (the table's, or the scanned rows' for a partial stream).
+    columns: column dicts from get_schema_details. Returns {column_name: stats} ({} on failure).
+    """
+    names = [col['name'] for col in columns]
+    if not names or (deadline is not None and time.monotonic() >= deadline):
+        return {}
+
+    def remaining():
+        return None if deadline is None else max(deadline - time.monotonic(), 0.001)
+
+    pushed = get_column_aggregates(
+        db_url, table_name, names,
+        min_max_columns=[col['name'] for col in columns if _is_orderable(col['type'])],
+        timeout=remaining()
+    )
+
+    accumulators = None
+    scanned = 0
+    exhausted = False # The stream read every row of the table
+    streamed = names if pushed is None else [name for name in names if pushed["columns"][name].get("distinct") is None]
+    if streamed:
+        accumulators = {name: ColumnStatsAccumulator(top_k=top_k) for name in streamed}
+        try:
+            timed_out = False
+            try:
+                chunks = iter_table_column_chunks(db_url, table_name, streamed, limit=scan_limit, chunk_size=chunk_size, timeout=remaining())
+                for chunk in chunks:
+                    for name, values in chunk.items():
+                        accumulators[name].update(values)
+                    scanned += len(chunk[streamed[0]])
+                    if deadline is not None and time.monotonic() > deadline:
+                        timed_out = True
+                        chunks.close()
+                        break
+            except QueryLimitExceeded:
+                timed_out = True # Keep the estimates of the rows scanned so far
+            if timed_out and not scanned:
+                if pushed is None:
+                    return {}
+                accumulators = None # Nothing to estimate from
+            # Hitting the scan limit only leaves rows out if the table has more
+            hit_limit = bool(scan_limit) and scanned >= scan_limit and (pushed is None or pushed["row_count"] > scanned)
+            exhausted = not timed_out and not hit_limit
+        except Exception as e:
+            print(f"Error streaming statistics for {table_name}: {e}")
+            if pushed is None:
+                return {}
+            accumulators = None
+
+    sample_top = {}
+    if sample_columns:
+        for name in names:
+            if accumulators and name in accumulators:
+                continue
+            frequent = TopKSketch(top_k)
+            frequent.update(value for value in sample_columns.get(name, []) if value is not None)
+            sample_top[name] = frequent.top()
+    sample_rows = max((len(values) for values in (sample_columns or {}).values()), default=0)
+
+    stats = {}
+    for name in names:
+        column_pushed = pushed["columns"][name] if pushed else {}
+        acc = accumulators.get(name) if accumulators else None
+        row_count = pushed["row_count"] if pushed else scanned
+        non_null = column_pushed.get("non_null", acc.non_null if acc else 0)
+
+        distinct = column_pushed.get("distinct")
+        distinct_non_null = non_null
+        partial = False
+        if distinct is None and acc is not None:
+            # Never report more distinct values than non-null rows (HLL noise on tiny columns)
+            distinct = min(acc.distinct.count(), acc.non_null)
+            distinct_non_null = acc.non_null
+            partial = not exhausted
+
+        stats[name] = {
+            "row_count": row_count,
+            "null_fraction": (row_count - non_null) / row_count if row_count else 0.0,
+            "min": column_pushed["min"] if "min" in column_pushed else (acc.min if acc else None),
+            "max": column_pushed["max"] if "max" in column_pushed else (acc.max if acc else None),
+            "distinct": distinct,
+            "distinct_non_null": distinct_non_null,
+            "distinct_partial": partial,
+            "top_values": acc.frequent.top() if acc else sample_top.get(name, []),
+            "scanned_rows": scanned if acc else sample_rows,
+        }
+    return stats
@@ -0,0 +1,118 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# Presets are CPU variants of the same model (all-MiniLM-L6-v2), so they share
+# one embedding space and can serve an existing catalog without re-indexing.
+# Switching to a different model family requires re-running SchemaDiscovery.
+EMBEDDING_PRESETS = {
+    "minilm": {"backend": "torch"},
+    "minilm-onnx": {"backend": "onnx"},
+    "minilm-onnx-int8": {"backend": "onnx", "file_name": "onnx/model_quint8_avx2.onnx"},
+    "minilm-openvino": {"backend": "openvino"},
+}
+
+class EmbeddingBackend(ABC):
+    """
+    Pluggable embedding interface: callable on a list of texts, returning a
+    float32 matrix with one row per text (Chroma EmbeddingFunction compatible).
+    Subclasses implement embed(); an incomplete one fails when instantiated.
+    """
+    name = "base"
+
+    def __call__(self, input):
+        return self.embed(list(input))
+
+    @abstractmethod
+    def embed(self, texts):
+        """list of str -> float32 array of shape (len(texts), dimension)."""
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    CPU embedding via sentence-transformers with a selectable runtime:
+    backend='torch' (default), 'onnx' (onnxruntime, optionally a quantized file)
+    or 'openvino'. The non-torch runtimes need `sentence-transformers[onnx]` / `[openvino]`.
+    """
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend="torch", file_name=None, batch_size=32, num_threads=None, name=None):
+        self.name = name or f"{model_name}:{backend}"
+        self.batch_size = batch_size
+
+        model_kwargs = {}
+        if file_name:
+            model_kwargs["file_name"] = file_name
+        if num_threads:
+            if backend == "torch":
+                import torch
+                torch.set_num_threads(num_threads) # Process-wide setting
+            elif backend == "onnx":
+                import onnxruntime as ort
+                session_options = ort.SessionOptions()
+                session_options.intra_op_num_threads = num_threads
+                model_kwargs["session_options"] = session_options
+            elif backend == "openvino":
+                model_kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": num_threads}
+
+        self.model = SentenceTransformer(model_name, device="cpu", backend=backend, model_kwargs=model_kwargs or None)
+
+    def embed(self, texts):
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+def get_embedding_backend(name=None, **overrides):
+    """
+    Builds a backend from EMBEDDING_PRESETS. Defaults come from the environment:
+    EMBEDDING_BACKEND (preset name), EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS.
+    """
+    name = name or os.getenv("EMBEDDING_BACKEND", "minilm")
+    if name not in EMBEDDING_PRESETS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Options: {', '.join(EMBEDDING_PRESETS)}")
+    settings = dict(EMBEDDING_PRESETS[name])
+    if os.getenv("EMBEDDING_BATCH_SIZE"):
+        settings["batch_size"] = int(os.getenv("EMBEDDING_BATCH_SIZE"))
+    if os.getenv("EMBEDDING_THREADS"):
+        settings["num_threads"] = int(os.getenv("EMBEDDING_THREADS"))
+    settings.update(overrides)
+    return SentenceTransformerBackend(name=name, **settings)
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings keyed by exact text; misses are embedded in one batch."""
+    def __init__(self, backend, max_entries=4096):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, texts):
+        texts = list(texts)
+        vectors = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, text_value in enumerate(texts):
+                vector = self._entries.get(text_value)
+                if vector is None:
+                    missing.setdefault(text_value, []).append(i)
+                else:
+                    self._entries.move_to_end(text_value)
+                    vectors[i] = vector
+            self.hits += len(texts) - sum(len(positions) for positions in missing.values())
+            self.misses += len(missing)
+
+        if missing:
+            computed = self.backend(list(missing))
+            with self._lock:
+                for text_value, vector in zip(missing, computed):
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vector.setflags(write=False) # Shared between callers
+                    for i in missing[text_value]:
+                        vectors[i] = vector
+                    self._entries[text_value] = vector
+                    self._entries.move_to_end(text_value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return vectors
@@ -1,59 +1,283 @@
 import re
 from datetime import datetime
+import numpy as np
 
-def infer_semantic_type(values):
+BOOLEAN_TOKENS = frozenset(['true', 'false', '0', '1', 't', 'f', 'yes', 'no'])
+
+# Compiled line patterns, each applied once over the newline-joined distinct values
+NUMERIC_PATTERN = re.compile(r'^(?:\d+\.?\d*|\.\d+)$', re.MULTILINE) # Digits with at most one '.'
+DATE_PATTERN = re.compile(r'^(?:\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4})[^\n]*$', re.MULTILINE) # YYYY-MM-DD or MM/DD/YYYY
+
+# Checks run on this many values first, so most columns are rejected early
+PROBE_SIZE = 64
+
+# Byte classes for the vectorized ASCII string checks (see _classify_strings)
+DIGIT, DOT, DASH, SLASH, UPPER, LOWER = 1, 2, 4, 8, 16, 32
+BYTE_CLASSES = np.zeros(256, dtype=np.uint8)
+BYTE_CLASSES[np.frombuffer(b"0123456789", dtype=np.uint8)] = DIGIT
+BYTE_CLASSES[ord(".")] = DOT
+BYTE_CLASSES[ord("-")] = DASH
+BYTE_CLASSES[ord("/")] = SLASH
+BYTE_CLASSES[np.arange(ord("A"), ord("Z") + 1)] = UPPER
+BYTE_CLASSES[np.arange(ord("a"), ord("z") + 1)] = LOWER
+# Byte classes at offsets 0-9 of a YYYY-MM-DD / MM/DD/YYYY prefix
+ISO_DATE_LAYOUT = np.array([DIGIT] * 4 + [DASH] + [DIGIT] * 2 + [DASH] + [DIGIT] * 2, dtype=np.uint8)
+US_DATE_LAYOUT = np.array([DIGIT] * 2 + [SLASH] + [DIGIT] * 2 + [SLASH] + [DIGIT] * 4, dtype=np.uint8)
+
+def _all_match(pattern, strings):
+    if any('\n' in s for s in strings):
+        return all(pattern.fullmatch(s) for s in strings)
+    return len(pattern.findall('\n'.join(strings))) == len(strings)
+
+def _passes(check, strings):
+    # Early exit: a failing probe avoids the full pass
+    if len(strings) > PROBE_SIZE and not check(strings[:PROBE_SIZE]):
+        return False
+    return check(strings)
+
+def _classify_strings(strings):
     """
-    Infers the semantic type of a list of values.
-    Returns: 'boolean', 'numeric', 'date', 'code', 'text', or 'unknown'
+    Numeric/date/code checks for all strings at once: the values are joined
+    into one byte buffer, every byte is mapped to a class and each check is a
+    few array reductions over the whole column. Returns the first matching type
+    ("numeric", "date", "code"), "text", or None when a value is not ASCII or
+    contains a newline (the regex path handles those). Raises TypeError
+    unless every value is a str.
     """
-    clean_values = [v for v in values if v is not None]
-    if not clean_values:
-        return "empty"
+    joined = "\n".join(strings)
+    if not joined.isascii():
+        return None
+    buffer = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == 10)
+    if len(newlines) != len(strings) - 1:
+        return None
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buffer)]))
+    return _classify_ascii(buffer, starts, ends, separators=buffer == 10)
+
+def _classify_ascii(buffer, starts, ends, separators=None):
+    """
+    The checks of _classify_strings on ASCII bytes laid out as values
+    buffer[starts[i]:ends[i]]; `separators` masks bytes between values
+    (None when the values are contiguous, as in an Arrow string array).
+    """
+    lengths = ends - starts
+    classes = np.take(BYTE_CLASSES, buffer)
+    # Class 0 past the end, so fixed-offset reads never leave the buffer
+    padded = np.concatenate((classes, np.zeros(len(ISO_DATE_LAYOUT), dtype=np.uint8)))
+
+    def counts(byte_class):
+        totals = np.concatenate(([0], np.cumsum((classes & byte_class) != 0, dtype=np.int32)))
+        return totals[ends] - totals[starts]
 
-    # Check for Boolean
-    if all(str(v).lower() in ['true', 'false', '0', '1', 't', 'f', 'yes', 'no'] for v in clean_values):
+    # Digits with at most one '.' (str.replace('.', '', 1).isdigit()); whole-buffer test first
+    value_classes = classes if separators is None else classes[~separators]
+    if bool(((value_classes & (DIGIT | DOT)) != 0).all()):
+        lone_dot = (lengths == 1) & (padded[starts] == DOT)
+        # Segment sums over non-empty values: reduceat needs every start inside its value
+        if bool((lengths >= 1).all()) and not bool(lone_dot.any()) and bool((np.add.reduceat((classes & DOT) != 0, starts, dtype=np.int32) <= 1).all()):
+            return "numeric"
+
+    # YYYY-MM-DD or MM/DD/YYYY prefix (the length check keeps reads inside contiguous values)
+    prefixes = padded[starts[:, None] + np.arange(len(ISO_DATE_LAYOUT))]
+    is_date = ((prefixes == ISO_DATE_LAYOUT).all(axis=1) | (prefixes == US_DATE_LAYOUT).all(axis=1)) & (lengths >= len(ISO_DATE_LAYOUT))
+    if bool(is_date.all()):
+        return "date"
+
+    # Short codes: at most 5 characters, uppercase letters and no lowercase (str.isupper())
+    if bool((lengths <= 5).all()) and not bool((classes & LOWER).any()) and bool((counts(UPPER) >= 1).all()):
+        return "code"
+    return "text"
+
+def _infer_distinct(distinct):
+    """
+    Semantic type from the distinct non-None values of a column (a set or list).
+    Every check is an all() over values, so distinct values give the same answer
+    as the full sample at a fraction of the cost for repetitive columns.
+    """
+    distinct = distinct if isinstance(distinct, list) else list(distinct)
+    try:
+        # A probe that is plain text settles the column (every check is an all())
+        vectorized = _classify_strings(distinct[:PROBE_SIZE])
+        if vectorized not in (None, "text") and len(distinct) > PROBE_SIZE:
+            vectorized = _classify_strings(distinct)
+        value_types = {str}
+        strings = distinct
+    except TypeError:
+        value_types = set(map(type, distinct))
+        # Fast path: native numbers never need string conversion
+        if value_types <= {int, float, bool}:
+            if float in value_types:
+                return "numeric"
+            return "boolean" if len(distinct) <= 2 and set(distinct) <= {0, 1} else "numeric"
+        vectorized = None
+        strings = [str(v) for v in distinct]
+
+    # Check for Boolean (at most a few case variants of 8 tokens can be distinct)
+    if len(strings) <= 4 * len(BOOLEAN_TOKENS) and {s.lower() for s in strings} <= BOOLEAN_TOKENS:
         return "boolean"
+    if vectorized is not None:
+        return vectorized
 
-    # Check for Numeric
-    is_numeric = all(isinstance(v, (int, float)) or str(v).replace('.', '', 1).isdigit() for v in clean_values)
-    if is_numeric:
+    # Regex path: non-ASCII or multi-line strings, mixed types
+    # Check for Numeric (native numbers mixed with numeric strings count as numeric)
+    if value_types & {int, float}:
+        text_values = [s for v, s in zip(distinct, strings) if not isinstance(v, (int, float))]
+    else:
+        text_values = strings
+    if _passes(lambda chunk: _all_match(NUMERIC_PATTERN, chunk), text_values):
         return "numeric"
 
-    # Check for Date (Simple regex YYYY-MM-DD or MM/DD/YYYY)
-    date_patterns = [
-        r'\d{4}-\d{2}-\d{2}',
-        r'\d{2}/\d{2}/\d{4}'
-    ]
-    is_date = all(any(re.match(pat, str(v)) for pat in date_patterns) for v in clean_values)
-    if is_date:
+    # Check for Date
+    if _passes(lambda chunk: _all_match(DATE_PATTERN, chunk), strings):
         return "date"
-        
+
     # Check for short codes (e.g., country codes)
-    if all(len(str(v)) <= 5 and str(v).isupper() for v in clean_values):
+    if all(len(s) <= 5 and s.isupper() for s in strings):
         return "code"
 
     return "text"
 
+def infer_semantic_type(values):
+    """
+    Infers the semantic type of a list of values.
+    Returns: 'boolean', 'numeric', 'date', 'code', 'text', or 'empty'
+    """
+    distinct = set(values)
+    distinct.discard(None)
+    if not distinct:
+        return "empty"
+    return _infer_distinct(distinct)
+
+def _first_distinct(values, count):
+    # First `count` distinct non-None values in sample order (stops as soon as they're found)
+    found = {}
+    for value in values:
+        if value is not None and value not in found:
+            found[value] = None
+            if len(found) == count:
+                break
+    return list(found)
+
+def _is_arrow(values):
+    return type(values).__module__.startswith("pyarrow")
+
+def _arrow_string_layout(strings, large=False):
+    """(bytes, starts, ends) of an Arrow string array, read from its buffers without copying."""
+    _, offsets_buffer, data_buffer = strings.buffers()
+    offset_type = np.int64 if large else np.int32
+    offsets = np.frombuffer(offsets_buffer, dtype=offset_type)[strings.offset:strings.offset + len(strings) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, dtype=np.uint8)
+    base = int(offsets[0])
+    data = data[base:int(offsets[-1])]
+    offsets = offsets.astype(np.int64) - base
+    return data, offsets[:-1], offsets[1:]
+
+def _infer_arrow(distinct):
+    """
+    Semantic type from the distinct non-null values of an Arrow array: the type
+    decides numbers and dates, and ASCII string checks run as Arrow compute
+    kernels. Other types and non-ASCII strings go through _infer_distinct.
+    """
+    import pyarrow as pa # Optional dependency (only reached with Arrow input)
+    kind = distinct.type
+    if pa.types.is_boolean(kind):
+        return "boolean"
+    if pa.types.is_integer(kind):
+        return "boolean" if len(distinct) <= 2 and set(distinct.to_pylist()) <= {0, 1} else "numeric"
+    if pa.types.is_floating(kind):
+        return "numeric"
+    if pa.types.is_date(kind) or pa.types.is_timestamp(kind):
+        return "date" # str() of a date/datetime starts with YYYY-MM-DD
+    if not (pa.types.is_string(kind) or pa.types.is_large_string(kind)):
+        return _infer_distinct(distinct.to_pylist())
+    data, starts, ends = _arrow_string_layout(distinct, large=pa.types.is_large_string(kind))
+    if len(data) and int(data.max()) >= 128:
+        return _infer_distinct(distinct.to_pylist()) # Non-ASCII: Unicode-aware string checks
+
+    if len(distinct) <= 4 * len(BOOLEAN_TOKENS) and {s.lower() for s in distinct.to_pylist()} <= BOOLEAN_TOKENS:
+        return "boolean"
+    # A probe that is plain text settles the column (every check is an all())
+    if len(distinct) > PROBE_SIZE and _classify_ascii(data[:ends[PROBE_SIZE - 1]], starts[:PROBE_SIZE], ends[:PROBE_SIZE]) == "text":
+        return "text"
+    return _classify_ascii(data, starts, ends)
+
+def _profile_arrow(array):
+    """profile_column for a pyarrow Array/ChunkedArray: hashing, null counting and checks stay in Arrow."""
+    import pyarrow.compute as pc
+    distinct = pc.unique(array) # First-seen order
+    if distinct.null_count:
+        distinct = distinct.drop_null()
+    non_null = len(array) - array.null_count
+    return {
+        "inferred_type": _infer_arrow(distinct) if len(distinct) else "empty",
+        "cardinality": cardinality_label(len(distinct), non_null),
+        "sample_values": distinct.slice(0, 5).to_pylist(),
+    }
+
+def _profile_numbers(array):
+    """profile_column for a NumPy bool/int/float array (no None possible): np.unique instead of a Python set."""
+    distinct, first_seen = np.unique(array, return_index=True)
+    if array.dtype == bool:
+        semantic_type = "boolean"
+    elif array.dtype.kind in "iu":
+        semantic_type = "boolean" if len(distinct) <= 2 and set(distinct.tolist()) <= {0, 1} else "numeric"
+    else:
+        semantic_type = "numeric"
+    return {
+        "inferred_type": semantic_type if len(distinct) else "empty",
+        "cardinality": cardinality_label(len(distinct), len(array)),
+        "sample_values": array[np.sort(first_seen)[:5]].tolist(),
+    }
+
+def cardinality_label(distinct_count, non_null_count):
+    """'high' when most non-null values are distinct (identifiers, free text), else 'low'."""
+    if non_null_count > 0 and distinct_count / non_null_count > 0.8:
+        return "high"
+    return "low"
+
 def profile_column(data_sample):
     """
     Analyzes a sample of data from a column.
+    Accepts any sequence (list, tuple, NumPy array) or a pyarrow Array/ChunkedArray;
+    None values are ignored. Typed NumPy and Arrow columns are profiled columnar,
+    without a Python object per value.
     """
-    unique_values = set(data_sample)
-    cardinality_raw = len(unique_values)
-    
+    if _is_arrow(data_sample):
+        return _profile_arrow(data_sample)
+    if isinstance(data_sample, np.ndarray) and data_sample.dtype.kind in "biuf":
+        return _profile_numbers(data_sample)
+    if isinstance(data_sample, np.ndarray):
+        values = data_sample.tolist() # Python scalars, as the checks expect
+    else:
+        values = data_sample if isinstance(data_sample, list) else list(data_sample)
+
+    # One C-level hashing pass; None only costs a count when present
+    distinct = set(values)
+    has_nulls = None in distinct
+    distinct.discard(None)
+    cardinality_raw = len(distinct)
+
     # Infer cardinality label based on sample size (heuristic)
     # If sample is small (e.g. 5), cardinality might be misleading, but we do best effort.
-    # Usually we profile with larger samples, but here we assume 'data_sample' is what we have.
-    sample_size = len(data_sample)
-    cardinality_label = "low"
-    if sample_size > 0 and cardinality_raw / sample_size > 0.8:
-        cardinality_label = "high"
-        
-    semantic_type = infer_semantic_type(data_sample)
-    
+    sample_size = len(values) - values.count(None) if has_nulls else len(values)
+    cardinality = cardinality_label(cardinality_raw, sample_size)
+
+    semantic_type = _infer_distinct(distinct) if distinct else "empty"
+
     return {
         "inferred_type": semantic_type,
-        "cardinality": cardinality_label,
-        "sample_values": list(unique_values)[:5] # Keep a few for context
+        "cardinality": cardinality,
+        "sample_values": _first_distinct(values, min(5, cardinality_raw)) # Keep a few for context
     }
 
+def profile_table(columns):
+    """
+    Batch profiler for a whole table sample in columnar form.
+    columns: {column_name: sequence of values} (e.g. from get_table_sample_columns,
+    ColumnChunk.to_dict()) or a pyarrow Table
+    Returns: {column_name: profile_column-style dict}
+    """
+    if _is_arrow(columns):
+        columns = dict(zip(columns.column_names, columns.columns))
+    return {name: profile_column(values) for name, values in columns.items()}
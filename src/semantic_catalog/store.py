@@ -1,97 +1,257 @@
+import json
+import os
+import time
 import chromadb
-from chromadb.utils import embedding_functions
-from rank_bm25 import BM25Okapi
-import numpy as np
+from src.semantic_catalog.bm25 import IncrementalBM25
+from src.semantic_catalog.embeddings import QueryEmbeddingCache, get_embedding_backend
+from src.utils.metrics import span
 
 class SemanticStore:
-    def __init__(self, persist_path="./chroma_db"):
+    def __init__(self, persist_path="./chroma_db", embedding_backend=None):
+        self.persist_path = persist_path
         self.client = chromadb.PersistentClient(path=persist_path)
-        # We use a simple default embedding function (all-MiniLM-L6-v2) provided by Chroma/SentenceTransformers
-        self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+        # Catalog version stamp shared by every store/process using this path.
+        # Bumped on each re-index so dependent caches (e.g. AnswerCache) invalidate.
+        self.version_path = os.path.join(persist_path, "catalog_version")
+        # Persisted keyword index snapshot (see IncrementalBM25.save)
+        self.bm25_path = os.path.join(persist_path, "bm25_index")
+        self.graph_hints_path = os.path.join(persist_path, "graph_hints.json")
+        # Pluggable embedding backend (default all-MiniLM-L6-v2, see EMBEDDING_PRESETS).
+        # We embed ourselves and hand vectors to Chroma, so query embeddings can be cached.
+        self.ef = embedding_backend or get_embedding_backend()
+        self.embed_queries = QueryEmbeddingCache(self.ef)
         
         self.collection = self.client.get_or_create_collection(
             name="schema_catalog",
-            embedding_function=self.ef
+            embedding_function=None
         )
         
-        # In-memory BM25 index
-        self.bm25 = None
-        self.doc_registry = [] # Maps index to doc ID/Content
+        # In-memory BM25 index (inverted, updated incrementally; maps rows to doc IDs).
+        # Loaded lazily from the on-disk snapshot on first use (see `bm25`).
+        self._bm25 = None
+        self._bm25_version = None
         
         # Refinement 4: Graph/Join Hints
-        # Simple in-memory dict for now: {table_name: ["Join hint string..."]}
-        self.graph_hints = {}
+        # {table_name: ["Join hint string..."]}, persisted next to the catalog (see `graph_hints`)
+        self._graph_hints = None
+        self._graph_hints_version = None
         
-        # Attempt to reload BM25 from existing data
-        self._rebuild_bm25()
+        # {table: set of column names}, cached per catalog version (see `table_columns`)
+        self._table_columns = None
+        self._table_columns_version = None
 
 
+    @property
+    def graph_hints(self):
+        """Join hints, reloaded from disk whenever the catalog version changed."""
+        version = self.catalog_version
+        if self._graph_hints is None or self._graph_hints_version != version:
+            try:
+                with open(self.graph_hints_path) as f:
+                    self._graph_hints = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._graph_hints = {}
+            self._graph_hints_version = version
+        return self._graph_hints
+
+    @property
+    def table_columns(self):
+        """{table: set of column names} of the catalog (derived from the keyword index, cached per version)."""
+        version = self.catalog_version
+        if self._table_columns is None or self._table_columns_version != version:
+            columns = {}
+            for doc_id in self.bm25.doc_ids():
+                # Schema element IDs are "table.column"
+                table, _, column = doc_id.rpartition(".")
+                columns.setdefault(table, set()).add(column)
+            self._table_columns = columns
+            self._table_columns_version = version
+        return self._table_columns
+
+    @property
+    def table_names(self):
+        """Sorted names of every cataloged table."""
+        return sorted(self.table_columns)
+
+    def _save_graph_hints(self, hints):
+        tmp_path = f"{self.graph_hints_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(hints, f)
+        os.replace(tmp_path, self.graph_hints_path)
+
+    @property
+    def bm25(self):
+        """Keyword index, reloaded whenever another store/process bumped the catalog version."""
+        version = self.catalog_version
+        if self._bm25 is None or self._bm25_version != version:
+            self._load_bm25(version)
+        return self._bm25
+
+    def _bm25_stamp(self, version):
+        # Tie the snapshot to the collection: catalog version + document count
+        return f"{version}-{self.collection.count()}"
+
+    def _load_bm25(self, version):
+        stamp = self._bm25_stamp(version)
+        index = IncrementalBM25.load(self.bm25_path, stamp)
+        if index is None:
+            index = self._rebuild_bm25()
+            index.save(self.bm25_path, stamp)
+        self._bm25 = index
+        self._bm25_version = version
+
+    def publish_catalog_change(self):
+        """Bumps the catalog version and snapshots the (already updated) keyword index and hints under it."""
+        index = self.bm25 # Loaded under the old version, before the bump
+        hints = self.graph_hints
+        self._save_graph_hints(hints) # Written before the bump so readers of the new version see them
+        version = self.bump_catalog_version()
+        self._bm25_version = version
+        self._graph_hints_version = version
+        index.save(self.bm25_path, self._bm25_stamp(version))
+
     def _rebuild_bm25(self):
-        """Rebuilds BM25 index from current collection data"""
-        existing_data = self.collection.get()
+        """Rebuilds BM25 index from current collection data (only when the snapshot is missing or stale)"""
+        existing_data = self.collection.get(include=["documents"])
+        index = IncrementalBM25()
         if existing_data['documents']:
-            self.doc_registry = existing_data['ids']
-            # Tokenize documents for BM25
-            tokenized_corpus = [doc.split(" ") for doc in existing_data['documents']]
-            self.bm25 = BM25Okapi(tokenized_corpus)
-        else:
-            self.bm25 = None
-            self.doc_registry = []
-
-    def add_schema_metadata(self, metadata_list):
+            index.add_many(existing_data['ids'], existing_data['documents'])
+        return index
+
+    @property
+    def catalog_version(self):
+        try:
+            with open(self.version_path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return "0"
+
+    def bump_catalog_version(self):
+        version = str(time.time_ns())
+        tmp_path = f"{self.version_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, self.version_path) # Atomic for concurrent readers
+        return version
+
+    def add_schema_metadata(self, metadata_list, publish=True):
         """
         Adds rich schema metadata to the store.
         metadata_list: List of dicts with keys: 'id', 'text', 'metadata'
+        publish: Bump the catalog version + snapshot now. Pass False when streaming
+                 several batches and call publish_catalog_change() once at the end.
         """
         ids = [item['id'] for item in metadata_list]
         documents = [item['text'] for item in metadata_list]
         metadatas = [item['metadata'] for item in metadata_list]
         
-        self.collection.add(
+        # Upsert so re-indexing an existing 'table.column' replaces it instead of colliding
+        self.collection.upsert(
             ids=ids,
             documents=documents,
-            metadatas=metadatas
+            metadatas=metadatas,
+            embeddings=self.ef(documents)
         )
-        # Rebuild BM25 after addition (naive approach for prototype)
-        self._rebuild_bm25()
+        # Only the new/changed documents are (re-)indexed
+        self.bm25.add_many(ids, documents)
+        if publish:
+            self.publish_catalog_change()
 
-    def add_graph_hints(self, hints_dict):
+    def delete_schema_metadata(self, ids, publish=True):
+        """Removes schema elements (e.g. columns of dropped tables) from both indexes."""
+        if not ids:
+            return
+        self.collection.delete(ids=ids)
+        index = self.bm25
+        for doc_id in ids:
+            index.remove(doc_id)
+        if publish:
+            self.publish_catalog_change()
+
+    def delete_tables(self, tables, publish=True):
+        """Removes every catalog entry and graph hint of the given tables."""
+        tables = list(tables)
+        ids = []
+        for start in range(0, len(tables), 500):
+            chunk = tables[start:start + 500]
+            ids.extend(self.collection.get(where={"table": {"$in": chunk}}, include=[])['ids'])
+        self.delete_schema_metadata(ids, publish=False)
+        hints = self.graph_hints
+        for table in tables:
+            hints.pop(table, None)
+        if publish:
+            self.publish_catalog_change()
+
+    def add_graph_hints(self, hints_dict, publish=True):
         """
         Stores FK relationships/join hints.
         hints_dict: {table_name: ["Hint: Table users joins with orders on id=user_id"]}
         """
         self.graph_hints.update(hints_dict)
+        if publish:
+            self.publish_catalog_change()
 
     def search(self, query, top_k=5):
         """
         Hybrid Search using RRF (Reciprocal Rank Fusion) + Graph Hints.
         """
-        if not self.bm25:
-            return []
+        return self.search_many([query], top_k=top_k)[0]
 
-        # 1. Vector Search
-        vector_results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k
-        )
-        # vector_results structure: {'ids': [['id1', ...]], ...}
+    def search_many(self, queries, top_k=5):
+        """
+        Batched hybrid search: one embedding batch + one vector query for all
+        queries, BM25 scored as a (queries x docs) sparse product, RRF per
+        query and a single `get` for the union of fused IDs.
+        Returns one result list per query, identical to `search`.
+        """
+        queries = list(queries)
+        keyword_index = self.bm25
+        if not queries or not len(keyword_index):
+            return [[] for _ in queries]
+
+        # 1. Vector Search (query embeddings come from the LRU cache, misses in one batch)
+        with span("store.embed"):
+            query_embeddings = self.embed_queries(queries)
+        with span("store.vector"):
+            vector_results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k
+            )
+        # vector_results structure: {'ids': [['id1', ...], ...]} (one list per query)
         
         # 2. Keyword Search (BM25)
-        # We need to scan all docs to get scores, then sort
-        tokenized_query = query.split(" ")
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        # Get top_k indices
-        top_n_indices = np.argsort(bm25_scores)[::-1][:top_k]
-        bm25_ids = [self.doc_registry[i] for i in top_n_indices]
+        # Only postings of the query terms are scored; top_k via argpartition
+        with span("store.bm25"):
+            bm25_hits = keyword_index.top_k_many(queries, top_k)
+        
+        # 3. RRF Fusion (per query)
+        fused_ids = []
+        for i, hits in enumerate(bm25_hits):
+            vector_ids = vector_results['ids'][i] if vector_results['ids'] else []
+            fused_ids.append(self._rrf_fuse(vector_ids, [doc_id for doc_id, _ in hits], top_k))
         
-        # 3. RRF Fusion
+        # Fetch details for the union of final IDs in one round-trip
+        union_ids = list(dict.fromkeys(doc_id for ids in fused_ids for doc_id in ids))
+        if not union_ids:
+            return [[] for _ in queries]
+            
+        with span("store.fetch"):
+            fetched = self.collection.get(ids=union_ids)
+        by_id = {
+            doc_id: {'id': doc_id, 'text': document, 'metadata': metadata}
+            for doc_id, document, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])
+        }
+        
+        return [self._with_graph_hints([by_id[doc_id] for doc_id in ids if doc_id in by_id]) for ids in fused_ids]
+
+    @staticmethod
+    def _rrf_fuse(vector_ids, bm25_ids, top_k):
         # Rank dict: {doc_id: 1/(rank + 60)}
         rrf_score = {}
         
         # Vector ranks (0-indexed)
-        if vector_results['ids']:
-            for rank, doc_id in enumerate(vector_results['ids'][0]):
-                rrf_score[doc_id] = rrf_score.get(doc_id, 0) + 1.0 / (rank + 60)
+        for rank, doc_id in enumerate(vector_ids):
+            rrf_score[doc_id] = rrf_score.get(doc_id, 0) + 1.0 / (rank + 60)
             
         # BM25 ranks
         for rank, doc_id in enumerate(bm25_ids):
@@ -99,31 +259,18 @@ class SemanticStore:
              
         # Sort by RRF score descending
         sorted_ids = sorted(rrf_score.items(), key=lambda item: item[1], reverse=True)
-        final_ids = [item[0] for item in sorted_ids[:top_k]]
-        
-        # Fetch details for final IDs
-        if not final_ids:
-            return []
-            
-        final_results = self.collection.get(ids=final_ids)
-        
+        return [item[0] for item in sorted_ids[:top_k]]
+
+    def _with_graph_hints(self, items):
         # Re-construct list of results AND inject Graph Hints
-        results = []
-        relevant_tables = set()
-        
-        for i in range(len(final_results['ids'])):
-            item = {
-                'id': final_results['ids'][i],
-                'text': final_results['documents'][i],
-                'metadata': final_results['metadatas'][i]
-            }
-            results.append(item)
-            relevant_tables.add(item['metadata']['table'])
+        results = list(items)
+        relevant_tables = dict.fromkeys(item['metadata']['table'] for item in items)
+        graph_hints = self.graph_hints
             
         # Refinement 4: Inject Join Hints for relevant tables
         for table in relevant_tables:
-            if table in self.graph_hints:
-                for hint in self.graph_hints[table]:
+            if table in graph_hints:
+                for hint in graph_hints[table]:
                     results.append({
                         'id': f"hint_{table}", 
                         'text': f"[GRAPH HINT] {hint}", 
@@ -131,5 +278,3 @@ class SemanticStore:
                     })
             
         return results
-
-
@@ -1,8 +1,63 @@
-from sqlalchemy import create_engine, inspect, text
+import threading
+from sqlalchemy import column, create_engine, func, inspect, select, table, text
+from sqlalchemy.engine import make_url
+from src.utils.governor import QueryGovernor, QueryLimitExceeded
+
+# Process-wide engine registry: one pooled Engine per DB URL.
+# Creating an Engine is expensive (dialect init, pool setup), so every
+# touchpoint (executor, safety EXPLAIN, discovery) shares the same one.
+POOL_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800, # Seconds. Avoids stale connections behind proxies/firewalls.
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def configure_pool(**settings):
+    """
+    Overrides the default pool settings for engines created from now on.
+    Accepted keys: pool_size, max_overflow, pool_pre_ping, pool_recycle.
+    """
+    unknown = set(settings) - set(POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
+    POOL_SETTINGS.update(settings)
+
+def _engine_kwargs(db_url):
+    kwargs = dict(POOL_SETTINGS)
+    url = make_url(db_url)
+    if url.get_backend_name() == "sqlite":
+        # Streamlit serves sessions from several threads
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory SQLite uses SingletonThreadPool, which has no overflow
+            kwargs.pop("max_overflow")
+    return kwargs
+
+def get_engine(db_url):
+    """Returns the shared, pooled Engine for db_url (created on first use)."""
+    engine = _engines.get(db_url)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url, **_engine_kwargs(db_url))
+            _engines[db_url] = engine
+        return engine
+
+def dispose_engines():
+    """Closes all pooled connections (e.g. on shutdown or after forking)."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
 
 def get_inspector(db_url):
-    engine = create_engine(db_url)
-    return inspect(engine)
+    return inspect(get_engine(db_url))
 
 def get_schema_details(db_url):
     """
@@ -17,20 +72,31 @@ def get_schema_details(db_url):
     }
     """
     inspector = get_inspector(db_url)
+    
+    # SQLAlchemy 2.x: reflect every table in one bulk pass (dialects such as
+    # PostgreSQL/Oracle answer each get_multi_* call with a single catalog query)
+    if hasattr(inspector, "get_multi_columns"):
+        all_columns = inspector.get_multi_columns()
+        all_pks = inspector.get_multi_pk_constraint()
+        all_fks = inspector.get_multi_foreign_keys()
+        schema_info = {}
+        for key, cols in all_columns.items():
+            _, table_name = key
+            pk_constraint = all_pks.get(key)
+            pks = pk_constraint.get('constrained_columns', []) if pk_constraint else []
+            schema_info[table_name] = {
+                "columns": [_column_info(col, pks) for col in cols],
+                "foreign_keys": all_fks.get(key, [])
+            }
+        return schema_info
+    
     schema_info = {}
     
     for table_name in inspector.get_table_names():
-        columns = []
         pk_constraint = inspector.get_pk_constraint(table_name)
         pks = pk_constraint.get('constrained_columns', []) if pk_constraint else []
         
-        for col in inspector.get_columns(table_name):
-            columns.append({
-                "name": col['name'],
-                "type": str(col['type']),
-                "primary_key": col['name'] in pks,
-                "nullable": col.get('nullable', True)
-            })
+        columns = [_column_info(col, pks) for col in inspector.get_columns(table_name)]
             
         fks = inspector.get_foreign_keys(table_name)
         
@@ -41,9 +107,17 @@ def get_schema_details(db_url):
         
     return schema_info
 
+def _column_info(col, pks):
+    return {
+        "name": col['name'],
+        "type": str(col['type']),
+        "primary_key": col['name'] in pks,
+        "nullable": col.get('nullable', True)
+    }
+
 def get_table_sample(db_url, table_name, limit=5):
     """Returns a sample of rows from a table."""
-    engine = create_engine(db_url)
+    engine = get_engine(db_url)
     with engine.connect() as conn:
         try:
             # Use text() for safe SQL execution, mostly consistent across dialects for simple SELECT
@@ -54,3 +128,138 @@ def get_table_sample(db_url, table_name, limit=5):
             print(f"Error sampling table {table_name}: {e}")
             return []
 
+
+def get_table_sample_columns(db_url, table_name, limit=10000):
+    """
+    Returns a sample of a table in columnar form: {column_name: [values...]}.
+    Rows are transposed with zip() in C instead of building one dict per row.
+    """
+    engine = get_engine(db_url)
+    with engine.connect() as conn:
+        try:
+            query = text(f"SELECT * FROM {table_name} LIMIT :limit")
+            result = conn.execute(query, {"limit": limit})
+            keys = list(result.keys())
+            rows = result.fetchall()
+            if not rows:
+                return {key: [] for key in keys}
+            return dict(zip(keys, map(list, zip(*rows))))
+        except Exception as e:
+            print(f"Error sampling table {table_name}: {e}")
+            return {}
+
+def get_table_change_signal(db_url, table_name):
+    """
+    Cheap data-change signal for a table, used to fingerprint it between discovery runs.
+    SQLite: row count + MAX(rowid). PostgreSQL: live tuples + cumulative writes from
+    pg_stat_user_tables (no scan). Other dialects: row count. Returns None on error.
+    """
+    engine = get_engine(db_url)
+    backend = make_url(db_url).get_backend_name()
+    with engine.connect() as conn:
+        try:
+            if backend == "sqlite":
+                try:
+                    row = conn.execute(text(f'SELECT COUNT(*), MAX(rowid) FROM "{table_name}"')).fetchone()
+                except Exception:
+                    conn.rollback() # WITHOUT ROWID table
+                    row = conn.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).fetchone()
+            elif backend == "postgresql":
+                row = conn.execute(
+                    text("SELECT n_live_tup, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relname = :t"),
+                    {"t": table_name}
+                ).fetchone()
+            else:
+                row = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).fetchone()
+            return list(row) if row is not None else None
+        except Exception as e:
+            print(f"Error reading change signal for {table_name}: {e}")
+            return None
+
+# Native approximate COUNT(DISTINCT) per dialect (HyperLogLog-based on all of them).
+# Dialects not listed (SQLite, PostgreSQL, MySQL, ...) get their distinct counts from
+# the bounded streaming sketch pass instead: an exact COUNT(DISTINCT) sorts/hashes
+# the whole table per column.
+APPROX_DISTINCT_FUNCTIONS = {
+    "duckdb": "approx_count_distinct",
+    "snowflake": "approx_count_distinct",
+    "bigquery": "approx_count_distinct",
+    "mssql": "approx_count_distinct",
+    "oracle": "approx_count_distinct",
+    "trino": "approx_distinct",
+    "presto": "approx_distinct",
+}
+
+def get_column_aggregates(db_url, table_name, column_names, min_max_columns=None, distinct=True, timeout=None):
+    """
+    Per-column statistics pushed down to the database as ONE aggregate query:
+    COUNT(*), and per column COUNT(col), MIN(col), MAX(col) and, where the
+    dialect has a native approximate distinct function, a distinct count.
+    min_max_columns: columns whose type supports MIN/MAX and DISTINCT (default: all).
+    The query runs under a QueryGovernor with `timeout` seconds.
+    Returns {"row_count": n, "columns": {name: {"non_null", "min", "max"[, "distinct"]}}}
+    or None if the query failed or timed out (e.g. an unsupported aggregate).
+    """
+    min_max_columns = set(column_names if min_max_columns is None else min_max_columns)
+    distinct_fn = APPROX_DISTINCT_FUNCTIONS.get(make_url(db_url).get_backend_name())
+
+    aggregates = [func.count()]
+    layout = [] # (column_name, stat, position in the result row)
+    for name in column_names:
+        col = column(name)
+        layout.append((name, "non_null", len(aggregates)))
+        aggregates.append(func.count(col))
+        if name in min_max_columns:
+            layout.append((name, "min", len(aggregates)))
+            aggregates.append(func.min(col))
+            layout.append((name, "max", len(aggregates)))
+            aggregates.append(func.max(col))
+        if distinct and distinct_fn and name in min_max_columns:
+            layout.append((name, "distinct", len(aggregates)))
+            aggregates.append(getattr(func, distinct_fn)(col))
+
+    engine = get_engine(db_url)
+    with engine.connect() as conn:
+        governor = None
+        try:
+            governor = QueryGovernor(conn, timeout=timeout)
+            with governor.running():
+                row = conn.execute(select(*aggregates).select_from(table(table_name))).fetchone()
+        except Exception as e:
+            print(f"Aggregate statistics query failed for {table_name}: {e}")
+            return None
+        finally:
+            if governor is not None:
+                governor.release()
+
+    stats = {name: {} for name in column_names}
+    for name, stat, position in layout:
+        stats[name][stat] = row[position]
+    return {"row_count": row[0], "columns": stats}
+
+def iter_table_column_chunks(db_url, table_name, column_names, limit=None, chunk_size=10000, timeout=None):
+    """
+    Streams a table as columnar chunks {column_name: [values...]} using a
+    server-side cursor where the driver supports one, so memory stays bounded
+    by chunk_size rows regardless of the table size.
+    The execute and every fetch run under a QueryGovernor: once `timeout`
+    seconds of database work are spent, QueryLimitExceeded is raised (after
+    the chunks already yielded) and the connection goes back to the pool.
+    """
+    query = select(*[column(name) for name in column_names]).select_from(table(table_name))
+    if limit:
+        query = query.limit(limit)
+    engine = get_engine(db_url)
+    with engine.connect() as conn:
+        governor = QueryGovernor(conn, timeout=timeout)
+        try:
+            with governor.running():
+                result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+            while True:
+                with governor.running():
+                    rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield dict(zip(column_names, map(list, zip(*rows))))
+        finally:
+            governor.release()
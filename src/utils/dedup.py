@@ -0,0 +1,83 @@
+import hashlib
+import re
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+def shingles(text_value, size=3):
+    """Word n-grams of a normalized text (the whole text when it has fewer words)."""
+    words = _WORD_RE.findall(text_value.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _shingle_hash(shingle):
+    # Stable across processes (unlike hash()), so signatures can be persisted
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little", signed=True)
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` universal hash functions
+    (a * h + b mod 2^64 over stable 64-bit shingle hashes). Signatures only
+    depend on the text, `num_perm` and `seed`, so they can be persisted.
+    """
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1) # Odd multipliers
+        self.b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        hashes = np.fromiter(map(_shingle_hash, shingle_set), dtype=np.int64, count=len(shingle_set)).view(np.uint64)
+        with np.errstate(over="ignore"):
+            permuted = hashes[:, None] * self.a[None, :] + self.b[None, :] # (shingles, num_perm), wraps mod 2^64
+        return permuted.min(axis=0)
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH banding: add() returns the id of an already indexed text whose
+    estimated Jaccard similarity is >= threshold (a near duplicate), or indexes
+    the text and returns None. Candidates come from `bands` buckets of
+    num_perm / bands signature rows each, so lookups don't scan the index.
+    """
+    def __init__(self, threshold=0.85, num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = {} # (band, band bytes) -> [item id]
+        self._signatures = {} # item id -> signature
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, item_id, text_value):
+        signature = self.hasher.signature(shingles(text_value))
+        keys = self._band_keys(signature)
+        candidates = {other for key in keys for other in self._buckets.get(key, ())}
+        for other in candidates:
+            if float(np.mean(self._signatures[other] == signature)) >= self.threshold:
+                return other
+        self._index(item_id, signature, keys)
+        return None
+
+    def _index(self, item_id, signature, keys=None):
+        self._signatures[item_id] = signature
+        for key in keys or self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(item_id)
+
+    def items(self):
+        """(item ids, signature matrix) of every indexed text, e.g. to persist the index."""
+        ids = list(self._signatures)
+        matrix = np.array([self._signatures[item_id] for item_id in ids], dtype=np.uint64).reshape(len(ids), self.hasher.num_perm)
+        return ids, matrix
+
+    def restore(self, ids, matrix):
+        """Indexes signatures from items() without re-checking them."""
+        for item_id, signature in zip(ids, np.asarray(matrix, dtype=np.uint64)):
+            self._index(item_id, signature)
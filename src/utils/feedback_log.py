@@ -0,0 +1,382 @@
+import os
+import json
+import glob
+import queue
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: writers are only serialized within one process
+    fcntl = None
+
+# Feedback log defaults (override per log or via the environment)
+DEFAULT_LOG_DIR = os.getenv("FEEDBACK_LOG_DIR", "feedback_log")
+DEFAULT_DURABILITY = os.getenv("FEEDBACK_DURABILITY", "fsync")
+DEFAULT_SEGMENT_BYTES = int(os.getenv("FEEDBACK_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+
+# "os": each batch is written to the OS (survives a process crash)
+# "fsync": each batch is fsynced before its appends complete (survives a power loss)
+DURABILITY_POLICIES = ("os", "fsync")
+
+_process_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock shared by threads and processes (flock on a lock file)."""
+    with _process_lock, open(path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def locked_append(path, lines, fsync=False):
+    """Appends complete lines to a plain file under a cross-process lock (one write per batch)."""
+    data = "".join(line + "\n" for line in lines)
+    with file_lock(path + ".lock"), open(path, "a") as f:
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+def _write_json_atomic(path, value, fsync):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _segment_name(base_offset):
+    return f"{base_offset:020d}.jsonl"
+
+class FeedbackLog:
+    """
+    Append-only, segmented JSONL log for feedback events, shared by every
+    session and process that points at the same directory.
+
+    - append() is non-blocking: a background writer batches records (up to
+      `batch_size`, lingering `linger_seconds`) into one write per batch.
+    - Each record gets a global, monotonically increasing `offset`, assigned
+      under a cross-process file lock; HEAD stores the next offset and the
+      active segment size, and a crashed partial write is repaired on the next
+      batch.
+    - Segments rotate at `segment_bytes`; compact() drops superseded records
+      and (optionally) segments every consumer has committed past.
+    - consumer(name) reads from its committed offset (see FeedbackConsumer).
+    """
+    def __init__(self, directory=None, durability=None, segment_bytes=None, batch_size=256, linger_seconds=0.05):
+        self.directory = directory or DEFAULT_LOG_DIR
+        self.durability = durability or DEFAULT_DURABILITY
+        if self.durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy {self.durability!r} (expected one of {DURABILITY_POLICIES})")
+        self.segment_bytes = segment_bytes or DEFAULT_SEGMENT_BYTES
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        os.makedirs(os.path.join(self.directory, "consumers"), exist_ok=True)
+        self._lock_path = os.path.join(self.directory, "LOCK")
+        self._head_path = os.path.join(self.directory, "HEAD")
+
+        self.counters = {"appended": 0, "batches": 0, "failed": 0, "rotations": 0, "recovered": 0}
+        self._written = threading.Condition() # Notified after every batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name=f"feedback-log-{self.directory}", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    @property
+    def fsync(self):
+        return self.durability == "fsync"
+
+    # --- Writing ---
+
+    def append(self, record, wait=False):
+        """
+        Queues a record (a JSON-serializable dict). Returns a Future resolving to
+        its offset once written per the durability policy; wait=True blocks for it.
+        """
+        if self._closed:
+            raise RuntimeError("Feedback log is closed")
+        future = Future()
+        self._queue.put((record, future))
+        return future.result() if wait else future
+
+    def flush(self):
+        """Blocks until every queued record is written."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.linger_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+            # Still write records whose future the caller cancelled, just don't resolve them;
+            # the others are marked running so they can't be cancelled (set_result would raise)
+            futures = [future if future.set_running_or_notify_cancel() else None for _, future in batch]
+            try:
+                first_offset = self._write_batch([record for record, _ in batch])
+                for i, future in enumerate(futures):
+                    if future is not None:
+                        future.set_result(first_offset + i)
+            except Exception as e:
+                print(f"Feedback log write failed: {e}")
+                self.counters["failed"] += len(batch)
+                for future in futures:
+                    if future is not None:
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            with self._written:
+                self._written.notify_all()
+
+    def _write_batch(self, records):
+        with file_lock(self._lock_path):
+            head = self._recover_head()
+            if head["size"] >= self.segment_bytes:
+                head = {"next_offset": head["next_offset"], "segment": _segment_name(head["next_offset"]), "size": 0}
+                self.counters["rotations"] += 1
+            first_offset = head["next_offset"]
+            lines = [json.dumps({**record, "offset": first_offset + i}) for i, record in enumerate(records)]
+            data = ("\n".join(lines) + "\n").encode()
+            with open(os.path.join(self.directory, head["segment"]), "ab") as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            head.update(next_offset=first_offset + len(records), size=head["size"] + len(data))
+            _write_json_atomic(self._head_path, head, self.fsync)
+        self.counters["appended"] += len(records)
+        self.counters["batches"] += 1
+        return first_offset
+
+    def _recover_head(self):
+        # Caller holds the file lock. HEAD may lag the active segment if a writer
+        # died between the segment write and the HEAD update: rescan that tail.
+        try:
+            with open(self._head_path) as f:
+                head = json.load(f)
+        except (FileNotFoundError, ValueError):
+            segments = self.segments()
+            if not segments:
+                return {"next_offset": 0, "segment": _segment_name(0), "size": 0}
+            head = {"next_offset": int(os.path.basename(segments[-1]).split(".")[0]), "segment": os.path.basename(segments[-1]), "size": 0}
+
+        path = os.path.join(self.directory, head["segment"])
+        actual_size = os.path.getsize(path) if os.path.exists(path) else 0
+        if actual_size == head["size"]:
+            return head
+
+        self.counters["recovered"] += 1
+        start = head["size"] if actual_size > head["size"] else 0
+        valid_size = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Torn write
+                head["next_offset"] = json.loads(line)["offset"] + 1
+                valid_size += len(line)
+        if valid_size < actual_size:
+            with open(path, "r+b") as f:
+                f.truncate(valid_size)
+        head["size"] = valid_size
+        return head
+
+    def _head_offset(self):
+        # HEAD is replaced atomically, so it can be read without the lock
+        try:
+            with open(self._head_path) as f:
+                return json.load(f)["next_offset"]
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def wait_for_data(self, offset, timeout, check_interval=1.0):
+        """
+        Blocks until the log holds records at or after `offset`, or `timeout`
+        seconds pass; returns whether it does. Batches written by this process
+        wake the waiter immediately; other processes' batches are seen by
+        re-reading HEAD every `check_interval` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while self._head_offset() <= offset:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._written.wait(min(remaining, check_interval))
+        return True
+
+    # --- Reading ---
+
+    def segments(self):
+        """Segment paths, oldest first."""
+        return sorted(glob.glob(os.path.join(self.directory, "[0-9]" * 20 + ".jsonl")))
+
+    def next_offset(self):
+        with file_lock(self._lock_path):
+            return self._recover_head()["next_offset"]
+
+    def consumer(self, name):
+        return FeedbackConsumer(self, name)
+
+    def committed_offsets(self):
+        """{consumer name: committed offset}."""
+        offsets = {}
+        for path in glob.glob(os.path.join(self.directory, "consumers", "*.offset")):
+            with open(path) as f:
+                offsets[os.path.basename(path)[:-len(".offset")]] = int(f.read().strip() or 0)
+        return offsets
+
+    # --- Maintenance ---
+
+    def compact(self, key_fn=None, drop_consumed=False):
+        """
+        Rewrites sealed segments (all but the active one):
+        - key_fn(record) -> key: keeps only the latest record per key (e.g. a
+          re-rated (query, sql) pair); offsets are preserved, so there are gaps.
+        - drop_consumed: deletes segments every consumer has committed past.
+        Returns {"removed_records", "removed_segments"}.
+        """
+        stats = {"removed_records": 0, "removed_segments": 0}
+        with file_lock(self._lock_path):
+            head = self._recover_head()
+            segments = self.segments()
+            sealed = [path for path in segments if os.path.basename(path) != head["segment"]]
+            committed = self.committed_offsets()
+            min_committed = min(committed.values()) if committed else 0
+
+            if drop_consumed:
+                for path, next_path in zip(sealed, segments[1:]):
+                    # Every offset in a segment is below the next segment's base
+                    if int(os.path.basename(next_path).split(".")[0]) <= min_committed:
+                        os.remove(path)
+                        stats["removed_segments"] += 1
+                sealed = [path for path in sealed if os.path.exists(path)]
+
+            if key_fn is not None and sealed:
+                latest = {}
+                for path in self.segments():
+                    for record in self._read_segment(path):
+                        latest[key_fn(record)] = record["offset"]
+                for path in sealed:
+                    records = list(self._read_segment(path))
+                    kept = [record for record in records if latest[key_fn(record)] == record["offset"]]
+                    if len(kept) == len(records):
+                        continue
+                    stats["removed_records"] += len(records) - len(kept)
+                    tmp_path = path + ".compact"
+                    with open(tmp_path, "w") as f:
+                        f.write("".join(json.dumps(record) + "\n" for record in kept))
+                        f.flush()
+                        if self.fsync:
+                            os.fsync(f.fileno())
+                    os.replace(tmp_path, path) # Open readers keep the old file
+        return stats
+
+    def _read_segment(self, path):
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                yield json.loads(line)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["queued"] = self._queue.qsize()
+        stats["segments"] = len(self.segments())
+        return stats
+
+class FeedbackConsumer:
+    """
+    Reads a FeedbackLog in offset order from the consumer's committed offset.
+    poll() advances `position` in memory; commit() persists it, so a restarted
+    consumer resumes after the last committed record (at-least-once delivery).
+    """
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+        self._offset_path = os.path.join(log.directory, "consumers", f"{name}.offset")
+        self.committed = log.committed_offsets().get(name, 0)
+        self.position = self.committed
+        self._cursor = None # (segment path, inode, byte position) to resume reading
+
+    def poll(self, max_records=1000):
+        """Up to `max_records` records at or after `position` (only complete lines)."""
+        records = []
+        segments = self.log.segments()
+        bases = [int(os.path.basename(path).split(".")[0]) for path in segments]
+        # Start at the last segment whose base offset is <= position
+        first = max([i for i, base in enumerate(bases) if base <= self.position], default=0)
+        for path in segments[first:]:
+            try:
+                inode = os.stat(path).st_ino
+                with open(path, "rb") as f:
+                    start = 0
+                    if self._cursor is not None and self._cursor[:2] == (path, inode):
+                        start = self._cursor[2]
+                    f.seek(start)
+                    while len(records) < max_records:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break # End of segment or a write in progress
+                        start += len(line)
+                        record = json.loads(line)
+                        if record["offset"] >= self.position:
+                            records.append(record)
+                            self.position = record["offset"] + 1
+                    self._cursor = (path, inode, start)
+            except FileNotFoundError:
+                continue # Removed by compaction
+            if len(records) >= max_records:
+                break
+        return records
+
+    def commit(self, offset=None):
+        """Persists `offset` (default: the current position) as the next offset to read."""
+        self.committed = self.position if offset is None else offset
+        _write_json_atomic(self._offset_path, self.committed, self.log.fsync)
+
+    def lag(self):
+        return self.log.next_offset() - self.position
+
+_LOGS = {}
+_LOGS_LOCK = threading.Lock()
+
+def get_feedback_log(directory=None):
+    """Shared FeedbackLog per directory (one background writer per process)."""
+    directory = os.path.abspath(directory or DEFAULT_LOG_DIR)
+    with _LOGS_LOCK:
+        log = _LOGS.get(directory)
+        if log is None:
+            log = _LOGS[directory] = FeedbackLog(directory)
+        return log
@@ -0,0 +1,122 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-query runtime limits (override per agent or via the environment)
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+DEFAULT_MAX_VM_STEPS = int(os.getenv("QUERY_MAX_VM_STEPS", "500000000")) # SQLite only, roughly 5s of VM work
+
+# SQLite calls the progress handler every N virtual machine instructions
+SQLITE_PROGRESS_INTERVAL = 10000
+
+# Driver messages of server-side timeouts
+TIMEOUT_MESSAGES = (
+    "statement timeout", # PostgreSQL: canceling statement due to statement timeout
+    "maximum statement execution time exceeded", # MySQL 3024
+)
+
+class QueryLimitExceeded(Exception):
+    """A query was stopped by the runtime governor; `limit` names the budget that fired."""
+    def __init__(self, limit, detail):
+        super().__init__(f"Query stopped by runtime governor: {detail}")
+        self.limit = limit
+
+class QueryGovernor:
+    """
+    Runtime limits for one query on one connection: a wall-clock budget
+    (counted only while the database is working, i.e. inside execute/fetch
+    calls) and, on SQLite, a VM-step budget. Enforcement per dialect:
+    - SQLite: progress_handler aborts the statement (both budgets)
+    - PostgreSQL: SET LOCAL statement_timeout
+    - MySQL: session MAX_EXECUTION_TIME, restored on release()
+    - others: a watchdog calling the driver's cancel(), if it has one
+    `fired` records which limit stopped the query ("timeout" or "vm_steps").
+    """
+    def __init__(self, conn, timeout=None, max_vm_steps=None):
+        self.conn = conn
+        self.backend = conn.engine.url.get_backend_name()
+        self.timeout = timeout or DEFAULT_TIMEOUT_SECONDS
+        self.max_vm_steps = max_vm_steps or DEFAULT_MAX_VM_STEPS
+        self.fired = None
+        self.vm_steps = 0
+        self.elapsed = 0.0 # Seconds spent inside running()
+        self._deadline = None
+        self._installed = False
+        self._mysql_previous = None
+        self._install()
+
+    @property
+    def _dbapi(self):
+        return self.conn.connection.driver_connection
+
+    def _install(self):
+        timeout_ms = int(self.timeout * 1000)
+        if self.backend == "sqlite":
+            self._dbapi.set_progress_handler(self._on_progress, SQLITE_PROGRESS_INTERVAL)
+        elif self.backend == "postgresql":
+            self.conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}") # Ends with the transaction
+        elif self.backend in ("mysql", "mariadb"):
+            self._mysql_previous = self.conn.exec_driver_sql("SELECT @@SESSION.MAX_EXECUTION_TIME").scalar()
+            self.conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {timeout_ms}")
+        self._installed = True
+
+    def release(self):
+        """Removes the limits before the connection goes back to the pool."""
+        if not self._installed:
+            return
+        self._installed = False
+        try:
+            if self.backend == "sqlite":
+                self._dbapi.set_progress_handler(None, 0)
+            elif self.backend in ("mysql", "mariadb") and self._mysql_previous is not None:
+                self.conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {int(self._mysql_previous)}")
+        except Exception as e:
+            print(f"Could not reset query limits: {e}")
+
+    def _on_progress(self):
+        # Runs inside sqlite3_step; a non-zero return interrupts the statement
+        self.vm_steps += SQLITE_PROGRESS_INTERVAL
+        if self.vm_steps > self.max_vm_steps:
+            self.fired = "vm_steps"
+            return 1
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self.fired = "timeout"
+            return 1
+        return 0
+
+    def _cancel(self):
+        cancel = getattr(self._dbapi, "cancel", None)
+        if cancel is not None:
+            self.fired = "timeout"
+            cancel()
+
+    @contextmanager
+    def running(self):
+        """Wraps one execute/fetch call; raises QueryLimitExceeded if a limit stopped it."""
+        remaining = self.timeout - self.elapsed
+        if remaining <= 0:
+            self.fired = "timeout"
+            raise QueryLimitExceeded("timeout", f"timeout after {self.timeout:g}s")
+        started = time.monotonic()
+        self._deadline = started + remaining
+        watchdog = None
+        if self.backend not in ("sqlite", "postgresql", "mysql", "mariadb"):
+            watchdog = threading.Timer(remaining, self._cancel)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            yield
+        except Exception as e:
+            if self.fired is None and any(message in str(e).lower() for message in TIMEOUT_MESSAGES):
+                self.fired = "timeout"
+            if self.fired == "timeout":
+                raise QueryLimitExceeded("timeout", f"timeout after {self.timeout:g}s") from e
+            if self.fired == "vm_steps":
+                raise QueryLimitExceeded("vm_steps", f"more than {self.max_vm_steps:,} VM steps") from e
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            self._deadline = None
+            self.elapsed += time.monotonic() - started
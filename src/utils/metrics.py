@@ -0,0 +1,208 @@
+import os
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# METRICS_ENABLED=0 turns every span/counter into a no-op; METRICS_PORT serves /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Latency buckets in seconds (Prometheus client defaults plus 30s/60s for LLM calls)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = "evosql_stage_seconds"
+METRIC_HELP = {
+    STAGE_METRIC: "Wall-clock seconds per pipeline stage",
+    "evosql_queries_total": "handle_query calls by outcome",
+    "evosql_queries_blocked_total": "Queries blocked before returning rows, by reason",
+    "evosql_rows_returned_total": "Rows returned to callers (first pages and fetched pages)",
+    "evosql_answer_cache_total": "Answer cache lookups by result",
+    "evosql_result_cache_total": "Result cache lookups by result",
+    "evosql_audits_total": "Audits by verdict source (heuristic, cache, static, llm_judge)",
+}
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: above every bucket (+Inf)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Span:
+    """Times a `with` block into the stage histogram (and the sinks)."""
+    __slots__ = ("registry", "stage", "labels", "started")
+
+    def __init__(self, registry, stage, labels):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(STAGE_METRIC, time.perf_counter() - self.started, stage=self.stage, error=exc_type is not None, **self.labels)
+        return False
+
+_NULL_SPAN = nullcontext()
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms, keyed by metric name + labels.
+    - span(stage) times a block into evosql_stage_seconds{stage=...}
+    - inc(name, value, **labels) adds to a counter
+    - sinks: callables receiving every event as a dict ({"type": "span"/"counter",
+      "name", "labels", "value"}); they run inline, so keep them cheap
+    - render_prometheus() returns the Prometheus text exposition format
+    Disabled registries return a shared no-op span and skip all bookkeeping.
+    """
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._counters = {} # (name, label key) -> value
+        self._histograms = {} # (name, label key) -> _Histogram
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def span(self, stage, **labels):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, labels)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._sinks:
+            self._emit({"type": "counter", "name": name, "labels": labels, "value": value})
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        if "error" in labels:
+            labels["error"] = "true" if labels["error"] else "false"
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+        if self._sinks:
+            self._emit({"type": "span", "name": name, "labels": labels, "value": value})
+
+    def add_sink(self, sink):
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self._sinks.remove(sink)
+
+    def _emit(self, event):
+        for sink in list(self._sinks):
+            try:
+                sink(event)
+            except Exception as e:
+                print(f"Metrics sink failed: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """{"counters": {name: {labels: value}}, "histograms": {name: {labels: {count, sum, buckets}}}}."""
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()]
+        snapshot = {"counters": {}, "histograms": {}}
+        for (name, label_key), value in counters:
+            snapshot["counters"].setdefault(name, {})[_format_labels(label_key)] = value
+        for (name, label_key), counts, total, count in histograms:
+            snapshot["histograms"].setdefault(name, {})[_format_labels(label_key)] = {"count": count, "sum": total, "buckets": counts}
+        return snapshot
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+        lines = []
+        described = set()
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+        for (name, label_key), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_format_labels(label_key)} {value}")
+        for (name, label_key), counts, total, count in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(label_key, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_key)} {total}")
+            lines.append(f"{name}_count{_format_labels(label_key)} {count}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry(enabled=METRICS_ENABLED)
+
+def span(stage, **labels):
+    """Times a `with` block as a pipeline stage in the global registry."""
+    return METRICS.span(stage, **labels)
+
+def inc(name, value=1, **labels):
+    METRICS.inc(name, value, **labels)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+_SERVERS = {}
+_SERVERS_LOCK = threading.Lock()
+
+def serve_metrics(port=None, host="127.0.0.1"):
+    """Serves GET /metrics for the global registry on a daemon thread (once per port). Returns the server."""
+    port = int(port if port is not None else (METRICS_PORT or 9464))
+    with _SERVERS_LOCK:
+        server = _SERVERS.get(port)
+        if server is None:
+            server = _SERVERS[port] = ThreadingHTTPServer((host, port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+            print(f"Metrics endpoint on http://{host}:{server.server_address[1]}/metrics")
+        return server
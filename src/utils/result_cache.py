@@ -0,0 +1,183 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy.engine import make_url
+from src.utils.results import ColumnChunk
+from src.utils.safety import SQLGLOT_DIALECTS, canonical_fingerprint
+
+# Result cache defaults (override per agent or via the environment)
+DEFAULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_SPILL_DIR = os.getenv("RESULT_CACHE_SPILL_DIR") # Unset: no on-disk tier
+DEFAULT_SPILL_BYTES = int(os.getenv("RESULT_CACHE_SPILL_BYTES", str(1024 * 1024 * 1024)))
+
+def sqlite_data_version(db_url):
+    """
+    Data-version token of a SQLite file: mtime and size of the database and its
+    WAL file (any committed write changes one of them). PRAGMA data_version is
+    per connection, so it can't be compared across pooled connections.
+    None for in-memory databases.
+    """
+    path = make_url(db_url).database
+    if not path or path == ":memory:":
+        return None
+    token = []
+    for file_path in (path, path + "-wal"):
+        try:
+            stat = os.stat(file_path)
+            token.extend((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            token.extend((0, 0))
+    return tuple(token)
+
+class ResultCache:
+    """
+    Query result cache keyed by (db_url, data version, canonical SQL fingerprint),
+    so different questions that resolve to the same SQL share one execution.
+
+    Data version: file stats for SQLite; other dialects need `version_fn(db_url)`
+    (an invalidation hook returning any hashable token, e.g. a counter bumped by
+    your ETL). Without a token the result is not cached.
+
+    Memory tier is an LRU bounded by result size (ColumnChunk.nbytes). With a
+    `spill_dir`, evicted results are written there column by column (.npz) and
+    read back on a hit, up to `spill_max_bytes` on disk.
+    """
+    def __init__(self, max_bytes=None, version_fn=None, spill_dir=None, spill_max_bytes=None):
+        self.max_bytes = max_bytes or DEFAULT_CACHE_BYTES
+        self.version_fn = version_fn
+        self.spill_dir = spill_dir or DEFAULT_SPILL_DIR
+        self.spill_max_bytes = spill_max_bytes or DEFAULT_SPILL_BYTES
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        self._entries = OrderedDict() # key -> ColumnChunk
+        self._spilled = OrderedDict() # key -> (path, file size)
+        self.bytes = 0
+        self.spill_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "spill_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "spills": 0}
+
+    def data_version(self, db_url):
+        if self.version_fn is not None:
+            return self.version_fn(db_url)
+        if make_url(db_url).get_backend_name() == "sqlite":
+            return sqlite_data_version(db_url)
+        return None
+
+    def key(self, db_url, sql):
+        """Cache key for running `sql` now, or None if it can't be cached (no data version, unparsed SQL)."""
+        version = self.data_version(db_url)
+        fingerprint = canonical_fingerprint(sql, SQLGLOT_DIALECTS.get(make_url(db_url).get_backend_name()))
+        if version is None or fingerprint is None:
+            with self._lock:
+                self.counters["bypassed"] += 1
+            return None
+        return (db_url, version, fingerprint)
+
+    def get(self, key):
+        """Cached ColumnChunk for the key, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            chunk = self._entries.get(key)
+            if chunk is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return chunk
+            spilled = self._spilled.pop(key, None)
+            if spilled is None:
+                self.counters["misses"] += 1
+                return None
+            self.spill_bytes -= spilled[1]
+
+        # Read back outside the lock, then promote to the memory tier
+        chunk = self._load(spilled[0])
+        with self._lock:
+            self.counters["spill_hits" if chunk is not None else "misses"] += 1
+        if chunk is not None:
+            self.put(key, chunk)
+        return chunk
+
+    def put(self, key, chunk):
+        """
+        Caches a complete result (one ColumnChunk); results larger than the whole cache are skipped.
+        The chunk's arrays become read-only: a caller that wants to modify them makes a copy.
+        """
+        if key is None or chunk.nbytes > self.max_bytes:
+            return
+        for array in chunk.arrays.values():
+            array.setflags(write=False) # Shared by every hit (and the caller that produced it)
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.nbytes
+            self._entries[key] = chunk
+            self.bytes += chunk.nbytes
+            while self.bytes > self.max_bytes:
+                old_key, old_chunk = self._entries.popitem(last=False)
+                self.bytes -= old_chunk.nbytes
+                self.counters["evictions"] += 1
+                evicted.append((old_key, old_chunk))
+        if self.spill_dir:
+            for old_key, old_chunk in evicted:
+                self._spill(old_key, old_chunk)
+
+    def _spill(self, key, chunk):
+        path = os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npz")
+        try:
+            # One array per column; object columns are pickled by NumPy
+            np.savez(path, __columns__=np.array(chunk.columns, dtype=object), **{f"c{i}": chunk.arrays[name] for i, name in enumerate(chunk.columns)})
+            size = os.path.getsize(path)
+        except Exception as e:
+            print(f"Result cache spill failed: {e}")
+            return
+        removed = []
+        with self._lock:
+            self._spilled[key] = (path, size)
+            self.spill_bytes += size
+            self.counters["spills"] += 1
+            while self.spill_bytes > self.spill_max_bytes and self._spilled:
+                _, (old_path, old_size) = self._spilled.popitem(last=False)
+                self.spill_bytes -= old_size
+                removed.append(old_path)
+        for old_path in removed:
+            self._remove(old_path)
+
+    def _load(self, path):
+        try:
+            with np.load(path, allow_pickle=True) as data: # Files written by _spill only
+                columns = data["__columns__"].tolist()
+                chunk = ColumnChunk(columns, [data[f"c{i}"] for i in range(len(columns))])
+        except Exception as e:
+            print(f"Result cache read failed: {e}")
+            chunk = None
+        self._remove(path)
+        return chunk
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def invalidate(self):
+        """Drops every cached result (e.g. after a bulk load on a dialect without a version hook)."""
+        with self._lock:
+            self._entries.clear()
+            paths = [path for path, _ in self._spilled.values()]
+            self._spilled.clear()
+            self.bytes = 0
+            self.spill_bytes = 0
+        for path in paths:
+            self._remove(path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update(entries=len(self._entries), bytes=self.bytes, spilled_entries=len(self._spilled), spill_bytes=self.spill_bytes)
+        lookups = stats["hits"] + stats["spill_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["spill_hits"]) / lookups if lookups else 0.0
+        return stats
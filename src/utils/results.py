@@ -0,0 +1,199 @@
+import os
+import sys
+import math
+import time
+import numpy as np
+from sqlalchemy import text
+from src.utils.governor import QueryGovernor, QueryLimitExceeded
+
+# Execution budget defaults (override per agent or via the environment)
+DEFAULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "1000"))
+DEFAULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "100000"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(64 * 1024 * 1024)))
+PROBE_ROWS = 64 # Rows fetched first to estimate bytes per row before any page is sized
+
+def _column_array(values):
+    """NumPy array for one column: native dtype for homogeneous numbers, object otherwise."""
+    value_types = set(map(type, values))
+    try:
+        if value_types == {bool}:
+            return np.array(values, dtype=bool)
+        if value_types <= {int} and value_types:
+            return np.array(values, dtype=np.int64)
+        if value_types <= {int, float} and value_types:
+            return np.array(values, dtype=np.float64)
+    except OverflowError:
+        pass # Integers beyond int64
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+def _array_nbytes(array):
+    if array.dtype != object:
+        return array.nbytes
+    return array.nbytes + sum(map(sys.getsizeof, array)) # Pointers + referenced objects
+
+class ColumnChunk:
+    """One page of a query result in columnar form: {column_name: NumPy array}."""
+    def __init__(self, columns, arrays):
+        self.columns = list(columns)
+        self.arrays = dict(zip(self.columns, arrays))
+        self.num_rows = len(arrays[0]) if arrays else 0
+        self.nbytes = sum(map(_array_nbytes, arrays))
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        if not rows:
+            return cls.empty(columns)
+        return cls(columns, [_column_array(list(values)) for values in zip(*rows)])
+
+    @classmethod
+    def empty(cls, columns):
+        return cls(columns, [np.empty(0, dtype=object) for _ in columns])
+
+    def __len__(self):
+        return self.num_rows
+
+    def to_dict(self):
+        """{column_name: array}, accepted as-is by st.dataframe / pandas.DataFrame."""
+        return dict(self.arrays)
+
+    def to_records(self, limit=None):
+        """Row dicts (the pre-streaming result format) for the first `limit` rows."""
+        columns = [self.arrays[name][:limit].tolist() for name in self.columns]
+        return [dict(zip(self.columns, row)) for row in zip(*columns)]
+
+    def to_arrow(self):
+        import pyarrow as pa # Optional dependency
+        return pa.table({name: pa.array(array, from_pandas=True) for name, array in self.arrays.items()})
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame(self.arrays, columns=self.columns)
+
+class StreamingResult:
+    """
+    Lazily paged query result over a server-side cursor (stream_results/yield_per).
+    Rows are fetched one page at a time as ColumnChunks, within a max_rows /
+    max_bytes budget for the whole result; hitting it sets `truncated` and
+    `truncation_reason`. Pages are sized from the bytes per row seen so far, so
+    a page stops near the byte budget instead of overshooting it by a page. Execution and every fetch run under a QueryGovernor
+    (wall-clock timeout, SQLite VM steps): if it stops the query before any row
+    arrived, QueryLimitExceeded is raised; later it truncates the result.
+    Owns `conn` and returns it to the pool once the result is exhausted,
+    truncated or closed.
+    """
+    def __init__(self, conn, sql, page_size=None, max_rows=None, max_bytes=None, timeout=None, max_vm_steps=None):
+        self.page_size = page_size or DEFAULT_PAGE_SIZE
+        self.max_rows = max_rows or DEFAULT_MAX_ROWS
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.truncated = False
+        self.truncation_reason = None # "max_rows", "max_bytes", "timeout" or "vm_steps"
+        self.last_used = time.monotonic()
+
+        self._conn = conn
+        self.governor = None
+        try:
+            self.governor = QueryGovernor(conn, timeout=timeout, max_vm_steps=max_vm_steps)
+            with self.governor.running():
+                self._result = conn.execution_options(stream_results=True, yield_per=self.page_size).execute(text(sql))
+        except Exception:
+            self.close()
+            raise
+        self.columns = list(self._result.keys()) if self._result.returns_rows else []
+        if not self._result.returns_rows:
+            self.close()
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    @property
+    def has_more(self):
+        return not self.closed
+
+    def next_page(self):
+        """Returns the next ColumnChunk, or None once the result is exhausted/truncated."""
+        if self.closed:
+            return None
+        self.last_used = time.monotonic()
+        try:
+            with self.governor.running():
+                rows, wanted = self._fetch_rows()
+            chunk = ColumnChunk.from_rows(self.columns, rows)
+            self.rows_fetched += chunk.num_rows
+            self.bytes_fetched += chunk.nbytes
+
+            if chunk.num_rows < wanted:
+                self.close() # Short page: nothing left
+            elif self.bytes_fetched >= self.max_bytes:
+                self._truncate("max_bytes")
+            elif self.rows_fetched >= self.max_rows:
+                self._truncate("max_rows")
+        except QueryLimitExceeded as e:
+            if self.rows_fetched == 0:
+                self.close()
+                raise
+            # Keep the pages already delivered; the rest of the result is cut off
+            self.truncated = True
+            self.truncation_reason = e.limit
+            self.close()
+            return None
+        except Exception:
+            self.close()
+            raise
+        return chunk if chunk.num_rows else None
+
+    def _fetch_rows(self):
+        """Rows of the next page and how many were asked for: page_size, fewer if that would exceed max_rows or max_bytes."""
+        limit = min(self.page_size, self.max_rows - self.rows_fetched)
+        rows = []
+        if self.rows_fetched:
+            row_bytes = self.bytes_fetched / self.rows_fetched
+        else:
+            # No estimate yet: probe a few rows first
+            probe = min(limit, PROBE_ROWS)
+            rows = self._result.fetchmany(probe)
+            if len(rows) < probe:
+                return rows, probe
+            row_bytes = ColumnChunk.from_rows(self.columns, rows).nbytes / len(rows)
+        budget_rows = math.ceil((self.max_bytes - self.bytes_fetched) / max(row_bytes, 1))
+        wanted = max(min(limit, budget_rows), len(rows), 1)
+        if wanted > len(rows):
+            rows += self._result.fetchmany(wanted - len(rows))
+        return rows, wanted
+
+    def pages(self):
+        while not self.closed:
+            chunk = self.next_page()
+            if chunk is not None:
+                yield chunk
+
+    def _truncate(self, reason):
+        # Only flag truncation when rows were actually left behind
+        with self.governor.running():
+            left = self._result.fetchmany(1)
+        if left:
+            self.truncated = True
+            self.truncation_reason = reason
+        self.close()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            if getattr(self, "_result", None) is not None:
+                self._result.close()
+        finally:
+            if self.governor is not None:
+                self.governor.release()
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
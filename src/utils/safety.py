@@ -1,45 +1,224 @@
-from sqlalchemy import create_engine, text
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from src.utils.db_connect import get_engine
 
-def estimate_query_cost(sql, db_url):
+UNSAFE_COST = 999999 # Extremely high cost/unsafe
+
+# Nodes that write, change schema/session state or escape the database, anywhere in the tree
+FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create, exp.Alter,
+    exp.TruncateTable, exp.Into, exp.Command, exp.Pragma, exp.Attach, exp.Detach,
+    exp.Grant, exp.Copy, exp.LoadData, exp.Set, exp.Use, exp.Transaction, exp.Commit, exp.Rollback,
+)
+FORBIDDEN_FUNCTIONS = {"LOAD_EXTENSION", "PG_SLEEP", "PG_TERMINATE_BACKEND", "PG_CANCEL_BACKEND", "LO_IMPORT", "LO_EXPORT", "PG_READ_FILE", "SLEEP", "BENCHMARK"}
+# Named in the reason when unparsable SQL is rejected: whole-word match (a column `updated_at` is fine)
+FORBIDDEN_KEYWORDS = re.compile(r"\b(DROP|DELETE|UPDATE|INSERT|ALTER|TRUNCATE|CREATE|ATTACH|PRAGMA|GRANT)\b", re.IGNORECASE)
+
+# SQLAlchemy backend -> sqlglot dialect
+SQLGLOT_DIALECTS = {
+    "sqlite": "sqlite",
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "mariadb": "mysql",
+    "mssql": "tsql",
+    "oracle": "oracle",
+    "duckdb": "duckdb",
+    "snowflake": "snowflake",
+    "bigquery": "bigquery",
+}
+
+# Default thresholds in each dialect's own cost unit (SQLite: plan heuristic score,
+# PostgreSQL: planner cost units, MySQL: optimizer query_cost)
+COST_THRESHOLDS = {
+    "sqlite": 1000,
+    "postgresql": 1_000_000,
+    "mysql": 1_000_000,
+}
+DEFAULT_COST_THRESHOLD = 1000
+
+# SQLite EXPLAIN QUERY PLAN details ("SCAN users" on 3.36+, "SCAN TABLE users" before)
+SQLITE_PLAN_COSTS = (
+    (re.compile(r"^SCAN\b"), 50), # Full scan (was 100, lowered for small DBs where scans are fine)
+    (re.compile(r"^SEARCH\b"), 10), # Index lookup
+    (re.compile(r"USE TEMP B-TREE"), 20), # Sort/distinct without an index (was 50, sorting is common)
+)
+
+@lru_cache(maxsize=2048)
+def analyze_statement(sql, dialect=None):
+    """
+    Parses SQL into an AST and classifies it. Returns a read-only mapping:
+    safe (bool), kind ("query", "write", "multiple", "unparsed"), reason,
+    tables (sorted tuple), fingerprint (literals normalized, None if unparsed) and
+    canonical (formatting normalized, literals kept: same value => same result).
+    SQL that does not parse is never safe (fail closed). Results are cached per
+    (sql, dialect) and shared by every caller.
+    """
+    return MappingProxyType(_analyze(sql, dialect))
+
+def _analyze(sql, dialect):
+    try:
+        # Empty/comment-only trailing statements (e.g. "...; -- note") don't count
+        statements = [s for s in sqlglot.parse(sql, read=dialect) if s is not None and not isinstance(s, exp.Semicolon)]
+    except sqlglot.errors.SqlglotError as e:
+        # Can't be checked, so it is rejected; a forbidden keyword makes a clearer reason
+        keyword = FORBIDDEN_KEYWORDS.search(sql)
+        return {
+            "safe": False,
+            "kind": "unparsed",
+            "reason": f"Forbidden keyword {keyword.group(1).upper()}" if keyword else f"Not parsed: {str(e).splitlines()[0]}",
+            "tables": (),
+            "fingerprint": None,
+            "canonical": None,
+        }
+
+    if len(statements) != 1:
+        return {"safe": False, "kind": "multiple", "reason": f"{len(statements)} statements (exactly one allowed)", "tables": (), "fingerprint": None, "canonical": None}
+
+    tree = statements[0]
+    tables = tuple(sorted({table.name for table in tree.find_all(exp.Table) if table.name}))
+    result = {
+        "safe": True, "kind": "query", "reason": "Read-only query", "tables": tables,
+        "fingerprint": _fingerprint(tree, dialect),
+        "canonical": hashlib.sha1(tree.sql(dialect=dialect, normalize=True).encode()).hexdigest(),
+    }
+
+    forbidden = tree.find(*FORBIDDEN_NODES)
+    if not isinstance(tree, exp.Query) or forbidden is not None:
+        node = forbidden if forbidden is not None else tree
+        result.update(safe=False, kind="write", reason=f"{type(node).__name__} statements are not allowed")
+        return result
+
+    for func in tree.find_all(exp.Func):
+        name = (func.name if isinstance(func, exp.Anonymous) else func.sql_name()).upper()
+        if name in FORBIDDEN_FUNCTIONS:
+            result.update(safe=False, reason=f"Function {name} is not allowed")
+            return result
+    return result
+
+def _fingerprint(tree, dialect):
+    # Literals become placeholders, so `id = 5` and `id = 7` share a plan/verdict.
+    # LIMIT/OFFSET values stay: they change the plan cost.
+    def normalize(node):
+        if isinstance(node, exp.Literal) and not isinstance(node.parent, (exp.Limit, exp.Offset)):
+            return exp.Placeholder()
+        return node
+    normalized = tree.copy().transform(normalize).sql(dialect=dialect, normalize=True)
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+def statement_fingerprint(sql, dialect=None):
+    """Literal-normalized statement fingerprint (None when the SQL does not parse)."""
+    return analyze_statement(sql, dialect)["fingerprint"]
+
+def canonical_fingerprint(sql, dialect=None):
+    """Fingerprint of the statement with formatting normalized but literals kept (None when unparsed)."""
+    return analyze_statement(sql, dialect)["canonical"]
+
+class PlanCache:
+    """LRU of EXPLAIN cost verdicts per (db_url, catalog_version, fingerprint)."""
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            cost = self._entries.get(key)
+            if cost is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cost
+
+    def put(self, key, cost):
+        with self._lock:
+            self._entries[key] = cost
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+PLAN_CACHE = PlanCache()
+
+def _backend(db_url):
+    return make_url(db_url).get_backend_name()
+
+def estimate_query_cost(sql, db_url, conn=None, catalog_version=None):
     """
-    Runs EXPLAIN QUERY PLAN to estimate cost.
-    For SQLite, we look for 'SCAN TABLE' without indices which implies full table scan.
+    Classifies the statement (AST) and estimates its cost from the dialect's
+    EXPLAIN output. Verdicts are cached per statement fingerprint and catalog
+    version, so repeated query shapes skip EXPLAIN.
+    conn: Optional open connection to reuse (e.g. the one that will execute the query).
     """
-    # Simple heuristic for SQLite. Postgres would use parsing of "Cost=..."
-    engine = create_engine(db_url)
-    cost_score = 0
-    
-    # Basic safety checks (No DROP/DELETE) - though running with ReadOnly user is better
-    forbidden = ["DROP", "DELETE", "UPDATE", "INSERT", "ALTER", "TRUNCATE"]
-    if any(cmd in sql.upper() for cmd in forbidden):
-        return 999999 # Extremely high cost/unsafe
-    
+    backend = _backend(db_url)
+    analysis = analyze_statement(sql, SQLGLOT_DIALECTS.get(backend))
+    if not analysis["safe"]:
+        print(f"Unsafe statement: {analysis['reason']}")
+        return UNSAFE_COST
+
+    key = (db_url, catalog_version, analysis["fingerprint"]) if analysis["fingerprint"] else None
+    if key is not None:
+        cost = PLAN_CACHE.get(key)
+        if cost is not None:
+            return cost
+
+    if conn is None:
+        with get_engine(db_url).connect() as own_conn:
+            cost = _explain_cost(sql, backend, own_conn)
+    else:
+        cost = _explain_cost(sql, backend, conn)
+
+    if key is not None and cost is not None:
+        PLAN_CACHE.put(key, cost)
+    return cost if cost is not None else 0 # Fail open if EXPLAIN fails; the AST check already passed
+
+def _explain_cost(sql, backend, conn):
+    """Cost from structured EXPLAIN output; None if EXPLAIN failed."""
     try:
-        with engine.connect() as conn:
-            # SQLite specific EXPLAIN
-            if "sqlite" in db_url:
-                result = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
-                raw_plan = result.fetchall()
-                for row in raw_plan:
-                    detail = str(row)
-                    # Heuristic: SCAN TABLE is costly. SEARCH TABLE is better.
-                    if "SCAN TABLE" in detail:
-                        cost_score += 50 # Was 100. Lowered for small DBs where scans are fine.
-                    elif "SEARCH TABLE" in detail:
-                        cost_score += 10
-                    elif "USE TEMP B-TREE" in detail:
-                        cost_score += 20 # Was 50. Sorting is common.
-            else:
-                 # Placeholder for other DBs
-                 cost_score = 10
-                 
+        if backend == "sqlite":
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+            cost_score = 0
+            for row in rows:
+                detail = str(row[-1]) # (id, parent, notused, detail)
+                for pattern, cost in SQLITE_PLAN_COSTS:
+                    if pattern.search(detail):
+                        cost_score += cost
+                        break
             return cost_score
+        if backend == "postgresql":
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return float(plan[0]["Plan"]["Total Cost"])
+        if backend in ("mysql", "mariadb"):
+            plan = json.loads(conn.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar())
+            return float(plan["query_block"].get("cost_info", {}).get("query_cost", 0))
+        # No structured EXPLAIN wired up for this dialect
+        return 10
     except Exception as e:
         print(f"Explanation failed: {e}")
-        return 0 # Fail open if explanation checks fail, rely on forbidden keyword check
+        # Leave the shared connection usable for the actual execution
+        conn.rollback()
+        return None
 
-def is_safe(sql, db_url, cost_threshold=1000): # Raised from 500
-    cost = estimate_query_cost(sql, db_url)
+def is_safe(sql, db_url, cost_threshold=None, conn=None, catalog_version=None):
+    """cost_threshold defaults to the dialect's entry in COST_THRESHOLDS."""
+    if cost_threshold is None:
+        cost_threshold = COST_THRESHOLDS.get(_backend(db_url), DEFAULT_COST_THRESHOLD)
+    cost = estimate_query_cost(sql, db_url, conn=conn, catalog_version=catalog_version)
     print(f"Query Cost: {cost}")
     return cost < cost_threshold
-
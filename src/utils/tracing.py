@@ -0,0 +1,131 @@
+import os
+import queue
+import random
+import threading
+import agentlightning as agl
+
+# Trace emission defaults (override per tracer or via the environment)
+DEFAULT_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+DEFAULT_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+DEFAULT_HEAD_ROWS = int(os.getenv("TRACE_HEAD_ROWS", "5"))
+DEFAULT_MAX_TEXT = int(os.getenv("TRACE_MAX_TEXT", "2000"))
+
+def summarize_payload(value, head_rows=DEFAULT_HEAD_ROWS, max_text=DEFAULT_MAX_TEXT):
+    """
+    Bounded copy of a trace payload: lists longer than `head_rows` become
+    {"row_count", "columns" (for row dicts), "head"}, long strings are cut to
+    `max_text` characters; dicts are summarized recursively.
+    """
+    if isinstance(value, dict):
+        return {key: summarize_payload(item, head_rows, max_text) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) <= head_rows:
+            return [summarize_payload(item, head_rows, max_text) for item in value]
+        summary = {"row_count": len(value)}
+        if isinstance(value[0], dict):
+            summary["columns"] = list(value[0])
+        summary["head"] = [summarize_payload(item, head_rows, max_text) for item in value[:head_rows]]
+        return summary
+    if isinstance(value, str) and len(value) > max_text:
+        return value[:max_text] + f"... [{len(value) - max_text} chars truncated]"
+    return value
+
+class Trace:
+    """Events of one request; all of them are kept or dropped together by the sampling decision."""
+    __slots__ = ("tracer", "sampled")
+
+    def __init__(self, tracer, sampled):
+        self.tracer = tracer
+        self.sampled = sampled
+
+    def message(self, text):
+        if self.sampled:
+            self.tracer._enqueue("message", text)
+
+    def object(self, payload):
+        if self.sampled:
+            self.tracer._enqueue("object", payload)
+
+    def exception(self, error):
+        # Errors are traced even for unsampled requests (unless the tracer is off)
+        if self.sampled or self.tracer.always_trace_errors:
+            self.tracer._enqueue("exception", error)
+
+class Tracer:
+    """
+    Non-blocking adapter in front of agentlightning's emit_* calls:
+    - start() makes the per-request sampling decision (`sample_rate`)
+    - payloads are summarized on the caller's thread (see summarize_payload),
+      so the buffer never holds full result sets
+    - a bounded buffer is drained by one daemon thread; when it is full the
+      event is dropped and counted instead of blocking the request
+    Counters are updated from every request thread and the emitter, under a lock.
+    """
+    def __init__(self, backend=None, sample_rate=None, buffer_size=None, head_rows=None, max_text=None, always_trace_errors=True):
+        self.backend = backend or agl
+        self.sample_rate = DEFAULT_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.head_rows = head_rows or DEFAULT_HEAD_ROWS
+        self.max_text = max_text or DEFAULT_MAX_TEXT
+        self.always_trace_errors = always_trace_errors and self.sample_rate > 0
+        self.counters = {"emitted": 0, "dropped": 0, "failed": 0, "sampled_out": 0}
+        self._lock = threading.Lock()
+        self._buffer = queue.Queue(maxsize=buffer_size or DEFAULT_BUFFER_SIZE)
+        self._worker = threading.Thread(target=self._drain, name="trace-emitter", daemon=True)
+        self._worker.start()
+
+    def start(self):
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        if not sampled:
+            self._count("sampled_out")
+        return Trace(self, sampled)
+
+    def _enqueue(self, kind, payload):
+        if kind == "object":
+            payload = summarize_payload(payload, self.head_rows, self.max_text)
+        elif kind == "message":
+            payload = summarize_payload(str(payload), self.head_rows, self.max_text)
+        try:
+            self._buffer.put_nowait((kind, payload))
+        except queue.Full:
+            self._count("dropped")
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _drain(self):
+        while True:
+            kind, payload = self._buffer.get()
+            try:
+                if kind == "message":
+                    self.backend.emit_message(payload)
+                elif kind == "object":
+                    self.backend.emit_object(payload)
+                else:
+                    self.backend.emit_exception(payload)
+                self._count("emitted")
+            except Exception:
+                self._count("failed") # Tracing is optional; never surfaces
+            finally:
+                self._buffer.task_done()
+
+    def flush(self):
+        """Blocks until every buffered event was handed to the backend."""
+        self._buffer.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["buffered"] = self._buffer.qsize()
+        return stats
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+def get_tracer():
+    """Process-wide Tracer (one emitter thread shared by every agent)."""
+    global _TRACER
+    with _TRACER_LOCK:
+        if _TRACER is None:
+            _TRACER = Tracer()
+        return _TRACER
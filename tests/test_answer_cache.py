@@ -0,0 +1,56 @@
+import numpy as np
+from src.llm.answer_cache import AnswerCache, normalize_question, question_literals
+
+class BagOfWordsEmbedder:
+    """Deterministic embedding: word counts over a fixed vocabulary (records what it embedded)."""
+    VOCABULARY = ["top", "customers", "best", "clients", "show", "orders", "spain", "france"]
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.extend(texts)
+        vectors = []
+        for text_value in texts:
+            words = text_value.lower().replace("?", "").split()
+            vectors.append(np.array([words.count(word) + 0.01 for word in self.VOCABULARY], dtype=np.float32))
+        return vectors
+
+def test_normalize_question():
+    assert normalize_question("  How many   Users?? ") == "how many users"
+
+def test_question_literals():
+    assert question_literals("Top 5 customers in 'Spain' since 2023.5") == ("5", "'spain'", "2023.5")
+
+def test_exact_hit_and_version_invalidation():
+    cache = AnswerCache()
+    cache.put("How many users?", "v1", "SELECT COUNT(*) FROM users")
+    assert cache.get("how many users", "v1") == "SELECT COUNT(*) FROM users"
+    assert cache.get("how many users", "v2") is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_embeds_the_raw_question_retrieval_uses():
+    embedder = BagOfWordsEmbedder()
+    cache = AnswerCache(embed_fn=embedder)
+    cache.get("Show top customers?", "v1")
+    assert embedder.calls == ["Show top customers?"]
+
+def test_semantic_hit_requires_equal_literals():
+    cache = AnswerCache(embed_fn=BagOfWordsEmbedder(), similarity_threshold=0.9)
+    cache.put("show top 5 customers", "v1", "SELECT * FROM customers LIMIT 5")
+    assert cache.get("top 5 customers show", "v1") == "SELECT * FROM customers LIMIT 5"
+    assert cache.get("show top 10 customers", "v1") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_quoted_literals_must_match():
+    cache = AnswerCache(embed_fn=BagOfWordsEmbedder(), similarity_threshold=0.9)
+    cache.put("show orders 'spain'", "v1", "SELECT * FROM orders WHERE country = 'Spain'")
+    assert cache.get("show orders 'france'", "v1") is None
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    for i, question in enumerate(["a", "b", "c"]):
+        cache.put(question, "v1", f"SELECT {i}")
+    assert cache.get("a", "v1") is None
+    assert cache.get("c", "v1") == "SELECT 2"
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,64 @@
+import pytest
+from src.components.auditor import AutoAuditor, StaticAuditor
+
+class CatalogStore:
+    catalog_version = "v1"
+    table_columns = {"users": {"id", "name", "country"}, "orders": {"id", "user_id", "amount"}}
+    graph_hints = {"orders": ["JOIN HINT: Table 'orders' joins with 'users' on orders.user_id = users.id (Verify exact PK)"]}
+
+class CountingJudge:
+    def __init__(self, verdict="Verdict: PASS"):
+        self.verdict = verdict
+        self.calls = 0
+
+    def generate(self, prompt, **kwargs):
+        self.calls += 1
+        return self.verdict
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT nme FROM users", "unknown column 'nme'"),
+    ("SELECT name FROM customers", "unknown table 'customers'"),
+    ("SELECT u.name FROM orders o JOIN users u ON o.id = u.id", "does not follow the foreign key"),
+    ("SELECT country, COUNT(*) FROM users", "neither aggregated nor grouped"),
+])
+def test_static_checks_fail_fast(sql, reason):
+    score, message = StaticAuditor(CatalogStore(), "sqlite").check("question", sql, [{"a": 1}])
+    assert score == 0 and reason in message
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM users",
+    "SELECT u.name, SUM(o.amount) FROM orders o JOIN users u ON o.user_id = u.id GROUP BY u.name",
+    "WITH t AS (SELECT * FROM users) SELECT name FROM t",
+])
+def test_valid_schema_is_left_to_the_judge(sql):
+    assert StaticAuditor(CatalogStore(), "sqlite").check("How many users?", sql, [{"a": 1}]) is None
+
+def test_aggregate_shape_checks():
+    auditor = StaticAuditor(CatalogStore(), "sqlite")
+    assert auditor.check("q", "SELECT SUM(amount) FROM orders", [{"s": None}])[0] == 0
+    assert auditor.check("q", "SELECT COUNT(*) FROM users", [{"c": 1}, {"c": 2}])[0] == 0
+
+def test_without_catalog_nothing_is_decided():
+    assert StaticAuditor(None).check("q", "SELECT nme FROM users", []) is None
+
+def test_only_the_judge_passes_and_verdicts_are_cached():
+    judge = CountingJudge()
+    auditor = AutoAuditor(llm=judge, store=CatalogStore(), dialect="sqlite")
+    assert auditor.audit("How many users?", "SELECT COUNT(*) FROM users", [{"c": 3}]) == (1, "Verdict: PASS")
+    assert auditor.audit("how many users", "select count(*)  from users", [{"c": 3}]) == (1, "Verdict: PASS")
+    assert judge.calls == 1
+    assert auditor.audit("list users", "SELECT nme FROM users", [{"x": 1}])[0] == 0
+    assert judge.calls == 1
+
+def test_audit_batch_judges_each_distinct_case_once():
+    judge = CountingJudge()
+    auditor = AutoAuditor(llm=judge, store=CatalogStore(), dialect="sqlite")
+    items = [
+        {"query": "all users", "sql": "SELECT * FROM users"},
+        {"query": "All users?", "sql": "SELECT *  FROM users"},
+        {"query": "bad", "sql": "SELECT nme FROM users"},
+        {"query": "names", "sql": "SELECT name FROM users", "results": [{"name": "a"}]},
+    ]
+    verdicts = auditor.audit_batch(items, concurrency=2)
+    assert [score for score, _ in verdicts] == [1, 1, 0, 1]
+    assert judge.calls == 2
@@ -0,0 +1,74 @@
+import random
+import numpy as np
+from src.semantic_catalog.bm25 import IncrementalBM25
+
+WORDS = ["users", "orders", "amount", "country", "created", "status", "product", "price", "city", "email"]
+QUERIES = ["users country", "orders amount amount", "price of product", "status email city", "unknown words"]
+
+def random_docs(rng, n):
+    return {f"doc{i}": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12))) for i in range(n)}
+
+def fresh(docs):
+    index = IncrementalBM25()
+    index.add_many(list(docs), list(docs.values()))
+    return index
+
+def assert_same_scores(index, reference):
+    assert sorted(index.doc_ids()) == sorted(reference.doc_ids())
+    for query in QUERIES:
+        got = dict(index.top_k(query, 1000))
+        expected = dict(reference.top_k(query, 1000))
+        assert got.keys() == expected.keys(), query
+        assert np.allclose([got[d] for d in expected], list(expected.values())), query
+
+def test_incremental_updates_match_rebuild():
+    rng = random.Random(3)
+    docs = random_docs(rng, 60)
+    index = fresh(docs)
+    index.top_k("users", 5) # Compacts, so later mutations go through the dirty path
+    for doc_id in rng.sample(sorted(docs), 15):
+        index.remove(doc_id)
+        del docs[doc_id]
+    for doc_id in rng.sample(sorted(docs), 10):
+        docs[doc_id] = " ".join(rng.choice(WORDS) for _ in range(5))
+        index.add(doc_id, docs[doc_id]) # Replaces
+    for i in range(60, 70):
+        docs[f"doc{i}"] = "orders price " * (i % 3 + 1)
+        index.add(f"doc{i}", docs[f"doc{i}"])
+    index.remove("missing") # No-op
+    assert len(index) == len(docs)
+    assert_same_scores(index, fresh(docs))
+
+def test_save_load_then_mutate_matches_rebuild(tmp_path):
+    rng = random.Random(5)
+    docs = random_docs(rng, 40)
+    fresh(docs).save(str(tmp_path), "v1")
+
+    loaded = IncrementalBM25.load(str(tmp_path), "v1")
+    assert_same_scores(loaded, fresh(docs))
+
+    for doc_id in ["doc1", "doc7", "doc20"]:
+        loaded.remove(doc_id)
+        del docs[doc_id]
+    docs["doc3"] = "email email city"
+    loaded.add("doc3", docs["doc3"])
+    docs["new"] = "users orders country"
+    loaded.add("new", docs["new"])
+    assert_same_scores(loaded, fresh(docs))
+
+    # A snapshot of the mutated (partly memory-mapped) index round-trips too
+    loaded.save(str(tmp_path), "v2")
+    assert_same_scores(IncrementalBM25.load(str(tmp_path)), fresh(docs))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["CURRENT", "v2"]
+
+def test_load_rejects_other_stamp_or_missing(tmp_path):
+    assert IncrementalBM25.load(str(tmp_path)) is None
+    fresh({"a": "users"}).save(str(tmp_path), "v1")
+    assert IncrementalBM25.load(str(tmp_path), "v2") is None
+
+def test_top_k_order_and_edge_cases():
+    index = fresh({"a": "users users", "b": "users orders", "c": "price"}) # Same length, a has tf 2
+    assert [doc_id for doc_id, _ in index.top_k("users", 2)] == ["a", "b"]
+    assert index.top_k("users", 0) == []
+    assert index.top_k("nothing here", 3) == []
+    assert IncrementalBM25().top_k("users", 3) == []
@@ -0,0 +1,62 @@
+import sqlite3
+import time
+import pytest
+from sqlalchemy import event
+from src.semantic_catalog.column_stats import HyperLogLog, compute_table_stats
+from src.utils.db_connect import get_engine, get_schema_details
+
+@pytest.fixture
+def db_url(tmp_path):
+    path = tmp_path / "data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, grp TEXT, payload BLOB)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?)", [(i, f"g{i % 40}" if i % 10 else None, b"x") for i in range(5000)])
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+@pytest.fixture
+def statements(db_url):
+    seen = []
+    engine = get_engine(db_url)
+    listener = lambda conn, cursor, statement, *args: seen.append(statement.upper())
+    event.listen(engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(engine, "before_cursor_execute", listener)
+
+def table_columns(db_url):
+    return get_schema_details(db_url)["t"]["columns"]
+
+def test_distinct_counts_come_from_the_sketch_not_count_distinct(db_url, statements):
+    stats = compute_table_stats(db_url, "t", table_columns(db_url))
+    assert not any("DISTINCT" in statement for statement in statements)
+    # hash() of strings is seeded per process, so the sketch may merge a pair of values
+    assert abs(stats["grp"]["distinct"] - 36) <= 2 and not stats["grp"]["distinct_partial"]
+    assert abs(stats["id"]["distinct"] - 5000) < 5000 * 0.05
+    assert stats["grp"]["null_fraction"] == pytest.approx(0.1)
+    assert stats["id"]["min"] == 0 and stats["id"]["max"] == 4999
+
+def test_scan_limit_marks_estimates_partial(db_url):
+    stats = compute_table_stats(db_url, "t", table_columns(db_url), scan_limit=1000, chunk_size=100)
+    assert stats["id"]["distinct_partial"] and stats["id"]["scanned_rows"] == 1000
+    assert stats["id"]["row_count"] == 5000 # From the pushed-down aggregate
+
+def test_expired_deadline_runs_no_scan(db_url, statements):
+    columns = table_columns(db_url)
+    statements.clear()
+    assert compute_table_stats(db_url, "t", columns, deadline=time.monotonic() - 1) == {}
+    assert statements == []
+
+def test_governor_stops_the_stream(db_url, monkeypatch):
+    # The aggregate finishes; the stream spends its whole budget on the execute
+    from src.semantic_catalog import column_stats
+    original = column_stats.iter_table_column_chunks
+    monkeypatch.setattr(column_stats, "iter_table_column_chunks", lambda *args, **kwargs: original(*args, **{**kwargs, "timeout": 1e-9}))
+    stats = compute_table_stats(db_url, "t", table_columns(db_url), chunk_size=100)
+    assert stats["id"]["distinct"] is None and stats["id"]["row_count"] == 5000
+    assert get_engine(db_url).pool.checkedout() == 0
+
+def test_hyperloglog_accuracy():
+    sketch = HyperLogLog()
+    sketch.add(list(range(100000)))
+    assert abs(sketch.count() - 100000) < 100000 * 0.05
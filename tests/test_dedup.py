@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from src.utils.dedup import MinHasher, NearDuplicateIndex, shingles
+
+def words(n, prefix="w"):
+    return [f"{prefix}{i}" for i in range(n)]
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+def test_shingles():
+    assert shingles("SELECT  a FROM t") == {"select a from", "a from t"}
+    assert shingles("Two words") == {"two words"}
+
+@pytest.mark.parametrize("overlap", [100, 90, 70, 50, 20, 0])
+def test_signature_agreement_estimates_jaccard(overlap):
+    a = set(words(100))
+    b = set(words(overlap)) | set(words(100 - overlap, prefix="x"))
+    hasher = MinHasher(num_perm=512)
+    estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+    assert abs(estimate - jaccard(a, b)) < 0.08, (estimate, jaccard(a, b))
+
+def test_threshold_separates_near_from_far_duplicates():
+    base = words(100)
+    index = NearDuplicateIndex(threshold=0.85)
+    assert index.add("base", " ".join(base)) is None
+    assert index.add("exact", " ".join(base)) == "base"
+    assert index.add("reformatted", "  ".join(base).upper()) == "base"
+    assert index.add("one_word_changed", " ".join(base[:-1] + ["other"])) == "base" # Jaccard ~0.97
+    assert index.add("third_changed", " ".join(base[:70] + words(30, prefix="x"))) is None # Jaccard ~0.55
+    assert index.add("unrelated", " ".join(words(100, prefix="y"))) is None
+    assert len(index) == 3
+
+def test_higher_threshold_is_stricter():
+    base = words(40)
+    edited = base[:35] + words(5, prefix="x") # Jaccard ~0.8 over 3-word shingles
+    loose, strict = NearDuplicateIndex(threshold=0.5), NearDuplicateIndex(threshold=0.95)
+    for index in (loose, strict):
+        index.add("base", " ".join(base))
+    assert loose.add("edited", " ".join(edited)) == "base"
+    assert strict.add("edited", " ".join(edited)) is None
+
+def test_items_restore_round_trip():
+    index = NearDuplicateIndex()
+    for i in range(5):
+        index.add(i, f"SELECT col{i} FROM table{i} WHERE id = {i}")
+    ids, matrix = index.items()
+    assert ids == list(range(5)) and matrix.shape == (5, 64) and matrix.dtype == np.uint64
+
+    restored = NearDuplicateIndex()
+    restored.restore(ids, matrix)
+    assert restored.add("again", "SELECT col3 FROM table3 WHERE id = 3") == 3
+    assert NearDuplicateIndex().items()[1].shape == (0, 64)
+
+def test_signatures_are_stable_across_processes():
+    code = "from src.utils.dedup import MinHasher, shingles; print(MinHasher().signature(shingles('select a from t where b = 1')).tolist())"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True, env={**os.environ, "PYTHONHASHSEED": seed}).stdout
+        for seed in ("1", "2")
+    }
+    assert outputs == {f"{MinHasher().signature(shingles('select a from t where b = 1')).tolist()}\n"}
+
+def test_bands_must_divide_num_perm():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=64, bands=10)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+pytest.importorskip("sentence_transformers") # Imported by the embeddings module
+from src.semantic_catalog.embeddings import EmbeddingBackend, QueryEmbeddingCache
+
+class LengthBackend(EmbeddingBackend):
+    name = "length"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+def test_incomplete_backend_fails_on_creation():
+    class Incomplete(EmbeddingBackend):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_backend_is_callable_and_cached():
+    backend = LengthBackend()
+    assert backend(["ab", "c"]).tolist() == [[2.0, 1.0], [1.0, 1.0]]
+    cache = QueryEmbeddingCache(backend)
+    cache(["abc"])
+    cache(["abc"])
+    assert backend.calls == 2 # One direct call, one cache miss
@@ -0,0 +1,54 @@
+import pytest
+pytest.importorskip("sentence_transformers") # Imported by the semantic store module
+pytest.importorskip("agentlightning") # Imported by the tracer
+from src.components.executor import SQLAgent
+from src.llm.answer_cache import AnswerCache
+from src.utils.feedback_log import FeedbackLog
+
+class CatalogStore:
+    """Stands in for SemanticStore; counts catalog loads."""
+    def __init__(self):
+        self.catalog_version = "v1"
+        self.table_loads = 0
+
+    def embed_queries(self, texts):
+        raise AssertionError("not embedded in these tests")
+
+    @property
+    def table_names(self):
+        self.table_loads += 1
+        return ["orders", "users"]
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    store = CatalogStore()
+    log = FeedbackLog(str(tmp_path / "log"), durability="os")
+    agent = SQLAgent(db_url=None, store=store, answer_cache=AnswerCache(max_entries=0), feedback_log=log)
+    warmed = []
+    monkeypatch.setattr(agent.llm, "warm_prefix", warmed.append)
+    monkeypatch.setattr(agent.llm, "is_mock", False)
+    yield agent, store, warmed
+    log.close()
+
+def test_construction_does_not_load_the_catalog(tmp_path):
+    store = CatalogStore()
+    log = FeedbackLog(str(tmp_path / "log"), durability="os")
+    SQLAgent(db_url=None, store=store, feedback_log=log)
+    assert store.table_loads == 0
+    log.close()
+
+def test_prefix_is_warmed_once_per_catalog_version(agent):
+    agent, store, warmed = agent
+    agent._warm_prompt_prefix(store.catalog_version)
+    agent._warm_prompt_prefix(store.catalog_version)
+    assert len(warmed) == 1 and "users" in warmed[0]
+    store.catalog_version = "v2"
+    agent._warm_prompt_prefix(store.catalog_version)
+    assert len(warmed) == 2
+
+def test_mock_llm_is_never_warmed(agent):
+    agent, store, warmed = agent
+    agent.llm.is_mock = True
+    agent._warm_prompt_prefix(store.catalog_version)
+    assert warmed == [] and store.table_loads == 0
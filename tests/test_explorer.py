@@ -0,0 +1,66 @@
+import sqlite3
+import pytest
+pytest.importorskip("sentence_transformers") # Imported by the semantic store module
+from src.components.explorer import SchemaDiscovery
+
+class RecordingStore:
+    """Stands in for SemanticStore: records what discovery writes and deletes."""
+    def __init__(self, persist_path):
+        self.persist_path = str(persist_path)
+        self.tables = set()
+        self.graph_hints = {}
+        self.deleted = []
+        self.publishes = 0
+
+    def delete_tables(self, tables, publish=True):
+        self.deleted.append(sorted(tables))
+        self.tables -= set(tables)
+        for table_name in tables:
+            self.graph_hints.pop(table_name, None)
+
+    def add_schema_metadata(self, metadata_list, publish=True):
+        self.tables |= {item["metadata"]["table"] for item in metadata_list}
+
+    def add_graph_hints(self, hints_dict, publish=True):
+        self.graph_hints.update(hints_dict)
+
+    def publish_catalog_change(self):
+        self.publishes += 1
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id))")
+    conn.execute("INSERT INTO users VALUES (1, 'a')")
+    conn.commit()
+    conn.close()
+    return path
+
+def discovery(tmp_path):
+    return SchemaDiscovery(max_workers=2, store=RecordingStore(tmp_path))
+
+def test_unchanged_tables_are_skipped(tmp_path, database):
+    db_url = f"sqlite:///{database}"
+    discovery(tmp_path).run(db_url)
+    rerun = discovery(tmp_path)
+    rerun.run(db_url)
+    assert rerun.store.deleted == [] and rerun.store.publishes == 0
+
+def test_forced_run_removes_dropped_tables(tmp_path, database):
+    db_url = f"sqlite:///{database}"
+    first = discovery(tmp_path)
+    first.run(db_url)
+    assert first.store.tables == {"users", "orders"} and "orders" in first.store.graph_hints
+
+    conn = sqlite3.connect(database)
+    conn.execute("DROP TABLE orders")
+    conn.close()
+
+    forced = discovery(tmp_path)
+    forced.store.tables, forced.store.graph_hints = set(first.store.tables), dict(first.store.graph_hints)
+    forced.run(db_url, force=True)
+    assert forced.store.deleted == [["orders", "users"]] # Dropped and (forced) re-profiled
+    assert forced.store.tables == {"users"} and "orders" not in forced.store.graph_hints
+    assert forced._load_fingerprints(db_url).keys() == {"users"}
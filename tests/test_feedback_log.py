@@ -0,0 +1,115 @@
+import json
+import os
+import pytest
+from src.utils.feedback_log import FeedbackLog
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / "log")
+
+def open_log(log_dir, **kwargs):
+    return FeedbackLog(log_dir, durability="os", **kwargs)
+
+def read_all(log, name="reader"):
+    return log.consumer(name).poll(10000)
+
+def active_segment(log):
+    return log.segments()[-1]
+
+def test_offsets_are_global_across_instances(log_dir):
+    first, second = open_log(log_dir), open_log(log_dir) # Two writers (e.g. two processes)
+    offsets = [first.append({"n": 0}, wait=True), second.append({"n": 1}, wait=True), first.append({"n": 2}, wait=True)]
+    assert offsets == [0, 1, 2]
+    assert [record["n"] for record in read_all(first)] == [0, 1, 2]
+    first.close()
+    second.close()
+
+def test_rotation_and_ordered_reads(log_dir):
+    log = open_log(log_dir, segment_bytes=64)
+    for i in range(20):
+        log.append({"n": i})
+        log.flush()
+    assert len(log.segments()) > 1
+    assert [record["offset"] for record in read_all(log)] == list(range(20))
+    log.close()
+
+def test_consumer_resumes_from_commit(log_dir):
+    log = open_log(log_dir)
+    for i in range(5):
+        log.append({"n": i})
+    log.flush()
+    consumer = log.consumer("c")
+    assert len(consumer.poll(3)) == 3
+    consumer.commit()
+    consumer.poll(1) # Read but not committed: redelivered after a restart
+    restarted = log.consumer("c")
+    assert [record["offset"] for record in restarted.poll(10)] == [3, 4]
+    assert restarted.lag() == 0
+    assert log.committed_offsets() == {"c": 3}
+    log.close()
+
+def test_torn_write_is_truncated(log_dir):
+    log = open_log(log_dir)
+    log.append({"n": 0}, wait=True)
+    with open(active_segment(log), "ab") as f:
+        f.write(b'{"n": 1, "off') # Writer crashed mid-line
+    assert log.append({"n": 2}, wait=True) == 1
+    assert [record["n"] for record in read_all(log)] == [0, 2]
+    assert log.counters["recovered"] == 1
+    log.close()
+
+def test_head_lagging_a_complete_write_is_recovered(log_dir):
+    log = open_log(log_dir)
+    log.append({"n": 0}, wait=True)
+    with open(active_segment(log), "ab") as f:
+        f.write((json.dumps({"n": 1, "offset": 1}) + "\n").encode()) # Crashed before the HEAD update
+    assert log.append({"n": 2}, wait=True) == 2
+    assert [record["offset"] for record in read_all(log)] == [0, 1, 2]
+    log.close()
+
+def test_missing_head_is_rebuilt_from_segments(log_dir):
+    log = open_log(log_dir)
+    for i in range(3):
+        log.append({"n": i})
+    log.flush()
+    os.remove(os.path.join(log_dir, "HEAD"))
+    assert log.next_offset() == 3
+    log.close()
+
+def test_compaction(log_dir):
+    log = open_log(log_dir, segment_bytes=64)
+    for i in range(12):
+        log.append({"key": i % 3, "n": i})
+        log.flush()
+    consumer = log.consumer("c")
+    consumer.poll(6)
+    consumer.commit()
+
+    stats = log.compact(key_fn=lambda record: record["key"], drop_consumed=True)
+    assert stats["removed_segments"] > 0 and stats["removed_records"] > 0
+    remaining = read_all(log)
+    assert remaining[0]["offset"] > 0 # Consumed segments are gone
+    # Sealed segments keep only the latest record per key; offsets are not renumbered
+    assert [record["offset"] for record in remaining] == sorted(record["offset"] for record in remaining)
+    assert {record["key"]: record["n"] for record in remaining} == {0: 9, 1: 10, 2: 11}
+    log.close()
+
+def test_cancelled_append_does_not_stop_the_writer(log_dir):
+    log = open_log(log_dir, linger_seconds=0.2)
+    cancelled = log.append({"n": 0})
+    assert cancelled.cancel() # Still lingering in the batch
+    assert log.append({"n": 1}).result(timeout=5) == 1
+    assert log.append({"n": 2}).result(timeout=5) == 2 # Writer thread still alive
+    assert [record["n"] for record in read_all(log)] == [0, 1, 2]
+    log.close()
+
+def test_wait_for_data_and_validation(log_dir):
+    log = open_log(log_dir)
+    assert not log.wait_for_data(0, timeout=0.05)
+    log.append({"n": 0}, wait=True)
+    assert log.wait_for_data(0, timeout=0.05)
+    log.close()
+    with pytest.raises(RuntimeError):
+        log.append({"n": 1})
+    with pytest.raises(ValueError):
+        FeedbackLog(log_dir, durability="sometimes")
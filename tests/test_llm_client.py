@@ -0,0 +1,40 @@
+import pytest
+from benchmarks.mock_ollama import MockOllamaHandler, start_mock_server
+from src.llm.client import PRIORITY_AUDIT, PRIORITY_EXPLANATION, PRIORITY_GENERATION, LLMClient
+
+@pytest.fixture
+def client():
+    server, base_url = start_mock_server(latency=0.1, tokens_per_sec=10000)
+    yield LLMClient(host=base_url, max_concurrency=1)
+    server.shutdown()
+
+def served(futures):
+    for future in futures:
+        future.result(timeout=10)
+    return list(MockOllamaHandler.prompts)
+
+def test_queue_is_served_by_priority(client):
+    futures = [client.submit("mock", "blocker", PRIORITY_GENERATION)] # Holds the only slot
+    futures += [
+        client.submit("mock", "audit", PRIORITY_AUDIT),
+        client.submit("mock", "explanation", PRIORITY_EXPLANATION),
+        client.submit("mock", "generation", PRIORITY_GENERATION),
+    ]
+    assert served(futures) == ["blocker", "generation", "explanation", "audit"]
+
+def test_identical_prompts_are_coalesced_and_promoted(client):
+    futures = [client.submit("mock", "blocker", PRIORITY_GENERATION)]
+    futures.append(client.submit("mock", "audit", PRIORITY_AUDIT))
+    shared_audit = client.submit("mock", "shared", PRIORITY_AUDIT)
+    shared_generation = client.submit("mock", "shared", PRIORITY_GENERATION) # Joins the queued audit request
+    futures += [shared_audit, shared_generation, client.submit("mock", "generation", PRIORITY_GENERATION)]
+
+    # One request for both callers, admitted as generation (queued before "generation")
+    assert served(futures) == ["blocker", "shared", "generation", "audit"]
+    assert shared_audit.result()["response"] == shared_generation.result()["response"]
+    stats = client.stats()["priorities"]
+    assert stats["generation"]["coalesced"] == 1 and stats["audit"]["coalesced"] == 0
+
+def test_streaming_over_http(client):
+    text = "".join(chunk["response"] for chunk in client.generate_stream("mock", "stream me"))
+    assert text.startswith("```sql\nSELECT id, name FROM users")
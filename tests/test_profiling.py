@@ -0,0 +1,120 @@
+import random
+import numpy as np
+import pytest
+from benchmarks.profiling import reference_infer_semantic_type, reference_profile_column, synthetic_columns
+from src.semantic_catalog.profiling import infer_semantic_type, profile_column, profile_table
+
+EDGE_CASES = [
+    ["1", "2", "3.5", ".5", "7."],
+    ["1.2.3", "4"],
+    [".", "1"],
+    ["", "1"],
+    [""],
+    ["1 ", "2"],
+    ["2023-01-01", "2023-02-03 10:00:00"],
+    ["01/02/2023", "12/31/1999"],
+    ["2023-1-01"],
+    ["2023-01-01", "01/02/2023", "x"],
+    ["US", "ES", "GB"],
+    ["ABCDEF"],
+    ["AB1", "A_B"],
+    ["Ab"],
+    ["123", "US"],
+    ["TRUE", "False", "yes", "T"],
+    ["0", "1"],
+    [0, 1, True],
+    [0, 1, 2],
+    [1.0, 0.0],
+    [1, "2", 3.5],
+    [1, "x"],
+    ["é", "ü"],
+    ["١٢٣", "٤٥"],
+    ["line\nbreak", "x"],
+    ["12\n34"],
+    [None, None],
+    [None, "1", None, "2"],
+    [b"bytes", b"x"],
+]
+
+@pytest.mark.parametrize("values", EDGE_CASES)
+def test_types_match_reference(values):
+    assert infer_semantic_type(values) == reference_infer_semantic_type(values)
+
+def test_random_strings_match_reference():
+    rng = random.Random(7)
+    alphabet = "0123456789./-ABCabc xZ"
+    for _ in range(2000):
+        values = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for _ in range(rng.randint(1, 100))]
+        assert infer_semantic_type(values) == reference_infer_semantic_type(values), values
+
+def test_probe_does_not_decide_a_matching_prefix():
+    # First 64 values look numeric, a later one is not
+    values = [str(i) for i in range(200)] + ["12a"]
+    assert infer_semantic_type(values) == reference_infer_semantic_type(values) == "text"
+
+@pytest.mark.parametrize("name", list(synthetic_columns(10)))
+def test_profile_table_matches_reference_profile_column(name):
+    values = synthetic_columns(5000)[name]
+    profile = profile_table({name: values})[name]
+    reference = reference_profile_column(values)
+    assert profile["inferred_type"] == reference["inferred_type"]
+    assert profile["cardinality"] == reference["cardinality"]
+    assert set(profile["sample_values"]) <= set(values)
+    assert len(profile["sample_values"]) == min(5, len(set(values)))
+
+def test_sample_values_keep_first_seen_order():
+    assert profile_column(["b", "a", "b", None, "c"])["sample_values"] == ["b", "a", "c"]
+
+def test_nulls_do_not_count_towards_cardinality():
+    profile = profile_column([None] * 90 + [str(i) for i in range(10)])
+    assert profile["cardinality"] == "high"
+    assert profile_column([None, None])["inferred_type"] == "empty"
+
+def test_numpy_input():
+    assert profile_column(np.array([0, 1, 1, 0]))["inferred_type"] == "boolean"
+    assert profile_column(np.array([1.5, 2.0]))["inferred_type"] == "numeric"
+
+def arrow_or_none(values):
+    pa = pytest.importorskip("pyarrow")
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        return None # Mixed types have no Arrow column
+
+@pytest.mark.parametrize("values", EDGE_CASES)
+def test_arrow_columns_match_reference(values):
+    array = arrow_or_none(values)
+    if array is None:
+        pytest.skip("not representable in Arrow")
+    profile = profile_column(array)
+    reference = reference_profile_column(values)
+    assert profile["inferred_type"] == reference["inferred_type"]
+    assert profile == profile_column(values) # Same cardinality and first-seen samples as the list path
+
+def test_arrow_random_strings_match_reference():
+    pa = pytest.importorskip("pyarrow")
+    rng = random.Random(11)
+    alphabet = "0123456789./-ABCabc xZ"
+    for _ in range(1000):
+        values = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for _ in range(rng.randint(1, 100))]
+        assert profile_column(pa.array(values))["inferred_type"] == reference_infer_semantic_type(values), values
+
+def test_arrow_layouts():
+    pa = pytest.importorskip("pyarrow")
+    dates = ["2023-01-01", "2023-01-02", None, "2023-01-03"]
+    assert profile_column(pa.array(dates, type=pa.large_string()))["inferred_type"] == "date"
+    assert profile_column(pa.chunked_array([dates[:2], dates[2:]]))["sample_values"] == ["2023-01-01", "2023-01-02", "2023-01-03"]
+    # A sliced array starts mid-buffer; contiguous values must not read into their neighbours
+    sliced = pa.array(["x", "2023", "-01-01", "US"]).slice(1, 2)
+    assert profile_column(sliced)["inferred_type"] == reference_infer_semantic_type(["2023", "-01-01"])
+    table = pa.table({"n": [1, 0, 1], "s": ["US", "ES", None]})
+    assert {name: p["inferred_type"] for name, p in profile_table(table).items()} == {"n": "boolean", "s": "code"}
+
+@pytest.mark.parametrize("name", list(synthetic_columns(10)))
+def test_columnar_inputs_match_list_path(name):
+    pa = pytest.importorskip("pyarrow")
+    values = synthetic_columns(2000)[name]
+    expected = profile_column(values)
+    assert profile_column(pa.array(values)) == expected
+    if isinstance(values[0], (int, float)):
+        assert profile_column(np.array(values)) == expected
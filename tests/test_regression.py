@@ -0,0 +1,46 @@
+import sqlite3
+import pytest
+from src.components import regression
+from src.components.regression import _execute_case, _init_worker, compare_results
+
+@pytest.fixture
+def worker_db(tmp_path, monkeypatch):
+    path = tmp_path / "data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER, grp TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i, "even" if i % 2 == 0 else "odd") for i in range(50)])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(regression, "MAX_COMPARED_ROWS", 10)
+    monkeypatch.setattr(regression, "FETCH_BATCH_ROWS", 7)
+    _init_worker(str(path))
+
+def test_full_result_is_counted_and_digested(worker_db):
+    result = _execute_case("SELECT id FROM t")
+    assert result["row_count"] == 50 and result["truncated"]
+    assert len(result["rows"]) == 10
+    assert _execute_case("SELECT id FROM t ORDER BY id DESC")["digest"] == result["digest"]
+
+def test_truncated_results_differing_after_the_kept_rows_fail(worker_db):
+    reference = _execute_case("SELECT id FROM t")
+    # Same first rows (and count), different rows beyond MAX_COMPARED_ROWS
+    candidate = _execute_case("SELECT CASE WHEN id < 40 THEN id ELSE id + 100 END FROM t")
+    assert candidate["rows"] == reference["rows"]
+    passed, reason, diff = compare_results(candidate, reference)
+    assert not passed and "digest" in reason
+    assert diff == {"expected_rows": 50, "actual_rows": 50}
+
+def test_truncated_results_in_another_order_pass(worker_db):
+    reference = _execute_case("SELECT id, grp FROM t")
+    candidate = _execute_case("SELECT id, grp FROM t ORDER BY grp, id DESC")
+    assert compare_results(candidate, reference)[0]
+
+def test_small_results_keep_the_row_diff(worker_db):
+    reference = _execute_case("SELECT id FROM t WHERE id < 3")
+    candidate = _execute_case("SELECT id FROM t WHERE id < 4")
+    passed, _, diff = compare_results(candidate, reference)
+    assert not passed and diff["extra"] == [[3]]
+
+def test_errors_fail(worker_db):
+    candidate = _execute_case("SELECT missing FROM t")
+    assert candidate["error"] and not compare_results(candidate, _execute_case("SELECT id FROM t"))[0]
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from src.utils.result_cache import ResultCache
+from src.utils.results import ColumnChunk
+
+def test_hit_arrays_are_read_only():
+    cache = ResultCache(max_bytes=1 << 20)
+    chunk = ColumnChunk.from_rows(["id", "name"], [(1, "a"), (2, "b")])
+    cache.put(("db", 1, "fp"), chunk)
+    hit = cache.get(("db", 1, "fp"))
+    assert hit is chunk # Shared, not copied
+    with pytest.raises(ValueError):
+        hit.arrays["id"][0] = 99
+    assert cache.get(("db", 1, "fp")).to_records() == [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    assert np.array(hit.arrays["id"]).flags.writeable # Copies are the caller's to modify
+
+def test_spilled_hit_is_read_only(tmp_path):
+    first = ColumnChunk.from_rows(["x"], [(i,) for i in range(100)])
+    cache = ResultCache(max_bytes=first.nbytes, spill_dir=str(tmp_path))
+    cache.put("first", first)
+    cache.put("second", ColumnChunk.from_rows(["x"], [(i,) for i in range(100)])) # Spills "first"
+    hit = cache.get("first")
+    assert cache.counters["spill_hits"] == 1
+    assert not hit.arrays["x"].flags.writeable
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from src.utils.governor import QueryLimitExceeded
+from src.utils.results import ColumnChunk, StreamingResult
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'data.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER, name TEXT, score REAL)"))
+        conn.execute(text("INSERT INTO t VALUES (:id, :name, :score)"), [{"id": i, "name": f"n{i}", "score": i / 2} for i in range(25)])
+    yield engine
+    engine.dispose()
+
+def stream(engine, sql="SELECT * FROM t ORDER BY id", **kwargs):
+    return StreamingResult(engine.connect(), sql, **kwargs)
+
+def test_pages_until_exhausted(engine):
+    result = stream(engine, page_size=10)
+    sizes = [len(chunk) for chunk in result.pages()]
+    assert sizes == [10, 10, 5]
+    assert result.rows_fetched == 25 and not result.truncated
+    assert result.closed and engine.pool.checkedout() == 0 # Connection returned
+
+def test_max_rows_truncates(engine):
+    result = stream(engine, page_size=10, max_rows=12)
+    chunks = list(result.pages())
+    assert [len(chunk) for chunk in chunks] == [10, 2]
+    assert chunks[-1].to_records()[-1]["id"] == 11
+    assert result.truncated and result.truncation_reason == "max_rows"
+    assert engine.pool.checkedout() == 0
+
+def test_budget_exactly_met_is_not_truncation(engine):
+    result = stream(engine, page_size=10, max_rows=25)
+    assert sum(map(len, result.pages())) == 25
+    assert not result.truncated
+
+def test_max_bytes_truncates(engine):
+    result = stream(engine, page_size=5, max_bytes=1)
+    assert [len(chunk) for chunk in result.pages()] == [5]
+    assert result.truncation_reason == "max_bytes"
+
+def test_page_stops_at_max_bytes(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO t VALUES (:id, :name, :score)"), [{"id": i, "name": f"n{i}", "score": i / 2} for i in range(25, 2000)])
+    row_bytes = ColumnChunk.from_rows(["id", "name", "score"], [(1, "n1", 0.5)]).nbytes
+    result = stream(engine, page_size=1000, max_bytes=200 * row_bytes)
+    chunks = list(result.pages())
+    assert len(chunks) == 1 and 64 <= len(chunks[0]) < 1000 # Sized from the probe, not a full page
+    assert result.bytes_fetched <= 1.1 * result.max_bytes
+    assert result.truncation_reason == "max_bytes"
+    assert engine.pool.checkedout() == 0
+
+def test_governor_stops_before_first_row(engine):
+    runaway = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+    with pytest.raises(QueryLimitExceeded) as info:
+        list(stream(engine, runaway, max_vm_steps=100000).pages())
+    assert info.value.limit == "vm_steps"
+    assert engine.pool.checkedout() == 0
+
+def test_non_query_closes_immediately(engine):
+    result = stream(engine, "UPDATE t SET score = 0 WHERE id < 0")
+    assert result.closed and result.columns == [] and result.next_page() is None
+
+def test_column_chunk_dtypes_and_records():
+    chunk = ColumnChunk.from_rows(["i", "f", "b", "s", "big"], [(1, 1.5, True, "a", 2**70), (2, 2, False, None, 1)])
+    assert chunk.arrays["i"].dtype == np.int64
+    assert chunk.arrays["f"].dtype == np.float64
+    assert chunk.arrays["b"].dtype == bool
+    assert chunk.arrays["s"].dtype == object and chunk.arrays["big"].dtype == object
+    assert chunk.to_records(limit=1) == [{"i": 1, "f": 1.5, "b": True, "s": "a", "big": 2**70}]
+    assert len(ColumnChunk.from_rows(["x"], [])) == 0
+
+def test_column_chunk_to_arrow():
+    table = ColumnChunk.from_rows(["i", "s"], [(1, "a"), (2, None)]).to_arrow()
+    assert table.to_pydict() == {"i": [1, 2], "s": ["a", None]}
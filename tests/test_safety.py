@@ -0,0 +1,75 @@
+import sqlite3
+import pytest
+from src.utils.safety import PLAN_CACHE, UNSAFE_COST, analyze_statement, canonical_fingerprint, estimate_query_cost, is_safe, statement_fingerprint
+
+@pytest.fixture
+def db_url(tmp_path):
+    path = tmp_path / "data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, updated_at TEXT)")
+    conn.close()
+    PLAN_CACHE.clear()
+    return f"sqlite:///{path}"
+
+@pytest.mark.parametrize("sql, kind", [
+    ("DELETE FROM users", "write"),
+    ("UPDATE users SET name = 'x'", "write"),
+    ("INSERT INTO users (name) VALUES ('x')", "write"),
+    ("DROP TABLE users", "write"),
+    ("CREATE TABLE t AS SELECT * FROM users", "write"),
+    ("ATTACH DATABASE 'other.db' AS other", "write"),
+    ("PRAGMA writable_schema = 1", "write"),
+    ("PRAGMA table_info(users)", "write"),
+    ("WITH d AS (DELETE FROM users RETURNING id) SELECT * FROM d", "write"),
+    ("SELECT * INTO backup FROM users", "write"),
+    ("SELECT 1; DELETE FROM users", "multiple"),
+    ("SELECT 1; SELECT 2", "multiple"),
+])
+def test_blocks_non_queries(sql, kind):
+    analysis = analyze_statement(sql, "sqlite")
+    assert not analysis["safe"] and analysis["kind"] == kind, analysis
+
+@pytest.mark.parametrize("sql", [
+    "SELECT load_extension('/tmp/evil.so')",
+    "SELECT name FROM users WHERE id IN (SELECT LOAD_EXTENSION('x'))",
+])
+def test_blocks_forbidden_functions(sql):
+    analysis = analyze_statement(sql, "sqlite")
+    assert not analysis["safe"] and "LOAD_EXTENSION" in analysis["reason"]
+
+@pytest.mark.parametrize("sql", [
+    "SELECT updated_at, name FROM users WHERE name LIKE '%drop%'",
+    "SELECT 1; -- trailing comment",
+    "WITH t AS (SELECT id FROM users) SELECT COUNT(*) FROM t",
+    "SELECT id FROM users UNION SELECT 2",
+])
+def test_allows_read_only_queries(sql):
+    assert analyze_statement(sql, "sqlite")["safe"]
+
+def test_unparsed_sql_is_rejected():
+    analysis = analyze_statement("SELECT FROM WHERE (((", "sqlite")
+    assert analysis["kind"] == "unparsed" and not analysis["safe"] # Fail closed
+    assert analyze_statement("DELETE users WHERE ((( ", "sqlite")["reason"] == "Forbidden keyword DELETE"
+
+def test_cached_analysis_is_read_only():
+    analysis = analyze_statement("SELECT name FROM users", "sqlite")
+    with pytest.raises(TypeError):
+        analysis["safe"] = False
+    assert analyze_statement("SELECT name FROM users", "sqlite")["tables"] == ("users",)
+
+def test_fingerprints():
+    assert statement_fingerprint("SELECT * FROM users WHERE id = 5") == statement_fingerprint("select *  from users where id = 7")
+    assert statement_fingerprint("SELECT * FROM users LIMIT 5") != statement_fingerprint("SELECT * FROM users LIMIT 500")
+    assert canonical_fingerprint("SELECT * FROM users WHERE id = 5") != canonical_fingerprint("SELECT * FROM users WHERE id = 7")
+    assert statement_fingerprint("not sql (((") is None
+
+def test_is_safe_on_sqlite(db_url):
+    assert is_safe("SELECT name FROM users WHERE id = 1", db_url)
+    assert not is_safe("DELETE FROM users", db_url)
+    assert estimate_query_cost("PRAGMA table_info(users)", db_url) == UNSAFE_COST
+
+def test_cost_verdicts_are_cached_per_shape(db_url):
+    hits = PLAN_CACHE.hits
+    estimate_query_cost("SELECT name FROM users WHERE id = 1", db_url, catalog_version="v1")
+    estimate_query_cost("SELECT name FROM users WHERE id = 2", db_url, catalog_version="v1")
+    assert PLAN_CACHE.hits == hits + 1
@@ -0,0 +1,52 @@
+import threading
+import pytest
+
+pytest.importorskip("agentlightning")
+from src.utils.tracing import Tracer
+
+class RecordingBackend:
+    def __init__(self):
+        self.events = []
+
+    def emit_message(self, payload):
+        self.events.append(("message", payload))
+
+    def emit_object(self, payload):
+        self.events.append(("object", payload))
+
+    def emit_exception(self, payload):
+        raise RuntimeError("backend down")
+
+def test_counters_are_exact_across_threads():
+    backend = RecordingBackend()
+    tracer = Tracer(backend=backend, sample_rate=0.5, buffer_size=100000)
+    def work():
+        for i in range(2000):
+            trace = tracer.start()
+            trace.message(f"event {i}")
+            trace.exception(ValueError("boom")) # Traced even when sampled out
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracer.flush()
+    stats = tracer.stats()
+    sampled = 8 * 2000 - stats["sampled_out"]
+    assert stats["emitted"] == len(backend.events) == sampled
+    assert stats["failed"] == 8 * 2000 and stats["dropped"] == 0 and stats["buffered"] == 0
+
+def test_full_buffer_drops_events():
+    release = threading.Event()
+    class BlockedBackend(RecordingBackend):
+        def emit_message(self, payload):
+            release.wait(5)
+            super().emit_message(payload)
+    tracer = Tracer(backend=BlockedBackend(), buffer_size=2)
+    trace = tracer.start()
+    for i in range(5):
+        trace.message(f"event {i}") # First one is taken by the emitter, two are buffered
+    assert tracer.stats()["dropped"] >= 2
+    release.set()
+    tracer.flush()
+    assert tracer.stats()["emitted"] + tracer.stats()["dropped"] == 5
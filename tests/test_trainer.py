@@ -0,0 +1,95 @@
+import json
+from src.components.trainer import SelfImprover
+from src.utils.feedback_log import FeedbackLog
+
+def make_trainer(tmp_path, log, **kwargs):
+    kwargs.setdefault("checkpoint_seconds", 0) # Checkpoint on every drain
+    return SelfImprover(feedback_log=log, dataset_path=str(tmp_path / "sft.jsonl"), dpo_path=str(tmp_path / "dpo.jsonl"), batch_size=2, **kwargs)
+
+def exported(tmp_path, name="sft.jsonl"):
+    path = tmp_path / name
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+def append_all(log, records):
+    for record in records:
+        log.append(record)
+        log.flush() # One batch per record, so small segments rotate
+
+def drain(trainer):
+    while trainer.poll_once()[0]:
+        pass
+    trainer.poll_once() # Drained: checkpoints
+
+def test_exports_dedup_and_pairs(tmp_path):
+    log = FeedbackLog(str(tmp_path / "log"), durability="os", segment_bytes=256)
+    append_all(log, [
+        {"query": "How many users?", "sql": "SELECT COUNT(*) FROM users", "rating": 1},
+        {"query": "how many users", "sql": "select count(*)   from users", "rating": 1}, # Same after normalization
+        {"query": "How many users?", "sql": "SELECT COUNT(id) FROM users", "rating": 0},
+    ])
+    trainer = make_trainer(tmp_path, log)
+    drain(trainer)
+    assert len(exported(tmp_path)) == 1
+    assert exported(tmp_path, "dpo.jsonl") == [{
+        "prompt": "Generate SQL for: How many users?", "chosen": "SELECT COUNT(*) FROM users", "rejected": "SELECT COUNT(id) FROM users",
+    }]
+    log.close()
+
+def test_restart_loads_state_without_replay(tmp_path, monkeypatch):
+    log = FeedbackLog(str(tmp_path / "log"), durability="os", segment_bytes=256)
+    append_all(log, [{"query": f"question {i}", "sql": f"SELECT {i} FROM t", "rating": 1} for i in range(6)])
+    trainer = make_trainer(tmp_path, log)
+    drain(trainer)
+    assert len(exported(tmp_path)) == 6
+    assert trainer.consumer.committed == 6
+
+    # Every consumer is past the old segments: compaction drops them
+    assert log.compact(drop_consumed=True)["removed_segments"] > 0
+
+    restarted = make_trainer(tmp_path, log)
+    ingested = []
+    original_ingest = restarted.ingest
+    monkeypatch.setattr(restarted, "ingest", lambda records, export=True: ingested.append(len(records)) or original_ingest(records, export))
+    restarted.warm_start()
+    assert ingested == [] # Loaded, not replayed
+    assert len(restarted._seen) == 6
+
+    # Already exported examples (exact and near duplicates) are not accepted again
+    append_all(log, [
+        {"query": "question 3", "sql": "SELECT 3 FROM t", "rating": 1},
+        {"query": "question 7", "sql": "SELECT 7 FROM t", "rating": 1},
+    ])
+    drain(restarted)
+    assert [record["output"] for record in exported(tmp_path)][6:] == ["SELECT 7 FROM t"]
+    log.close()
+
+def test_state_ahead_of_commit_is_authoritative(tmp_path):
+    log = FeedbackLog(str(tmp_path / "log"), durability="os")
+    append_all(log, [{"query": f"q{i}", "sql": f"SELECT {i}", "rating": 1} for i in range(3)])
+    trainer = make_trainer(tmp_path, log)
+    trainer.warm_start()
+    trainer.ingest(trainer.consumer.poll(10))
+    trainer._save_state(trainer.consumer.position) # Crash before commit()
+
+    restarted = make_trainer(tmp_path, log)
+    restarted.warm_start()
+    assert restarted.consumer.committed == 3
+    assert restarted.poll_once() == (0, 0)
+    assert len(exported(tmp_path)) == 3
+    log.close()
+
+def test_trickle_checkpoints_are_throttled(tmp_path, monkeypatch):
+    log = FeedbackLog(str(tmp_path / "log"), durability="os")
+    trainer = make_trainer(tmp_path, log, checkpoint_seconds=3600, checkpoint_batches=3)
+    saves = []
+    original_save = trainer._save_state
+    monkeypatch.setattr(trainer, "_save_state", lambda offset: saves.append(offset) or original_save(offset))
+    for i in range(2):
+        append_all(log, [{"query": f"q{i}", "sql": f"SELECT {i}", "rating": 1}])
+        drain(trainer)
+    assert saves == [] and trainer.consumer.committed == 0 # Drained, but checkpointed recently
+
+    append_all(log, [{"query": "q2", "sql": "SELECT 2", "rating": 1}])
+    drain(trainer)
+    assert saves == [3] and trainer.consumer.committed == 3 # Batch count still forces one
+    log.close()